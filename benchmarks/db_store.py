@@ -0,0 +1,77 @@
+"""
+Measures how long DBStorage.store() takes to write a history of bars to a local SQLite file.
+
+Compares the bulk INSERT ... ON CONFLICT DO UPDATE path with the per-row ORM merge
+that DBStorage used before, both for a fresh history and for rewriting bars that are
+already stored.
+
+Usage: python -m benchmarks.db_store --bars 20000 --batch-size 1000
+"""
+
+import argparse
+import datetime as dt
+import os
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from harvest.storage.database_storage import DBStorage
+from harvest.util.helper import debugger
+
+
+class MergeDBStorage(DBStorage):
+    """
+    Writes every row with a separate ORM merge, like DBStorage used to.
+    """
+
+    def _upsert(self, rows: List[dict]) -> None:
+        self._merge(rows)
+
+
+def history(symbol: str, bars: int) -> pd.DataFrame:
+    start = dt.datetime(2024, 1, 2, 14, 30, tzinfo=dt.timezone.utc)
+    index = pd.date_range(start, periods=bars, freq="1min", name="timestamp")
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.random((bars, 5)), columns=["open", "high", "low", "close", "volume"], index=index)
+    df.columns = pd.MultiIndex.from_product([[symbol], df.columns])
+    return df
+
+
+def run(cls: type, bars: int, batch_size: int) -> None:
+    data = history("SPY", bars)
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = cls(f"sqlite:///{os.path.join(tmp, 'bench.db')}", batch_size=batch_size)
+
+        t0 = time.perf_counter()
+        storage.store("SPY", "1MIN", data)
+        insert = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        storage.store("SPY", "1MIN", data)
+        update = time.perf_counter() - t0
+
+        storage.engine.dispose()
+
+    print(
+        f"{cls.__name__:>14}: "
+        f"insert {insert:>8.2f} s ({bars / insert:>9.0f} bars/s)   "
+        f"update {update:>8.2f} s ({bars / update:>9.0f} bars/s)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bars", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    debugger.setLevel("ERROR")
+    for cls in (MergeDBStorage, DBStorage):
+        run(cls, args.bars, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
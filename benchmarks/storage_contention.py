@@ -0,0 +1,119 @@
+"""
+Measures lock contention in BaseStorage.
+
+N reader threads repeatedly call load() on random symbols while the main thread
+plays the role of BrokerHub.main(), storing one new bar per symbol each tick and
+aggregating it. The benchmark reports reader throughput and writer tick latency,
+with the per-series locks and with a single global lock for comparison.
+
+Usage: python -m benchmarks.storage_contention --readers 8 --symbols 500 --ticks 200
+"""
+
+import argparse
+import datetime as dt
+import random
+import threading
+import time
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from harvest.enum import Interval
+from harvest.storage import BaseStorage
+from harvest.util.helper import debugger
+
+
+class GlobalLockStorage(BaseStorage):
+    """
+    Serializes every store, load and aggregate on one lock, like BaseStorage used to.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.global_lock = Lock()
+
+    def store(self, *args, **kwargs) -> None:
+        with self.global_lock:
+            super().store(*args, **kwargs)
+
+    def load(self, *args, **kwargs) -> pd.DataFrame:
+        with self.global_lock:
+            return super().load(*args, **kwargs)
+
+    def aggregate(self, *args, **kwargs) -> None:
+        with self.global_lock:
+            super().aggregate(*args, **kwargs)
+
+
+def bar(symbol: str, timestamp: dt.datetime) -> pd.DataFrame:
+    df = pd.DataFrame(
+        {"open": [1.0], "high": [2.0], "low": [0.5], "close": [1.5], "volume": [100.0]},
+        index=[timestamp],
+    )
+    df.columns = pd.MultiIndex.from_product([[symbol], df.columns])
+    return df
+
+
+def run(storage: BaseStorage, readers: int, symbols: int, ticks: int, history: int) -> None:
+    names = [f"S{i}" for i in range(symbols)]
+    start = dt.datetime(2024, 1, 2, 14, 30, tzinfo=dt.timezone.utc)
+    for name in names:
+        for i in range(history):
+            storage.store(name, Interval.MIN_1, bar(name, start + dt.timedelta(minutes=i)))
+        storage.aggregate(name, Interval.MIN_1, Interval.MIN_5)
+
+    stop = threading.Event()
+    reads = [0] * readers
+
+    def reader(n: int) -> None:
+        rng = random.Random(n)
+        while not stop.is_set():
+            storage.load(rng.choice(names), Interval.MIN_1)
+            reads[n] += 1
+
+    threads = [threading.Thread(target=reader, args=(n,), daemon=True) for n in range(readers)]
+    for t in threads:
+        t.start()
+
+    latencies = []
+    begin = time.perf_counter()
+    for tick in range(ticks):
+        timestamp = start + dt.timedelta(minutes=history + tick)
+        t0 = time.perf_counter()
+        for name in names:
+            storage.store(name, Interval.MIN_1, bar(name, timestamp))
+        for name in names:
+            storage.aggregate(name, Interval.MIN_1, Interval.MIN_5)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - begin
+
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies = np.array(latencies) * 1000
+    print(
+        f"{type(storage).__name__:>18}: "
+        f"reads/s {sum(reads) / elapsed:>10.0f}   "
+        f"tick p50 {np.percentile(latencies, 50):>8.1f} ms   "
+        f"tick p99 {np.percentile(latencies, 99):>8.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--ticks", type=int, default=50)
+    parser.add_argument("--history", type=int, default=200)
+    parser.add_argument("--columnar", action="store_true", help="use the columnar price store")
+    args = parser.parse_args()
+
+    debugger.setLevel("ERROR")
+    for cls in (GlobalLockStorage, BaseStorage):
+        run(cls(columnar=args.columnar), args.readers, args.symbols, args.ticks, args.history)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import datetime as dt
 import math
 from datetime import timezone
 from typing import List, Tuple
@@ -313,7 +314,7 @@ class BaseAlgo:
             interval = interval_string_to_enum(interval)
 
         if prices is None:
-            prices = self.func.load(symbol, interval)[symbol][ref]
+            prices = self.func.load(symbol, interval, fields=ref, as_numpy=True)
 
         return symbol, interval, ref, prices
 
@@ -511,7 +512,7 @@ class BaseAlgo:
         if symbol is None:
             symbol = self.watchlist[0]
         if symbol_type(symbol) != "OPTION":
-            return self.func.load(symbol, self.interval)[symbol]["close"][-1]
+            return self.func.load(symbol, self.interval, fields="close", as_numpy=True)[-1]
 
         for p in self.positions.option:
             if p.symbol == symbol:
@@ -535,7 +536,7 @@ class BaseAlgo:
         else:
             interval = interval_string_to_enum(interval)
         if symbol_type(symbol) != "OPTION":
-            return list(self.func.load(symbol, interval)[symbol][ref])
+            return list(self.func.load(symbol, interval, fields=ref, as_numpy=True))
         debugger.warning("Price list not available for options")
         return None
 
@@ -590,6 +591,36 @@ class BaseAlgo:
         df = self.func.load(symbol, interval)[symbol]
         return pandas_timestamp_to_local(df, self.stats.timezone)
 
+    def get_panel(
+        self,
+        symbols: List[str] = None,
+        interval: str = None,
+        ref: str = "close",
+        start: dt.datetime = None,
+        end: dt.datetime = None,
+    ) -> pd.DataFrame:
+        """Returns the prices of several assets, aligned on a shared index.
+
+        This function is not compatible with options.
+
+        :param list? symbols:   Symbols of stock or crypto assets. defaults to the watchlist
+        :param str? interval:   Interval of data. defaults to the interval of the algorithm
+        :param str? ref:        'close', 'open', 'high', 'low', or 'volume'. defaults to 'close'
+        :param datetime? start: Earliest time to include. defaults to the oldest stored data
+        :param datetime? end:   Latest time to include. defaults to the newest stored data
+        :returns: A dataframe with one column per symbol, and NaN where an asset has no data.
+
+        The index is a datetime object
+        """
+        if symbols is None:
+            symbols = self.watchlist
+        if interval is None:
+            interval = self.interval
+        else:
+            interval = interval_string_to_enum(interval)
+        df = self.func.load_panel(symbols, interval, ref, start, end)
+        return pandas_timestamp_to_local(df, self.stats.timezone)
+
     def get_asset_profit_percent(self, symbol=None) -> float:
         """Returns the return of a specified asset.
 
@@ -2,6 +2,7 @@ import datetime as dt
 import inspect
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from os.path import exists
 from typing import Any, Callable, Dict, List, Tuple, Union
 
@@ -33,6 +34,8 @@ class Broker:
     Attributes
     :interval_list: A list of intervals that the broker supports.
     :exchange: The market the API trades on. Ignored if the API cannot place orders.
+    :max_concurrency: The maximum number of requests to make to the API at the same time.
+    :rate_limit: The maximum number of requests per second the API allows, or None if it has no limit.
     """
 
     # List of supported intervals
@@ -48,6 +51,9 @@ class Broker:
     exchange = ""
     # List of attributes that are required to be in the secret file, e.g. 'api_key'
     req_keys = []
+    # Limits of the requests made by BrokerHub when it fetches the price history of the watchlist
+    max_concurrency = 4
+    rate_limit = None
 
     def __init__(self, path: str = None) -> None:
         """
@@ -326,6 +332,57 @@ class Broker:
         price = self.fetch_price_history(symbol, interval, start, end)
         return price[symbol]["close"][-1]
 
+    def fetch_latest_prices(self, symbols: List[str]) -> Dict[str, float]:
+        """
+        Fetches the latest price of several assets.
+
+        The prices are fetched concurrently with fetch_latest_price(), up to max_concurrency
+        at a time. Brokers with an endpoint that quotes several symbols should override this
+        to fetch them in a single request.
+
+        :param symbols: The stocks/cryptos to get prices for. Note options are not supported.
+        :returns: A dictionary mapping each symbol to its latest price. Symbols whose price
+            could not be fetched are left out.
+        """
+        return self._fetch_concurrently(self.fetch_latest_price, symbols, "the latest price of")
+
+    def fetch_option_quotes(self, occ_symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Retrieves the market data of several options.
+
+        The quotes are fetched concurrently with fetch_option_market_data(), up to
+        max_concurrency at a time. Brokers with an endpoint that quotes several options
+        should override this to fetch them in a single request.
+
+        :param occ_symbols: OCC symbols of the options.
+        :returns: A dictionary mapping each OCC symbol to its market data, in the format of
+            fetch_option_market_data(). Options whose data could not be fetched are left out.
+        """
+        return self._fetch_concurrently(self.fetch_option_market_data, occ_symbols, "the market data of")
+
+    def _fetch_concurrently(self, fetch: Callable, keys: List[Any], what: str) -> Dict[Any, Any]:
+        """
+        Calls fetch for each key on a thread pool of up to max_concurrency threads.
+
+        :fetch: A function that takes a key and returns its value.
+        :keys: The keys to fetch. Duplicates are fetched once.
+        :what: A description of the values, used in the log of failed fetches.
+        :returns: A dictionary mapping each key to its value. Keys whose fetch raised an
+            exception are logged and left out.
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(min(self.max_concurrency, len(keys)), 1)) as pool:
+            futures = {key: pool.submit(fetch, key) for key in keys}
+        results = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                debugger.error(f"Failed to fetch {what} {key}: {e}")
+        return results
+
     def fetch_chain_info(self, symbol: str) -> Dict[str, Any]:
         """
         Returns information about the symbol's options
@@ -509,6 +566,33 @@ class Broker:
             f"{type(self).__name__} class does not support the method {inspect.currentframe().f_code.co_name}."
         )
 
+    def fetch_order_statuses(self, order_ids: Dict[Any, str]) -> Dict[Any, Dict[str, Any]]:
+        """
+        Returns the status of several orders.
+
+        The statuses are fetched concurrently, up to max_concurrency at a time. Brokers with
+        an endpoint that lists orders should override this to fetch them in a single request.
+
+        :order_ids: A dictionary mapping the ID of each order to its type, 'STOCK', 'OPTION' or 'CRYPTO'.
+
+        :returns: A dictionary mapping the ID of each order to its status, in the format of
+            fetch_stock_order_status(). Orders whose status could not be fetched are left out.
+        """
+        return self._fetch_concurrently(
+            lambda order_id: self._fetch_order_status(order_id, order_ids[order_id]),
+            list(order_ids),
+            "the status of order",
+        )
+
+    def _fetch_order_status(self, order_id: Any, order_type: str) -> Dict[str, Any]:
+        if order_type == "STOCK":
+            return self.fetch_stock_order_status(order_id)
+        elif order_type == "OPTION":
+            return self.fetch_option_order_status(order_id)
+        elif order_type == "CRYPTO":
+            return self.fetch_crypto_order_status(order_id)
+        raise ValueError(f"Invalid order type {order_type}")
+
     def fetch_order_queue(self) -> List[Dict[str, Any]]:
         """
         Returns all current pending orders
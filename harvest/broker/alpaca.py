@@ -30,6 +30,7 @@ class AlpacaBroker(StreamBroker):
         Interval.MIN_1,
     ]
     req_keys = ["alpaca_api_key", "alpaca_secret_key"]
+    max_concurrency = 8
 
     def __init__(
         self,
@@ -50,6 +51,9 @@ class AlpacaBroker(StreamBroker):
             raise Exception(f"Account credentials not found! Expected file path: {path}")
 
         self.basic = is_basic_account
+        if self.basic:
+            # The free plan allows 200 requests per minute.
+            self.rate_limit = 200 / 60
 
         endpoint = "https://paper-api.alpaca.markets" if paper_trader else "https://api.alpaca.markets"
         self.api = REST(self.config["alpaca_api_key"], self.config["alpaca_secret_key"], endpoint)
@@ -122,6 +126,17 @@ class AlpacaBroker(StreamBroker):
 
         return self._get_data_from_alpaca(symbol, interval, start, end)
 
+    @Broker._exception_handler
+    def fetch_latest_prices(self, symbols: List[str]) -> Dict[str, float]:
+        stocks = [s for s in symbols if not is_crypto(s)]
+        cryptos = [s for s in symbols if is_crypto(s)]
+        # Cryptos are quoted by the fallback, which fetches them one at a time.
+        prices = super().fetch_latest_prices(cryptos) if cryptos else {}
+        if stocks:
+            trades = self.api.get_latest_trades(stocks, feed="iex" if self.basic else "sip")
+            prices.update({symbol: float(trade.price) for symbol, trade in trades.items()})
+        return prices
+
     @Broker._exception_handler
     def fetch_chain_info(self, symbol: str) -> None:
         raise NotImplementedError("Alpaca does not support options.")
@@ -134,6 +149,10 @@ class AlpacaBroker(StreamBroker):
     def fetch_option_market_data(self, occ_symbol: str) -> None:
         raise NotImplementedError("Alpaca does not support options.")
 
+    @Broker._exception_handler
+    def fetch_option_quotes(self, occ_symbols: List[str]) -> None:
+        raise NotImplementedError("Alpaca does not support options.")
+
     @Broker._exception_handler
     def fetch_market_hours(self, date: dt.datetime.date) -> Dict[str, Any]:
         ret = self.api.get_clock().__dict__["_raw"]
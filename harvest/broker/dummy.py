@@ -33,6 +33,9 @@ class DummyDataBroker(Broker):
         Interval.HR_1,
         Interval.DAY_1,
     ]
+    # History is generated from a shared random state, so it is fetched one series at a time
+    # to keep it reproducible.
+    max_concurrency = 1
 
     def __init__(
         self,
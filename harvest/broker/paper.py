@@ -181,7 +181,8 @@ class PaperBroker(Broker):
         debugger.debug(f"Backtest: {self.backtest}")
 
         if self.backtest:
-            price = self.storage.load(sym, self.stats.watchlist_cfg[sym]["interval"])[sym]["close"][-1]
+            interval = self.stats.watchlist_cfg[sym]["interval"]
+            price = self.storage.load(sym, interval, fields="close", as_numpy=True)[-1]
         else:
             price = self.data_broker_ref.fetch_price_history(
                 sym,
@@ -342,6 +343,11 @@ class PaperBroker(Broker):
     def fetch_crypto_order_status(self, order_id: int) -> Dict[str, Any]:
         return self.fetch_stock_order_status(order_id)
 
+    def fetch_order_statuses(self, order_ids: Dict[Any, str]) -> Dict[Any, Dict[str, Any]]:
+        # Fetching a status fills the order against the simulated account, so orders are
+        # processed one at a time, in the order they were placed.
+        return {order_id: self._fetch_order_status(order_id, order_type) for order_id, order_type in order_ids.items()}
+
     def fetch_order_queue(self) -> List[Dict[str, Any]]:
         return self.orders
 
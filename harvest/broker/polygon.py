@@ -1,7 +1,7 @@
 import datetime
 import datetime as dt
 import re
-from typing import Any, Dict, Union
+from typing import Any, Dict, List, Union
 from zoneinfo import ZoneInfo
 
 import pandas as pd
@@ -22,6 +22,9 @@ from harvest.util.helper import (
 class PolygonBroker(Broker):
     interval_list = [Interval.MIN_1, Interval.MIN_5, Interval.HR_1, Interval.DAY_1]
     req_keys = ["polygon_api_key"]
+    max_concurrency = 8
+    # The maximum number of tickers in a request to the snapshot endpoint.
+    snapshot_size = 250
 
     def __init__(self, path: str = None, is_basic_account: bool = False) -> None:
         super().__init__(path)
@@ -31,6 +34,10 @@ class PolygonBroker(Broker):
 
         self.basic = is_basic_account
         self.option_cache = {}
+        if self.basic:
+            # The free plan allows 5 requests per minute.
+            self.max_concurrency = 1
+            self.rate_limit = 5 / 60
 
     def step(self) -> None:
         df_dict = {}
@@ -155,6 +162,56 @@ class PolygonBroker(Broker):
             "bid": response["last_quote"]["bid"],
         }
 
+    @Broker._exception_handler
+    def fetch_latest_prices(self, symbols: List[str]) -> Dict[str, float]:
+        if self.basic:
+            # Basic accounts do not have access to snapshots.
+            return super().fetch_latest_prices(symbols)
+        tickers = {"X:" + s[1:] + "USD" if is_crypto(s) else s: s for s in symbols}
+        prices = {}
+        for ticker, snapshot in self._fetch_snapshots(list(tickers)).items():
+            price = snapshot.get("last_trade", {}).get("price") or snapshot.get("session", {}).get("close")
+            if price is not None:
+                prices[tickers[ticker]] = float(price)
+        return prices
+
+    @Broker._exception_handler
+    def fetch_option_quotes(self, occ_symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        if self.basic:
+            raise Exception("Basic accounts do not have access to options.")
+        tickers = {"O:" + s.replace(" ", ""): s for s in occ_symbols}
+        quotes = {}
+        for ticker, snapshot in self._fetch_snapshots(list(tickers)).items():
+            quotes[tickers[ticker]] = {
+                "price": snapshot["session"]["close"],
+                "ask": snapshot["last_quote"]["ask"],
+                "bid": snapshot["last_quote"]["bid"],
+            }
+        return quotes
+
+    def _fetch_snapshots(self, tickers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetches the snapshots of stocks, options and cryptos from the universal snapshot
+        endpoint, with one request per snapshot_size tickers.
+
+        :tickers: Polygon tickers, such as AAPL, O:AAPL240614C00100000 or X:BTCUSD.
+        :returns: A dictionary mapping each ticker to its snapshot. Tickers that were not found are left out.
+        """
+        key = self.config["polygon_api_key"]
+        snapshots = {}
+        for i in range(0, len(tickers), self.snapshot_size):
+            names = ",".join(tickers[i : i + self.snapshot_size])
+            request = f"https://api.polygon.io/v3/snapshot?ticker.any_of={names}&limit={self.snapshot_size}&apiKey={key}"
+            response = self._handle_request_response(request)
+            if response is None:
+                raise Exception(f"Failed to fetch the snapshots of {names}.")
+            for snapshot in response:
+                if "error" in snapshot:
+                    debugger.error(f"Failed to fetch the snapshot of {snapshot['ticker']}: {snapshot['error']}")
+                    continue
+                snapshots[snapshot["ticker"]] = snapshot
+        return snapshots
+
     @Broker._exception_handler
     def fetch_market_hours(self, date: datetime.date) -> Dict[str, Any]:
         # Polygon does not support getting market hours,
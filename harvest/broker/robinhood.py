@@ -33,6 +33,8 @@ class RobinhoodBroker(Broker):
     interval_list = [Interval.SEC_15, Interval.MIN_5, Interval.HR_1, Interval.DAY_1]
     exchange = "NASDAQ"
     req_keys = ["robin_username", "robin_password", "robin_mfa"]
+    # The API is unofficial, so it is not sent many requests at once.
+    max_concurrency = 2
 
     def __init__(self, path=None):
         super().__init__(path)
@@ -168,6 +170,19 @@ class RobinhoodBroker(Broker):
 
         return df
 
+    @Broker._exception_handler
+    def fetch_latest_prices(self, symbols: List[str]):
+        stocks = [s for s in symbols if not is_crypto(s)]
+        cryptos = [s for s in symbols if is_crypto(s)]
+        # robin_stocks has no bulk quote for cryptos, so they are quoted by the fallback.
+        prices = super().fetch_latest_prices(cryptos) if cryptos else {}
+        if stocks:
+            for quote in rh.get_quotes(stocks):
+                price = quote.get("last_extended_hours_trade_price") or quote.get("last_trade_price")
+                if price is not None:
+                    prices[quote["symbol"]] = float(price)
+        return prices
+
     @Broker._exception_handler
     def fetch_chain_info(self, symbol: str):
         ret = rh.get_chains(symbol)
@@ -333,7 +348,47 @@ class RobinhoodBroker(Broker):
 
     @Broker._exception_handler
     def fetch_stock_order_status(self, id):
-        ret = rh.get_stock_order_info(id)
+        return self._stock_order_status(rh.get_stock_order_info(id))
+
+    @Broker._exception_handler
+    def fetch_option_order_status(self, id):
+        return self._option_order_status(rh.get_option_order_info(id))
+
+    @Broker._exception_handler
+    def fetch_crypto_order_status(self, id):
+        return self._crypto_order_status(rh.get_crypto_order_info(id))
+
+    @Broker._exception_handler
+    def fetch_order_statuses(self, order_ids):
+        """
+        Returns the status of several orders. The open orders of each type are fetched in
+        a single request, and only orders that are no longer open, because they were filled
+        or cancelled, are fetched one at a time.
+        """
+        open_orders = {"STOCK": {}, "OPTION": {}, "CRYPTO": {}}
+        types = set(order_ids.values())
+        if "STOCK" in types:
+            open_orders["STOCK"] = {r["id"]: r for r in rh.get_all_open_stock_orders()}
+        if "OPTION" in types:
+            open_orders["OPTION"] = {r["id"]: r for r in rh.get_all_open_option_orders()}
+        if "CRYPTO" in types:
+            open_orders["CRYPTO"] = {r["id"]: r for r in rh.get_all_open_crypto_orders()}
+
+        parse = {
+            "STOCK": self._stock_order_status,
+            "OPTION": self._option_order_status,
+            "CRYPTO": self._crypto_order_status,
+        }
+        statuses = {}
+        for order_id, order_type in order_ids.items():
+            ret = open_orders[order_type].get(order_id)
+            if ret is None:
+                statuses[order_id] = self._fetch_order_status(order_id, order_type)
+            else:
+                statuses[order_id] = parse[order_type](ret)
+        return statuses
+
+    def _stock_order_status(self, ret):
         # Check if any of the orders were executed
         executions = ret["executions"]
         if len(executions) > 0:
@@ -346,18 +401,16 @@ class RobinhoodBroker(Broker):
         return {
             "type": "STOCK",
             "order_id": ret["id"],
-            "quantity": ret["qty"],
-            "filled_quantity": ret["filled_qty"],
+            "quantity": ret["quantity"],
+            "filled_quantity": ret["cumulative_quantity"],
             "side": ret["side"],
             "time_in_force": ret["time_in_force"],
-            "status": ret["status"],
+            "status": ret["state"],
             "filled_time": filled_time,
             "filled_price": filled_price,
         }
 
-    @Broker._exception_handler
-    def fetch_option_order_status(self, id):
-        ret = rh.get_option_order_info(id)
+    def _option_order_status(self, ret):
         debugger.debug(ret)
         # Check if any of the orders were executed
         executions = ret["legs"][0]["executions"]
@@ -380,9 +433,7 @@ class RobinhoodBroker(Broker):
             "filled_price": filled_price,
         }
 
-    @Broker._exception_handler
-    def fetch_crypto_order_status(self, id):
-        ret = rh.get_crypto_order_info(id)
+    def _crypto_order_status(self, ret):
         debugger.debug(ret)
         # Check if any of the orders were executed
         executions = ret["executions"]
@@ -14,6 +14,8 @@ class WebullBroker(Broker):
     interval_list = [Interval.MIN_1, Interval.MIN_5, Interval.HR_1, Interval.DAY_1]
     exchange = "NASDAQ"
     req_keys = ["wb_username", "wb_password", "wb_trade_pin"]
+    # The API is unofficial, so it is not sent many requests at once.
+    max_concurrency = 2
 
     def __init__(self, path: str = None, paper_trader: bool = False):
         super().__init__(path)
@@ -343,59 +345,86 @@ class WebullBroker(Broker):
         ret = self.api.get_history_orders(status="All")
         for r in ret:
             if r["orders"][0]["orderId"] == id:
-                return {
-                    "type": "STOCK",
-                    "id": r["orders"][0]["orderId"],
-                    "symbol": r["orders"][0]["ticker"]["symbol"],
-                    "price": r.get("lmtPrice"),
-                    "avg_price": r.get("avgFilledPrice"),
-                    "quantity": r.get("totalQuantity"),
-                    "filled_quantity": r.get("filledQuantity"),
-                    "side": r["action"],
-                    "time_in_force": r["timeInForce"],
-                    "status": r["status"].lower(),
-                }
+                return self._stock_order_status(r)
 
     @Broker._exception_handler
     def fetch_option_order_status(self, id):
         ret = self.api.get_history_orders(status="All")
         for r in ret:
             if r["orders"][0]["orderId"] == id:
-                return {
-                    "type": "OPTION",
-                    "id": r["orders"][0]["orderId"],
-                    "symbol": self.data_to_occ(
-                        r["orders"][0]["symbol"],
-                        str_to_date(r["orders"][0]["optionExpireDate"]),
-                        r["orders"][0]["optionType"],
-                        float(r["orders"][0]["optionExercisePrice"]),
-                    ),
-                    "price": r.get("lmtPrice"),
-                    "avg_price": r.get("avgFilledPrice"),
-                    "qty": r["quantity"],
-                    "filled_qty": r["filledQuantity"],
-                    "side": r["orders"][0]["optionType"],
-                    "time_in_force": r["timeInForce"],
-                    "status": r["status"].lower(),
-                }
+                return self._option_order_status(r)
 
     @Broker._exception_handler
     def fetch_crypto_order_status(self, id):
         ret = self.api.get_history_orders(status="All")
         for r in ret:
             if r["orderId"] == id:
-                return {
-                    "type": "CRYPTO",
-                    "id": r["orders"][0]["orderId"],
-                    "symbol": f"@{r['orders'][0]['ticker']['symbol'].replace('USD', '')}",
-                    "qty": float(r["quantity"]),
-                    "filled_qty": float(r["cumulative_quantity"]),
-                    "filled_price": (float(r["executions"][0]["effective_price"]) if len(r["executions"]) else 0),
-                    "filled_cost": float(r["rounded_executed_notional"]),
-                    "side": r["side"],
-                    "time_in_force": r["timeInForce"],
-                    "status": r["status"].lower(),
-                }
+                return self._crypto_order_status(r)
+
+    @Broker._exception_handler
+    def fetch_order_statuses(self, order_ids):
+        """
+        Returns the status of several orders from a single request of the order history.
+        """
+        ret = self.api.get_history_orders(status="All")
+        orders = {r["orders"][0]["orderId"]: r for r in ret}
+        crypto_orders = {r.get("orderId"): r for r in ret}
+        statuses = {}
+        for order_id, order_type in order_ids.items():
+            if order_type == "CRYPTO":
+                if order_id in crypto_orders:
+                    statuses[order_id] = self._crypto_order_status(crypto_orders[order_id])
+            elif order_id in orders:
+                parse = self._stock_order_status if order_type == "STOCK" else self._option_order_status
+                statuses[order_id] = parse(orders[order_id])
+        return statuses
+
+    def _stock_order_status(self, r):
+        return {
+            "type": "STOCK",
+            "id": r["orders"][0]["orderId"],
+            "symbol": r["orders"][0]["ticker"]["symbol"],
+            "price": r.get("lmtPrice"),
+            "avg_price": r.get("avgFilledPrice"),
+            "quantity": r.get("totalQuantity"),
+            "filled_quantity": r.get("filledQuantity"),
+            "side": r["action"],
+            "time_in_force": r["timeInForce"],
+            "status": r["status"].lower(),
+        }
+
+    def _option_order_status(self, r):
+        return {
+            "type": "OPTION",
+            "id": r["orders"][0]["orderId"],
+            "symbol": self.data_to_occ(
+                r["orders"][0]["symbol"],
+                str_to_date(r["orders"][0]["optionExpireDate"]),
+                r["orders"][0]["optionType"],
+                float(r["orders"][0]["optionExercisePrice"]),
+            ),
+            "price": r.get("lmtPrice"),
+            "avg_price": r.get("avgFilledPrice"),
+            "qty": r["quantity"],
+            "filled_qty": r["filledQuantity"],
+            "side": r["orders"][0]["optionType"],
+            "time_in_force": r["timeInForce"],
+            "status": r["status"].lower(),
+        }
+
+    def _crypto_order_status(self, r):
+        return {
+            "type": "CRYPTO",
+            "id": r["orders"][0]["orderId"],
+            "symbol": f"@{r['orders'][0]['ticker']['symbol'].replace('USD', '')}",
+            "qty": float(r["quantity"]),
+            "filled_qty": float(r["cumulative_quantity"]),
+            "filled_price": (float(r["executions"][0]["effective_price"]) if len(r["executions"]) else 0),
+            "filled_cost": float(r["rounded_executed_notional"]),
+            "side": r["side"],
+            "time_in_force": r["timeInForce"],
+            "status": r["status"].lower(),
+        }
 
     @Broker._exception_handler
     def fetch_order_queue(self):
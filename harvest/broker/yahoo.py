@@ -1,7 +1,7 @@
 import datetime
 import datetime as dt
 import re
-from typing import Any, Callable, Dict, Union
+from typing import Any, Callable, Dict, List, Union
 from zoneinfo import ZoneInfo
 
 import pandas as pd
@@ -182,6 +182,60 @@ class YahooBroker(Broker):
 
         return df
 
+    @Broker._exception_handler
+    def fetch_latest_prices(self, symbols: List[str]) -> Dict[str, float]:
+        """
+        Fetches the latest price of several assets with a single download of today's 1 minute bars.
+        """
+        if not symbols:
+            return {}
+        tickers = list(dict.fromkeys(self.fmt_symbol(s) for s in symbols))
+        df = yf.download(" ".join(tickers), period="1d", interval="1m", prepost=True, progress=False)
+        debugger.debug(f"From yfinance got: {df}")
+        if len(df.index) == 0:
+            return {}
+        close = df["Close"]
+        if isinstance(close, pd.Series):
+            close = close.to_frame(tickers[0])
+
+        prices = {}
+        for ticker in tickers:
+            if ticker not in close:
+                continue
+            series = close[ticker].dropna()
+            if len(series.index) > 0:
+                prices[self.unfmt_symbol(ticker)] = float(series.iloc[-1])
+        return prices
+
+    @Broker._exception_handler
+    def fetch_option_quotes(self, occ_symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the market data of several options, with one option chain request per
+        underlying asset and expiration date.
+        """
+        groups = {}
+        for occ_symbol in occ_symbols:
+            symbol, date, _, _ = self.occ_to_data(occ_symbol.replace(" ", ""))
+            groups.setdefault((symbol, date), []).append(occ_symbol)
+
+        quotes = {}
+        for (symbol, date), group in groups.items():
+            ticker = self.watch_ticker.get(symbol) or yf.Ticker(symbol)
+            chain = ticker.option_chain(date_to_str(date))
+            df = pd.concat([chain.calls, chain.puts]).set_index("contractSymbol")
+            for occ_symbol in group:
+                contract = occ_symbol.replace(" ", "")
+                if contract not in df.index:
+                    debugger.error(f"Option {occ_symbol} was not found in the option chain of {symbol}")
+                    continue
+                row = df.loc[contract]
+                quotes[occ_symbol] = {
+                    "price": float(row["lastPrice"]),
+                    "ask": float(row["ask"]),
+                    "bid": float(row["bid"]),
+                }
+        return quotes
+
     @Broker._exception_handler
     def fetch_chain_info(self, symbol: str) -> Dict[str, Any]:
         """
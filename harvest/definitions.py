@@ -52,6 +52,7 @@ class Functions:
         load: Callable = None,
         save: Callable = None,
         load_daytrade: Callable = None,
+        load_panel: Callable = None,
     ) -> None:
         self.buy = buy
         self.sell = sell
@@ -62,6 +63,7 @@ class Functions:
         self.load = load
         self.save = save
         self.load_daytrade = load_daytrade
+        self.load_panel = load_panel
 
 
 class Account:
@@ -53,6 +53,8 @@ class StorageType(EnumList):
     CSV = "csv"
     PICKLE = "pickle"
     DB = "db"
+    PARQUET = "parquet"
+    MMAP = "mmap"
 
 
 class Timestamp:
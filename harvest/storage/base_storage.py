@@ -1,12 +1,22 @@
 import datetime as dt
+import tempfile
 from threading import Lock
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
 from harvest.definitions import Stats
 from harvest.enum import Interval
-from harvest.util.helper import aggregate_df, debugger, interval_to_timedelta, symbol_type
+from harvest.storage.market_calendar import MarketCalendar
+from harvest.storage.memory_budget import MemoryBudget, series_nbytes
+from harvest.storage.panel_block import PanelBlock
+from harvest.storage.performance_history import EquityBuffer
+from harvest.storage.price_buffer import PRICE_COLUMNS, PriceBuffer
+from harvest.storage.series_stub import LazySeries, SeriesStub
+from harvest.storage.transaction_journal import TransactionJournal
+from harvest.util.helper import aggregate_df, compact_df, debugger, interval_enum_to_string, interval_to_timedelta
+from harvest.util.lock import ReadWriteLock
 
 """
 This module serves as a basic storage system for pandas dataframes in memory.
@@ -67,6 +77,10 @@ class BaseStorage:
         transaction_storage_limit: bool = True,
         performance_storage_size: int = 200,
         performance_storage_limit: bool = True,
+        columnar: bool = False,
+        compact: bool = False,
+        memory_budget: int = None,
+        spill_dir: str = None,
     ) -> None:
         """
         queue_size: The maximum number of data points to store for asset price history.
@@ -74,8 +88,19 @@ class BaseStorage:
         limit_size: Whether to limit the size of price history to queue_size.
             This may be set to False if the storage is being used for backtesting, in which case
             you would want to store as much data as possible.
+        columnar: If True, price history is kept in preallocated PriceBuffers instead of DataFrames,
+            which makes appending a new bar O(1). DataFrames are only built when load() is called.
+        compact: If True, prices are stored as float32 and volume as uint64, which halves the memory
+            used by price history. Use load(upcast=True) to get float64 data back.
+        memory_budget: If given, the maximum number of bytes of price history to keep in memory.
+            The least recently used series are spilled to disk and loaded back when needed.
+        spill_dir: The directory to spill price history to. Defaults to a temporary directory, which
+            close() removes.
         """
-        self.storage_lock = Lock()  # Lock
+        # storage_lock guards the structure of the storage dictionaries, while the price
+        # history of each (symbol, interval) pair has its own reader/writer lock.
+        self.storage_lock = Lock()
+        self.series_locks = {}
 
         self.price_storage_size = price_storage_size
         self.price_storage_limit = price_storage_limit
@@ -83,31 +108,53 @@ class BaseStorage:
         self.transaction_storage_limit = transaction_storage_limit
         self.performance_storage_size = performance_storage_size
         self.performance_storage_limit = performance_storage_limit
+        self.columnar = columnar
+        self.compact = compact
+        self.memory = None
+        if memory_budget is not None:
+            if spill_dir is None:
+                self.memory = MemoryBudget(memory_budget, tempfile.mkdtemp(prefix="harvest-"), temporary=True)
+            else:
+                self.memory = MemoryBudget(memory_budget, spill_dir)
 
         # BaseStorage uses a python dictionary to store the data,
-        # where key is asset symbol and value is a pandas dataframe.
+        # where key is asset symbol and value is a pandas dataframe,
+        # or a PriceBuffer if columnar is True.
         self.storage_price = {}
 
-        self.storage_transaction = pd.DataFrame(
-            columns=[
-                "timestamp",
-                "algorithm_name",
-                "symbol",
-                "side",
-                "quantity",
-                "price",
-            ]
-        )
-        self.storage_daytrade = pd.DataFrame(columns=["timestamp", "symbol"])
-        self.storage_calendar = pd.DataFrame(columns=["is_open", "open_at", "close_at"], index=[])
+        # Consolidated time x symbol blocks of one price field, keyed by (interval, field).
+        # A block is created by the first load_panel() call for it, and updated on every store.
+        self.storage_panels = {}
 
+        # Filled orders and the day trades they caused
+        self.storage_transaction = TransactionJournal()
+        self.storage_calendar = MarketCalendar()
+
+        # Performance history range up until '1 MONTH' have the same interval as the
+        # polling interval of the trader, while longer ranges keep one point per day.
         self.storage_performance = {}
-        for interval, _ in self.performance_history_intervals:
-            self.storage_performance[interval] = pd.DataFrame(columns=["equity"], index=[])
+        for i, (interval, days) in enumerate(self.performance_history_intervals):
+            self.storage_performance[interval] = EquityBuffer(
+                performance_storage_size,
+                max_age=None if days is None else dt.timedelta(days=days),
+                daily=i >= 3,
+                bounded=performance_storage_limit,
+            )
 
     def setup(self, stats: Stats) -> None:
         self.stats = stats
 
+    def _series_lock(self, symbol: str, interval: Interval) -> ReadWriteLock:
+        """
+        Returns the reader/writer lock guarding the price history of the given symbol and interval.
+        """
+        key = (symbol, interval)
+        lock = self.series_locks.get(key)
+        if lock is None:
+            with self.storage_lock:
+                lock = self.series_locks.setdefault(key, ReadWriteLock())
+        return lock
+
     def store(self, symbol: str, interval: Interval, data: pd.DataFrame, remove_duplicate=True) -> None:
         """
         Stores the stock data in the storage dictionary.
@@ -121,37 +168,155 @@ class BaseStorage:
         if data.empty:
             return None
 
-        self.storage_lock.acquire()
-
-        if symbol in self.storage_price:
-            # Handles if we already have data
-            intervals = self.storage_price[symbol]
-            if interval in intervals:
-                try:
-                    # Handles if we have stock data for the given interval
-                    intervals[interval] = self._append(intervals[interval], data, remove_duplicate=remove_duplicate)
-                    if self.price_storage_limit:
-                        intervals[interval] = intervals[interval][-self.price_storage_size :]
-                except Exception:
-                    self.storage_lock.release()
-                    debugger.error("Append Failure, case not found!")
-            else:
-                # Add the data as a new interval
-                intervals[interval] = data
-        else:
-            if self.price_storage_limit:
-                data = data[-self.price_storage_size :]
-            if len(data) < self.price_storage_size:
-                debugger.warning(f"Symbol {symbol}, interval {interval} initialized with only {len(data)} data points")
-            # Add the data into storage
-            self.storage_price[symbol] = {interval: data}
+        if self.compact:
+            data = compact_df(data, symbol)
+
+        with self._series_lock(symbol, interval).write():
+            self._store_series(symbol, interval, data, remove_duplicate)
+            self._update_panels(symbol, interval, data)
+
+    def _store_series(self, symbol: str, interval: Interval, data: pd.DataFrame, remove_duplicate: bool) -> None:
+        """
+        Stores the stock data. Caller must hold the write lock of the series.
+        """
+        with self.storage_lock:
+            intervals = self.storage_price.setdefault(symbol, {})
+
+        if self.columnar:
+            self._store_buffer(symbol, interval, data)
+            return
 
-        cur_len = len(self.storage_price[symbol][interval])
-        if self.price_storage_limit and cur_len > self.price_storage_size:
+        if interval in intervals:
+            try:
+                # Handles if we have stock data for the given interval
+                data = self._append(self._get_series(symbol, interval), data, remove_duplicate=remove_duplicate)
+            except Exception:
+                debugger.error("Append Failure, case not found!")
+                return
+        elif len(data) < self.price_storage_size:
+            debugger.warning(f"Symbol {symbol}, interval {interval} initialized with only {len(data)} data points")
+
+        if self.price_storage_limit and len(data) > self.price_storage_size:
             # If we have more than N data points, remove the oldest data
-            self.storage_price[symbol][interval] = self.storage_price[symbol][interval].iloc[-self.price_storage_size :]
+            data = data.iloc[-self.price_storage_size :]
+
+        # Replace the stored frame in one step, so readers see either the old or the new frame.
+        self._set_series(symbol, interval, data)
+
+    def _store_buffer(self, symbol: str, interval: Interval, data: pd.DataFrame) -> None:
+        """
+        Stores the stock data in a PriceBuffer. Caller must hold the write lock of the series.
+        """
+        intervals = self.storage_price[symbol]
+        if interval not in intervals:
+            if self.price_storage_limit and len(data) < self.price_storage_size:
+                debugger.warning(f"Symbol {symbol}, interval {interval} initialized with only {len(data)} data points")
+            buffer = self._new_buffer(symbol, interval, data)
+        else:
+            buffer = self._get_series(symbol, interval)
+        buffer.extend_frame(data[symbol])
+        self._set_series(symbol, interval, buffer)
+
+    def _new_buffer(self, symbol: str, interval: Interval, data: pd.DataFrame) -> PriceBuffer:
+        return PriceBuffer(
+            self.price_storage_size,
+            self.price_storage_limit,
+            data.index.name or "timestamp",
+            data[symbol].dtypes.to_dict() if self.compact else None,
+        )
+
+    def _get_series(self, symbol: str, interval: Interval) -> Union[pd.DataFrame, PriceBuffer]:
+        """
+        Returns the stored price history, loading it into memory if it was spilled or not read yet.
+        Caller must hold the lock of the series.
+        """
+        data = self.storage_price[symbol][interval]
+        if isinstance(data, LazySeries):
+            data = self._ingest(symbol, interval, data.restore())
+            self._set_series(symbol, interval, data)
+        elif isinstance(data, SeriesStub):
+            data = data.restore()
+            self._set_series(symbol, interval, data)
+        elif self.memory is not None:
+            self.memory.touch((symbol, interval))
+        return data
+
+    def _ingest(self, symbol: str, interval: Interval, data: pd.DataFrame) -> Union[pd.DataFrame, PriceBuffer]:
+        """
+        Converts a complete, sorted price history into the format it is stored in.
+        """
+        if self.compact:
+            data = compact_df(data, symbol)
+        if self.columnar:
+            buffer = self._new_buffer(symbol, interval, data)
+            buffer.extend_frame(data[symbol])
+            return buffer
+        if self.price_storage_limit:
+            data = data.iloc[-self.price_storage_size :]
+        return data
+
+    def _set_series(self, symbol: str, interval: Interval, data: Union[pd.DataFrame, PriceBuffer]) -> None:
+        """
+        Replaces the stored price history, and spills other series if the memory budget is exceeded.
+        Caller must hold the write lock of the series, or the read lock when restoring a series.
+        """
+        self.storage_price[symbol][interval] = data
+        if self.memory is None:
+            return
+        self.memory.touch((symbol, interval), series_nbytes(data))
+        if self.memory.over_budget():
+            self._spill((symbol, interval))
+
+    def _spill(self, keep: Tuple[str, Interval]) -> None:
+        """
+        Moves the least recently used series to disk until the memory budget is met.
+        :keep: the series being written, which is never spilled.
+        """
+        for key in self.memory.coldest():
+            if not self.memory.over_budget():
+                return
+            if key == keep:
+                continue
+            # Series that are in use are skipped rather than waited for, which also
+            # avoids deadlocks with threads that are themselves spilling.
+            lock = self._series_lock(*key)
+            if not lock.acquire_write(blocking=False):
+                continue
+            try:
+                symbol, interval = key
+                data = self.storage_price[symbol][interval]
+                if not isinstance(data, SeriesStub):
+                    name = f"{symbol}@{interval_enum_to_string(interval)}"
+                    self.storage_price[symbol][interval] = self.memory.spill(key, name, data)
+            finally:
+                lock.release_write()
+
+    def _get_frame(self, symbol: str, interval: Interval, since: pd.Timestamp = None) -> pd.DataFrame:
+        """
+        Returns the stored price history as a DataFrame. Caller must hold the lock of the series.
+        :since: if given, only rows with a timestamp at or after it are returned.
+        """
+        data = self._get_series(symbol, interval)
+        if isinstance(data, PriceBuffer):
+            start = 0 if since is None else int(data.timestamps().searchsorted(since.value))
+            return data.to_frame(symbol, start=start)
+        if since is None:
+            return data
+        return data.iloc[data.index.searchsorted(since) :]
 
-        self.storage_lock.release()
+    def _last_timestamp(self, symbol: str, interval: Interval) -> pd.Timestamp:
+        """
+        Returns the timestamp of the newest stored row, or None if there is none.
+        Caller must hold the lock of the series.
+        """
+        if interval not in self.storage_price[symbol]:
+            return None
+        data = self._get_series(symbol, interval)
+        if data.empty:
+            return None
+        if isinstance(data, PriceBuffer):
+            return pd.Timestamp(data.last_timestamp(), tz="UTC")
+        return data.index[-1]
 
     def load(
         self,
@@ -160,7 +325,11 @@ class BaseStorage:
         start: dt.datetime = None,
         end: dt.datetime = None,
         slice_data=False,
-    ) -> pd.DataFrame:
+        fields: Union[str, List[str]] = None,
+        as_numpy: bool = False,
+        upcast: bool = False,
+        limit: int = None,
+    ) -> Union[pd.DataFrame, np.ndarray]:
         """
         Loads the stock data given the symbol and interval. May return only
         a subset of the data if start and end are given.
@@ -169,56 +338,155 @@ class BaseStorage:
         aggregating data.
         :symbol: a stock or crypto
         :interval: the interval between each data point, must be at least MIN_1
-        :start: a datetime object
+        :start: a datetime object, naive datetimes are assumed to be in UTC
+        :end: a datetime object, naive datetimes are assumed to be in UTC
+        :fields: a price column, or a list of them, to return instead of all columns
+        :as_numpy: if True, returns a numpy array instead of a DataFrame. The array is 1D if
+            fields is a single column, and has one column per field otherwise.
+        :upcast: if True, the data is returned as float64 even if it is stored in compact dtypes.
+        :limit: if given, only the newest limit rows in the range are returned.
         """
-        self.storage_lock.acquire()
-
-        if symbol not in self.storage_price:
-            self.storage_lock.release()
-            return None
+        with self.storage_lock:
+            if symbol not in self.storage_price:
+                return None
+            intervals = list(self.storage_price[symbol])
 
         if interval is None:
             # If the interval is not given, return the data with the
             # smallest interval that has data in the range.
-            intervals = [(interval, interval_to_timedelta(interval)) for interval in self.storage_price[symbol]]
-            intervals.sort(key=lambda interval_timedelta: interval_timedelta[1])
-            for interval_timedelta in intervals:
-                self.storage_lock.release()
-                data = self.load(symbol, interval_timedelta[0], start, end)
-                self.storage_lock.acquire()
+            for interval in sorted(intervals, key=interval_to_timedelta):
+                data = self.load(
+                    symbol, interval, start, end, fields=fields, as_numpy=as_numpy, upcast=upcast, limit=limit
+                )
                 if data is not None:
-                    self.storage_lock.release()
                     return data
-            self.storage_lock.release()
             return None
 
-        data = self.storage_price[symbol][interval]
+        if self.columnar:
+            # PriceBuffers are updated in place, so readers must exclude the writer.
+            with self._series_lock(symbol, interval).read():
+                data = self._load_buffer(symbol, interval, start, end, fields, as_numpy, limit)
+        else:
+            data = self._load_frame(symbol, interval, start, end, fields, as_numpy, limit)
+
+        if upcast and self.compact:
+            data = data.astype(np.float64)
+        return data
 
-        if start is None and end is None:
-            self.storage_lock.release()
+    def _load_frame(
+        self,
+        symbol: str,
+        interval: Interval,
+        start: dt.datetime,
+        end: dt.datetime,
+        fields: Union[str, List[str]],
+        as_numpy: bool,
+        limit: int = None,
+    ) -> Union[pd.DataFrame, np.ndarray]:
+        """
+        Reads a range of a stored DataFrame.
+        """
+        # The read lock keeps the series from being spilled while it is read, and restoring a
+        # spilled series from overlapping with a writer. Stored DataFrames are never modified,
+        # only replaced, so the returned frame can be sliced after the lock is released.
+        with self._series_lock(symbol, interval).read():
+            data = self._get_frame(symbol, interval)
+        if start is None and end is None and fields is None and not as_numpy and limit is None:
             return data
 
-        # If the start and end are not defined, then set them to the
-        # beginning and end of the data.
-        if start is None:
-            start = data.index[0]
-        if end is None:
-            end = data.index[-1]
-
-        self.storage_lock.release()
-        return data.loc[start:end]
-
-    def add_calendar_data(self, data: Dict[str, Any]) -> None:
-        timestamp = self.stats.timestamp.date()
-        is_open = data["is_open"]
-        open_at = data["open_at"]
-        close_at = data["close_at"]
-        df = pd.DataFrame(
-            [[is_open, open_at, close_at]],
-            columns=["is_open", "open_at", "close_at"],
-            index=[timestamp],
-        )
-        self._append(self.storage_calendar, df, remove_duplicate=True)
+        if data.empty:
+            # A series that was reset has no columns to select from.
+            if not as_numpy:
+                return data
+            return np.empty(0 if isinstance(fields, str) else (0, len(fields or PRICE_COLUMNS)))
+
+        i, j = self._range(data.index.asi8, start, end, limit)
+        if fields is None:
+            fields = list(data[symbol].columns)
+        if as_numpy:
+            if isinstance(fields, str):
+                return data[(symbol, fields)].to_numpy()[i:j]
+            return np.column_stack([data[(symbol, f)].to_numpy()[i:j] for f in fields])
+        if isinstance(fields, str):
+            fields = [fields]
+        return data.iloc[i:j][[(symbol, f) for f in fields]]
+
+    def _load_buffer(
+        self,
+        symbol: str,
+        interval: Interval,
+        start: dt.datetime,
+        end: dt.datetime,
+        fields: Union[str, List[str]],
+        as_numpy: bool,
+        limit: int = None,
+    ) -> Union[pd.DataFrame, np.ndarray]:
+        """
+        Reads a range of a PriceBuffer. Caller must hold the lock of the series.
+        """
+        data = self._get_series(symbol, interval)
+        i, j = self._range(data.timestamps(), start, end, limit)
+        if fields is None:
+            fields = list(PRICE_COLUMNS)
+        if as_numpy:
+            # Copy, as the buffer is overwritten once the lock is released.
+            if isinstance(fields, str):
+                return data.column(fields)[i:j].copy()
+            return np.column_stack([data.column(f)[i:j] for f in fields])
+        if isinstance(fields, str):
+            fields = [fields]
+        return data.to_frame(symbol, fields, start=i, stop=j)
+
+    @staticmethod
+    def _range(
+        timestamps: np.ndarray, start: dt.datetime, end: dt.datetime, limit: int = None
+    ) -> Tuple[int, int]:
+        """
+        Finds the positions of the rows between start and end, both inclusive, with a binary search.
+        :timestamps: sorted UTC epoch nanoseconds
+        :limit: if given, only the last limit rows of the range are included.
+        """
+        i = 0 if start is None else int(timestamps.searchsorted(BaseStorage._to_ns(start), side="left"))
+        j = len(timestamps) if end is None else int(timestamps.searchsorted(BaseStorage._to_ns(end), side="right"))
+        j = max(i, j)
+        if limit is not None:
+            i = max(i, j - limit)
+        return i, j
+
+    @staticmethod
+    def _to_ns(time: dt.datetime) -> int:
+        time = pd.Timestamp(time)
+        if time.tzinfo is None:
+            time = time.tz_localize("UTC")
+        return time.value
+
+    def add_calendar_data(self, data: Dict[str, Any], date: dt.date = None) -> None:
+        """
+        Stores the market hours of a date, as returned by Broker.fetch_market_hours().
+        :date: the date the market hours are for. Defaults to the current date.
+        """
+        now = getattr(self, "stats", None) and self.stats.timestamp
+        if date is None:
+            date = now.date()
+        self.storage_calendar.add(date, data, now)
+
+    def needs_calendar_data(self, date: dt.date, now: dt.datetime) -> bool:
+        """
+        Returns True if the market hours of the date have not been stored yet, or should be refreshed.
+        """
+        return self.storage_calendar.needs_update(date, now)
+
+    def load_market_hours(self, date: dt.date) -> Dict[str, Any]:
+        """
+        Returns the stored market hours of a date, or None if there are none.
+        """
+        return self.storage_calendar.get(date)
+
+    def load_open_days(self, n: int) -> List[Tuple[dt.date, Dict[str, Any]]]:
+        """
+        Returns the market hours of the last n open days as (date, market hours) pairs, oldest first.
+        """
+        return self.storage_calendar.last_open_days(n)
 
     def store_transaction(
         self,
@@ -229,84 +497,41 @@ class BaseStorage:
         quantity: int,
         price: float,
     ) -> None:
-        # Append this transaction to the transaction dataframe
-        # index is the timestamp
-        self.storage_transaction = pd.concat(
-            [
-                self.storage_transaction,
-                pd.DataFrame(
-                    {
-                        "timestamp": timestamp,
-                        "algorithm_name": algorithm_name,
-                        "symbol": symbol,
-                        "side": side,
-                        "quantity": quantity,
-                        "price": price,
-                    },
-                    index=[timestamp],
-                ),
-            ]
-        )
+        is_daytrade = self.storage_transaction.append(timestamp, algorithm_name, symbol, side, quantity, price)
 
         debugger.debug(f"Stored transaction: {timestamp}, {algorithm_name}, {symbol}, {side}, {quantity}, {price}")
-        if symbol_type(symbol) == "CRYPTO":
-            return
-
-        # For stocks and options, check for daytrades.
-        # First, check the transaction history for this asset in the current day.
-        history = self.storage_transaction
-        debugger.debug(f"{history}")
-        # history.set_index("timestamp", inplace=True)
-        history = history[history["symbol"] == symbol]
-        debugger.debug(f"History: {history}")
-        # convert to date object (not datetime)
-        history["timestamp"] = history["timestamp"].dt.date
-        history = history[history["timestamp"] == timestamp.date()]
-
-        # If there is no history, this cannot be a daytrade.
-        if history.empty:
-            return
-
-        debugger.debug(f"Found {len(history)} transactions for {symbol}")
-        debugger.debug(f"{history}")
-
-        # If there is history, check if this transaction is a daytrade.
-        # Note that we don't support shorting, so a sell always closes a position.
-        buy_sell = list(history["side"])[:-1]
-
-        if side == "sell":
-            if buy_sell[-1] == "buy":
-                self.storage_daytrade = pd.concat(
-                    [
-                        self.storage_daytrade,
-                        pd.DataFrame(
-                            {
-                                "timestamp": timestamp,
-                                "symbol": symbol,
-                            },
-                            index=[timestamp],
-                        ),
-                    ]
-                )
-
-                debugger.debug(f"Stored daytrade: {timestamp}, {symbol}")
+        if is_daytrade:
+            debugger.debug(f"Stored daytrade: {timestamp}, {symbol}")
 
     def load_transaction(self) -> pd.DataFrame:
-        return self.storage_transaction
+        return self.storage_transaction.to_frame()
 
     def load_daytrade(self) -> pd.DataFrame:
-        return self.storage_daytrade
+        return self.storage_transaction.daytrades_to_frame()
+
+    def count_daytrades(self, since: dt.datetime) -> int:
+        """
+        Returns the number of day trades made at or after the given time.
+        """
+        return self.storage_transaction.count_daytrades(since)
 
     def load_calendar(self) -> pd.DataFrame:
-        return self.storage_calendar
+        return self.storage_calendar.to_frame()
 
     def reset(self, symbol: str, interval: Interval) -> None:
         """
         Resets to an empty dataframe
         """
-        self.storage_lock.acquire()
-        self.storage_price[symbol][interval] = pd.DataFrame()
-        self.storage_lock.release()
+        with self._series_lock(symbol, interval).write():
+            data = self._get_series(symbol, interval)
+            if isinstance(data, PriceBuffer):
+                data.clear()
+                self._set_series(symbol, interval, data)
+            else:
+                self._set_series(symbol, interval, pd.DataFrame())
+            for (panel_interval, _), block in list(self.storage_panels.items()):
+                if panel_interval == interval:
+                    block.clear_symbol(symbol)
 
     def _append(
         self,
@@ -336,22 +561,114 @@ class BaseStorage:
     ) -> None:
         """
         Aggregates the stock data from the interval specified in 'from' to 'to'.
+
+        Only the base bars that fall in or after the last (possibly partial) bar of the
+        target interval are aggregated, and only that bar and any newer ones are written,
+        so the cost of each call does not grow with the length of the history.
         """
-        self.storage_lock.acquire()
-        data = self.storage_price[symbol][base]
-        self.storage_price[symbol][target] = self._append(
-            self.storage_price[symbol][target],
-            aggregate_df(data, target),
-            remove_duplicate,
+        # Locks are always taken in increasing order of interval, and base < target.
+        with self._series_lock(symbol, base).read(), self._series_lock(symbol, target).write():
+            since = self._last_timestamp(symbol, target)
+            data = self._get_frame(symbol, base, since)
+            if data.empty:
+                return
+            agg = aggregate_df(data, target)
+            if self.compact:
+                agg = compact_df(agg, symbol)
+
+            if self.columnar:
+                self._store_buffer(symbol, target, agg)
+            elif since is None:
+                self._set_series(
+                    symbol, target, agg.iloc[-self.price_storage_size :] if self.price_storage_limit else agg
+                )
+            else:
+                # The aggregated bars replace every stored bar from the first of them on, which
+                # includes the last stored bar, as it may have been partial. Stored bars need not
+                # sit on the buckets of aggregate_df, so the cut is not always a single bar.
+                current = self._get_series(symbol, target)
+                current = current.iloc[: current.index.searchsorted(agg.index[0])]
+                if self.price_storage_limit:
+                    current = current.iloc[max(len(current) + len(agg) - self.price_storage_size, 0) :]
+                self._set_series(symbol, target, pd.concat([current, agg]))
+            self._update_panels(symbol, target, agg)
+
+    def load_panel(
+        self,
+        symbols: List[str],
+        interval: Interval,
+        field: str = "close",
+        start: dt.datetime = None,
+        end: dt.datetime = None,
+        as_numpy: bool = False,
+    ) -> Union[pd.DataFrame, np.ndarray]:
+        """
+        Loads one price field of several symbols, aligned on a shared timestamp index.
+        Timestamps where a symbol has no data are NaN.
+
+        :symbols: the symbols to load, in the order of the returned columns
+        :interval: the interval of the data
+        :field: the price column to load
+        :start: a datetime object, naive datetimes are assumed to be in UTC
+        :end: a datetime object, naive datetimes are assumed to be in UTC
+        :as_numpy: if True, returns a 2D numpy array of time x symbol instead of a DataFrame
+        """
+        block = self._get_panel(interval, field)
+        timestamps, values = block.read(
+            symbols,
+            None if start is None else self._to_ns(start),
+            None if end is None else self._to_ns(end),
         )
-        cur_len = len(self.storage_price[symbol][target])
-        if self.price_storage_limit and cur_len > self.price_storage_size:
-            self.storage_price[symbol][target] = self.storage_price[symbol][target].iloc[-self.price_storage_size :]
-        self.storage_lock.release()
+        if as_numpy:
+            return values
+        index = pd.DatetimeIndex(timestamps.view("datetime64[ns]"), name="timestamp").tz_localize("UTC")
+        return pd.DataFrame(values, index=index, columns=symbols)
+
+    def _get_panel(self, interval: Interval, field: str) -> PanelBlock:
+        """
+        Returns the panel block of a field, creating it from the stored data the first time.
+        """
+        key = (interval, field)
+        with self.storage_lock:
+            block = self.storage_panels.get(key)
+            created = block is None
+            if created:
+                block = PanelBlock(
+                    self.price_storage_size if self.price_storage_limit else None,
+                    np.float32 if self.compact else np.float64,
+                )
+                # Register the block first, so that data stored from now on is written to it.
+                self.storage_panels[key] = block
+                symbols = [symbol for symbol, intervals in self.storage_price.items() if interval in intervals]
+
+        if not created:
+            block.ready.wait()
+            return block
+
+        try:
+            for symbol in symbols:
+                # Hold the lock of the series so that a concurrent store is not overwritten with older data.
+                with self._series_lock(symbol, interval).read():
+                    data = self._get_frame(symbol, interval)
+                    if not data.empty:
+                        block.update(symbol, data.index.asi8, data[(symbol, field)].to_numpy())
+        finally:
+            block.ready.set()
+        return block
+
+    def _update_panels(self, symbol: str, interval: Interval, data: pd.DataFrame) -> None:
+        """
+        Writes newly stored data into the panel blocks of the interval.
+        Caller must hold the write lock of the series.
+        """
+        for (panel_interval, field), block in list(self.storage_panels.items()):
+            if panel_interval == interval and (symbol, field) in data:
+                block.update(symbol, data.index.asi8, data[(symbol, field)].to_numpy())
 
     def init_performance_data(self, equity: float, timestamp: dt.datetime) -> None:
-        for interval, _ in self.performance_history_intervals:
-            self.storage_performance[interval] = pd.DataFrame({"equity": [equity]}, index=[timestamp])
+        for buffer in self.storage_performance.values():
+            buffer.clear()
+            buffer.append(equity, timestamp)
 
     def add_performance_data(self, equity: float, timestamp: dt.datetime) -> None:
         """
@@ -359,39 +676,39 @@ class BaseStorage:
 
         This function is called every time main() is called in trader.
         It takes the current equity and adds it to each interval.
+        Each interval is a fixed-size buffer, so this does not allocate memory.
 
 
         :param equity: Current equity of the account.
         """
-
-        # Performance history range up until '3 MONTHS' have the
-        # same interval as the polling interval of the trader.
-        for interval, days in self.performance_history_intervals[0:3]:
-            df = self.storage_performance[interval]
-            cutoff = timestamp - dt.timedelta(days=days)
-            if df.index[0] < cutoff:
-                df = df.loc[df.index >= cutoff]
-            df = pd.concat([df, pd.DataFrame({"equity": [equity]}, index=[timestamp])])
-            self.storage_performance[interval] = df
-
-        # Performance history intervals after '3 MONTHS' are populated
-        # only for each day.
-        for interval, days in self.performance_history_intervals[3:5]:
-            df = self.storage_performance[interval]
-            if df.index[-1].date() == timestamp.date():
-                df = df.iloc[:-1]
-                df = pd.concat([df, pd.DataFrame({"equity": [equity]}, index=[timestamp])])
-            else:
-                df = pd.concat([df, pd.DataFrame({"equity": [equity]}, index=[timestamp])])
-                cutoff = timestamp - dt.timedelta(days=days)
-                if df.index[0] < cutoff:
-                    df = df.loc[df.index >= cutoff]
-            self.storage_performance[interval] = df
-
-        df = self.storage_performance["ALL"]
-        if df.index[-1].date() == timestamp.date():
-            df = df.iloc[:-1]
-        df = pd.concat([df, pd.DataFrame({"equity": [equity]}, index=[timestamp])])
-        self.storage_performance["ALL"] = df
+        for buffer in self.storage_performance.values():
+            buffer.append(equity, timestamp)
 
         debugger.debug("Performance data added")
+
+    def load_performance(self, interval: str) -> pd.DataFrame:
+        """
+        Returns the equity history of the given range, one of '1DAY', '1WEEK', '1MONTH', '3MONTH', '1YEAR' or 'ALL'.
+        """
+        return self.storage_performance[interval].to_frame()
+
+    def commit(self) -> None:
+        """
+        Called by the trader at the end of every tick, so storages that batch the writes
+        of a tick can write them at once. BaseStorage writes nothing, so this does nothing.
+        """
+
+    def flush(self) -> None:
+        """
+        Blocks until all stored data has been persisted.
+        BaseStorage only keeps data in memory, so there is nothing to flush.
+        """
+
+    def close(self) -> None:
+        """
+        Persists any pending data and releases the resources of the storage, including the
+        files of spilled series.
+        """
+        self.flush()
+        if self.memory is not None:
+            self.memory.close()
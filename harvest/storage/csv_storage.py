@@ -1,46 +1,217 @@
+import datetime as dt
+import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from os import listdir, makedirs
 from os.path import isfile, join
+from typing import Any, Callable, Dict, List, Tuple
 
 import pandas as pd
 
 from harvest.enum import Interval
 from harvest.storage import BaseStorage
+from harvest.storage.series_stub import LazySeries
+from harvest.storage.write_behind import WriteBehind
 from harvest.util.helper import debugger, interval_enum_to_string, interval_string_to_enum
 
 """
 This module serves as a storage system for pandas dataframes in with csv files.
+
+Files are only appended to: each store() writes the rows that changed to the end of
+the file of the series. Rows that were rewritten, such as a partial bar that was later
+completed, are therefore duplicated in the file, and files grow past the number of
+rows kept in memory. A background thread periodically compacts such files by
+rewriting them from memory. Duplicate rows are resolved in favor of the latest one
+when a file is loaded, so a file is valid whether or not it has been compacted.
+
+With write_behind=True, store() only updates memory and the rows are appended to the
+file by a background writer. Series that are stored several times before the writer
+gets to them are written once, from the oldest row that changed.
 """
 
+TRANSACTION_COLUMNS = ["timestamp", "algorithm_name", "symbol", "side", "quantity", "price"]
+
 
 class CSVStorage(BaseStorage):
     """
     An extension of the basic storage that saves data in csv files.
     """
 
-    def __init__(self, save_dir: str = "data") -> None:
-        super().__init__()
+    def __init__(
+        self,
+        save_dir: str = "data",
+        compact: bool = False,
+        compaction_interval: float = 60,
+        lazy: bool = False,
+        workers: int = 1,
+        write_behind: bool = False,
+        max_pending: int = 1000,
+        backpressure: str = "block",
+    ) -> None:
+        super().__init__(compact=compact)
         """
         Adds a directory to save data to. Loads any data that is currently in the
         directory.
+        :compact: whether to keep prices in memory as float32, see BaseStorage.
+        :compaction_interval: seconds between compactions of the files. If None, files
+            are only compacted when compact_files() or close() is called.
+        :lazy: if True, only the first and last lines of each file are read at startup,
+            and a series is read the first time it is used.
+        :workers: the number of threads that read files at startup when lazy is False.
+        :write_behind: if True, files are written by a background thread instead of in store().
+            Call flush() to wait for the data to be on disk.
+        :max_pending: the maximum number of writes queued when write_behind is True.
+        :backpressure: what store() does when the queue is full, 'block' or 'inline'. See WriteBehind.
         """
         self.save_dir = save_dir
 
+        # Last persisted timestamp (UTC epoch nanoseconds), column order, and number of
+        # rows in the file of each (symbol, interval) series
+        self.persisted: Dict[Tuple[str, Interval], int] = {}
+        self._columns = {}
+        self._file_rows = {}
+        # Series whose files have duplicate or out of order rows
+        self._dirty = set()
+        self._file_locks = {}
+        self._performance_rows = 0
+        self._restored_performance = False
+
+        # Oldest changed timestamp (UTC epoch nanoseconds) of each series that has not
+        # been written yet, and the transactions and equity points waiting to be written.
+        self._unpersisted: Dict[Tuple[str, Interval], int] = {}
+        self._pending_transactions: List[list] = []
+        self._pending_performance: List[Tuple[dt.datetime, float]] = []
+        self._pending_lock = threading.Lock()
+
         # if the data dir does not exists, create it
         makedirs(self.save_dir, exist_ok=True)
 
         files = [f for f in listdir(self.save_dir) if isfile(join(self.save_dir, f))]
 
+        series = []
         for file in files:
             debugger.debug(file)
             # trunk-ignore(ruff/W605)
             file_search = re.search("^(@?[\w]+)@([\w]+).csv$", file)
+            if file_search is None:
+                continue
             symbol, interval = file_search.group(1), file_search.group(2)
-            interval = interval_string_to_enum(interval)
-            data = pd.read_csv(join(self.save_dir, file), index_col=0, parse_dates=True)
-            data.index = pd.to_datetime(data.index, unit="s")
-            data.columns = pd.MultiIndex.from_product([[symbol], data.columns])
-            super().store(symbol, interval, data)
+            series.append((join(self.save_dir, file), symbol, interval_string_to_enum(interval)))
+
+        if lazy:
+            for path, symbol, interval in series:
+                self._index_file(path, symbol, interval)
+        else:
+            # Parsing is done in parallel, while storing is cheap and done in order.
+            with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+                frames = pool.map(lambda args: self._read_file(*args), series)
+                for (_, symbol, interval), data in zip(series, frames):
+                    super().store(symbol, interval, data)
+
+        calendar_file = join(self.save_dir, "calendar.csv")
+        if isfile(calendar_file):
+            calendar = pd.read_csv(calendar_file, index_col=0, parse_dates=["open_at", "close_at"])
+            for date, row in calendar.iterrows():
+                super().add_calendar_data(row.where(row.notna(), None).to_dict(), pd.Timestamp(date).date())
+
+        transaction_file = join(self.save_dir, "transactions.csv")
+        if isfile(transaction_file):
+            transactions = pd.read_csv(transaction_file)
+            transactions["timestamp"] = pd.to_datetime(transactions["timestamp"], utc=True)
+            for row in transactions.itertuples(index=False):
+                super().store_transaction(
+                    row.timestamp, row.algorithm_name, row.symbol, row.side, row.quantity, row.price
+                )
+
+        performance_file = join(self.save_dir, "performance.csv")
+        if isfile(performance_file):
+            performance = pd.read_csv(performance_file, index_col=0)
+            performance.index = pd.to_datetime(performance.index, utc=True)
+            performance = performance[~performance.index.duplicated(keep="last")].sort_index()
+            for timestamp, equity in performance["equity"].items():
+                super().add_performance_data(equity, timestamp)
+            self._performance_rows = len(performance)
+            self._restored_performance = len(performance) > 0
+
+        self.writer = WriteBehind(max_pending, backpressure) if write_behind else None
+
+        self.compaction_interval = compaction_interval
+        self._closed = threading.Event()
+        if compaction_interval:
+            self._compactor = threading.Thread(target=self._compaction_loop, name="csv-compaction", daemon=True)
+            self._compactor.start()
+
+    def _read_file(self, path: str, symbol: str, interval: Interval) -> pd.DataFrame:
+        """
+        Reads the file of a series, and records what has been persisted.
+        """
+        data = pd.read_csv(path, index_col=0, parse_dates=True)
+        data.index = pd.to_datetime(data.index, unit="s")
+        key = (symbol, interval)
+        self._columns[key] = list(data.columns)
+        self._file_rows[key] = len(data)
+        if data.index.has_duplicates or not data.index.is_monotonic_increasing:
+            data = data[~data.index.duplicated(keep="last")].sort_index()
+            self._dirty.add(key)
+        if not data.empty:
+            self.persisted[key] = int(data.index.asi8[-1])
+        data.columns = pd.MultiIndex.from_product([[symbol], data.columns])
+        return data
+
+    def _index_file(self, path: str, symbol: str, interval: Interval) -> None:
+        """
+        Registers the series in a file without parsing it. Only the header, the first row, and
+        the last row, found by reading backwards from the end of the file, are read. The number
+        of rows is counted when the series is parsed.
+        """
+        with open(path, "rb") as f:
+            header = f.readline().decode().strip()
+            first = f.readline().decode().strip()
+            if not first:
+                return
+            last = self._last_line(f)
+        start = pd.Timestamp(first.split(",", 1)[0])
+        end = pd.Timestamp(last.split(",", 1)[0])
+
+        key = (symbol, interval)
+        self._columns[key] = header.split(",")[1:]
+        self.persisted[key] = self._to_ns(end)
+        with self.storage_lock:
+            self.storage_price.setdefault(symbol, {})[interval] = LazySeries(
+                lambda: self._read_file(path, symbol, interval), None, start, end
+            )
+
+    @staticmethod
+    def _last_line(f, block: int = 4096) -> str:
+        """
+        Returns the last non-empty line of a file opened in binary mode, reading blocks
+        backwards from the end until a whole line has been read.
+        """
+        pos = f.seek(0, os.SEEK_END)
+        tail = b""
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+            if b"\n" in tail.rstrip(b"\r\n"):
+                break
+        return tail.rstrip(b"\r\n").rsplit(b"\n", 1)[-1].decode(errors="ignore").strip()
+
+    def _file_lock(self, path: str) -> threading.Lock:
+        """
+        Returns the lock that serializes writes to a file.
+        """
+        lock = self._file_locks.get(path)
+        if lock is None:
+            with self.storage_lock:
+                lock = self._file_locks.setdefault(path, threading.Lock())
+        return lock
+
+    def _series_path(self, symbol: str, interval: Interval) -> str:
+        return join(self.save_dir, f"{symbol}@{interval_enum_to_string(interval)}.csv")
 
     def store(
         self,
@@ -50,7 +221,7 @@ class CSVStorage(BaseStorage):
         remove_duplicate: bool = True,
     ) -> None:
         """
-        Stores the stock data in the storage dictionary as a csv file.
+        Stores the stock data in the storage dictionary, and appends the new rows to a csv file.
         :symbol: a stock or crypto
         :interval: the interval between each data point, must be atleast
              1 minute
@@ -59,9 +230,197 @@ class CSVStorage(BaseStorage):
         """
         super().store(symbol, interval, data, remove_duplicate)
 
-        if not data.empty:
-            self.storage_lock.acquire()
-            self.storage_price[symbol][interval][symbol].to_csv(
-                self.save_dir + f"/{symbol}@{interval_enum_to_string(interval)}.csv"
-            )
-            self.storage_lock.release()
+        if data.empty:
+            return
+
+        key = (symbol, interval)
+        since = self._to_ns(data.index.min())
+        with self._pending_lock:
+            self._unpersisted[key] = min(since, self._unpersisted.get(key, since))
+        self._persist(("price", symbol, interval), partial(self._write_series, symbol, interval))
+
+    def _persist(self, key: Any, job: Callable[[], List[str]]) -> None:
+        """
+        Runs a write job, or queues it if write-behind is enabled.
+        """
+        if self.writer is None:
+            job()
+        else:
+            self.writer.submit(key, job)
+
+    def _write_series(self, symbol: str, interval: Interval) -> List[str]:
+        """
+        Appends the rows of a series that changed since it was last written.
+        """
+        key = (symbol, interval)
+        with self._pending_lock:
+            since = self._unpersisted.pop(key, None)
+        if since is None:
+            return []
+
+        path = self._series_path(symbol, interval)
+        with self._series_lock(symbol, interval).read():
+            # Write the stored rows rather than the given data, as they may have been merged with existing bars.
+            rows = self._get_frame(symbol, interval, pd.Timestamp(since, tz="UTC"))
+            if rows.empty:
+                return []
+            with self._file_lock(path):
+                self._append_rows(symbol, interval, path, rows[symbol])
+        return [path]
+
+    def _append_rows(self, symbol: str, interval: Interval, path: str, rows: pd.DataFrame) -> None:
+        """
+        Appends rows to the file of a series. Caller must hold the lock of the file.
+        """
+        key = (symbol, interval)
+        columns = self._columns.setdefault(key, list(rows.columns))
+        rows.reindex(columns=columns).to_csv(path, mode="a", header=not isfile(path))
+
+        timestamps = rows.index.asi8
+        last = self.persisted.get(key)
+        if last is not None and timestamps[0] <= last:
+            self._dirty.add(key)
+        self.persisted[key] = int(timestamps[-1]) if last is None else max(last, int(timestamps[-1]))
+
+        self._file_rows[key] = self._file_rows.get(key, 0) + len(rows)
+        if self.price_storage_limit and self._file_rows[key] > 2 * self.price_storage_size:
+            self._dirty.add(key)
+
+    def store_transaction(
+        self,
+        timestamp: dt.datetime,
+        algorithm_name: str,
+        symbol: str,
+        side: str,
+        quantity: int,
+        price: float,
+    ) -> None:
+        """
+        Stores a filled order and appends it to transactions.csv.
+        """
+        super().store_transaction(timestamp, algorithm_name, symbol, side, quantity, price)
+
+        with self._pending_lock:
+            self._pending_transactions.append([timestamp, algorithm_name, symbol, side, quantity, price])
+        self._persist("transactions", self._write_transactions)
+
+    def _write_transactions(self) -> List[str]:
+        path = join(self.save_dir, "transactions.csv")
+        with self._file_lock(path):
+            with self._pending_lock:
+                rows, self._pending_transactions = self._pending_transactions, []
+            if not rows:
+                return []
+            pd.DataFrame(rows, columns=TRANSACTION_COLUMNS).to_csv(path, mode="a", header=not isfile(path), index=False)
+        return [path]
+
+    def init_performance_data(self, equity: float, timestamp: dt.datetime) -> None:
+        """
+        Starts the equity history, unless a history was loaded from performance.csv,
+        in which case the point is added to it.
+        """
+        if self._restored_performance:
+            self.add_performance_data(equity, timestamp)
+            return
+        super().init_performance_data(equity, timestamp)
+        self._append_performance(equity, timestamp)
+
+    def add_performance_data(self, equity: float, timestamp: dt.datetime) -> None:
+        """
+        Adds the performance data to the storage, and appends it to performance.csv.
+        """
+        super().add_performance_data(equity, timestamp)
+        self._append_performance(equity, timestamp)
+
+    def _append_performance(self, equity: float, timestamp: dt.datetime) -> None:
+        with self._pending_lock:
+            self._pending_performance.append((timestamp, equity))
+        self._persist("performance", self._write_performance)
+
+    def _write_performance(self) -> List[str]:
+        path = join(self.save_dir, "performance.csv")
+        with self._file_lock(path):
+            with self._pending_lock:
+                points, self._pending_performance = self._pending_performance, []
+            if not points:
+                return []
+            timestamps, equity = zip(*points)
+            rows = pd.DataFrame({"equity": equity}, index=pd.Index(timestamps, name="timestamp"))
+            rows.to_csv(path, mode="a", header=not isfile(path))
+            self._performance_rows += len(rows)
+        return [path]
+
+    def add_calendar_data(self, data: Dict[str, Any], date: dt.date = None) -> None:
+        """
+        Stores the market hours of a date and saves the calendar to calendar.csv.
+        """
+        super().add_calendar_data(data, date)
+        self._persist("calendar", self._write_calendar)
+
+    def _write_calendar(self) -> List[str]:
+        path = join(self.save_dir, "calendar.csv")
+        with self._file_lock(path):
+            self._write_file(self.load_calendar(), path)
+        return [path]
+
+    # ------------------ Compaction ------------------ #
+
+    def _compaction_loop(self) -> None:
+        while not self._closed.wait(self.compaction_interval):
+            try:
+                self.compact_files()
+            except Exception as e:
+                debugger.warning(f"Failed to compact csv files: {e}")
+
+    def _write_file(self, data: pd.DataFrame, path: str) -> None:
+        """
+        Replaces a file in one step, so that it is never left partially written.
+        """
+        data.to_csv(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def compact_files(self) -> None:
+        """
+        Rewrites the files that have duplicate or out of order rows, or that grew past
+        the history kept in memory, from the data in memory.
+        """
+        for key in list(self._dirty):
+            symbol, interval = key
+            path = self._series_path(symbol, interval)
+            with self._series_lock(symbol, interval).read(), self._file_lock(path):
+                self._dirty.discard(key)
+                data = self._get_frame(symbol, interval)
+                if data.empty:
+                    continue
+                data = data[symbol]
+                self._write_file(data, path)
+                self._columns[key] = list(data.columns)
+                self._file_rows[key] = len(data)
+                self.persisted[key] = int(data.index.asi8[-1])
+
+        path = join(self.save_dir, "performance.csv")
+        with self._file_lock(path):
+            # Keep every point still held by one of the performance ranges
+            history = pd.concat([self.load_performance(name) for name, _ in self.performance_history_intervals])
+            history = history[~history.index.duplicated(keep="last")].sort_index()
+            if self._performance_rows > 2 * len(history):
+                history.index.name = "timestamp"
+                self._write_file(history, path)
+                self._performance_rows = len(history)
+
+    def flush(self) -> None:
+        """
+        Blocks until every write queued by the background writer is on disk.
+        """
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close(self) -> None:
+        """
+        Stops the background compaction and writer, and compacts the files one last time.
+        """
+        self._closed.set()
+        if self.writer is not None:
+            self.writer.close()
+        self.compact_files()
+        super().close()
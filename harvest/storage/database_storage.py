@@ -1,17 +1,88 @@
 import datetime as dt
-from typing import Tuple
+import threading
+import uuid
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Dict, List, Tuple, Union
 
+import numpy as np
 import pandas as pd
-from sqlalchemy import Column, DateTime, Float, String, create_engine, select
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    String,
+    and_,
+    cast,
+    create_engine,
+    event,
+    delete,
+    func,
+    literal,
+    select,
+    true,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
+from harvest.enum import Interval
 from harvest.storage import BaseStorage
-from harvest.util.helper import aggregate_df, normalize_pandas_dt_index
+from harvest.storage.performance_history import BUCKET_SIZE, min_max_buckets
+from harvest.storage.write_behind import WriteBehind
+from harvest.util.helper import (
+    aggregate_df,
+    compact_df,
+    debugger,
+    interval_string_to_enum,
+    interval_to_timedelta,
+    normalize_pandas_dt_index,
+    symbol_type,
+)
 
 """
 This module serves as a storage system for pandas dataframes in with SQL tables.
+
+Bars are written with a single INSERT ... ON CONFLICT DO UPDATE statement per batch of
+rows on SQLite and PostgreSQL, and with a per-row ORM merge on other databases.
+On these two databases, aggregate() also groups the bars into buckets of the target
+interval in SQL, so the bars never leave the database.
+
+Connections are pooled, and SQLite connections are set up with the pragmas in
+SQLITE_PRAGMAS, so readers do not block the writer. The results of load() are kept
+in a read-through cache until the series is written to, so repeated loads of the
+same bars in a tick, for example by several indicators, only query the database once.
+
+Transactions, equity points and market hours are kept in their own tables. They are
+written in batches: the rows of a tick are queued and written by commit(), which the
+trader calls at the end of every tick, in a single database transaction. Day trades
+and performance history are queried in SQL, so a restarted trader has its full state
+without replaying anything. The rows that are not written yet are merged into the
+results of these queries, so they never wait for a write. Equity points older than the
+ranges that keep every point are pruned to the last point of each day, and loaded
+ranges are reduced to performance_storage_size points with the min/max bucketing of
+EquityBuffer, so the table and the history stay bounded.
+
+With async_writes=True, the writes are made by a background thread with its own
+engine, so the latency of the database is not added to the ticks of the trader.
+store() and commit() queue the rows, and the bars queued for a series are written
+together, in batches of batch_size rows. Until they are written, load() merges them
+from an in-memory overlay, so stored bars are visible immediately.
 """
 
+PRICE_FIELDS = ["open", "high", "low", "close", "volume"]
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "busy_timeout": 5000,
+}
+
 Base = declarative_base()
 
 
@@ -35,19 +106,175 @@ class Asset(Base):
         open: {self.open_} \t high: {self.high} \t low: {self.low} \t close: {self.close} \t volume: {self.volume}"""
 
 
+class Transaction(Base):
+    """
+    This class defines what is in each row in the transactions table, one per filled order.
+    """
+
+    __tablename__ = "transactions"
+    id = Column("id", Integer, primary_key=True, autoincrement=True)
+    timestamp = Column("timestamp", DateTime, nullable=False)
+    # The trading day of the fill, in the timezone of its timestamp
+    day = Column("day", Date, nullable=False)
+    algorithm_name = Column("algorithm_name", String)
+    symbol = Column("symbol", String, nullable=False)
+    side = Column("side", String, nullable=False)
+    quantity = Column("quantity", Float)
+    price = Column("price", Float)
+    daytrade = Column("daytrade", Boolean, nullable=False, default=False)
+    # Set when the transaction is queued, so queued rows can be told apart from written ones
+    uid = Column("uid", String(32), nullable=False, unique=True)
+
+    __table_args__ = (
+        Index("ix_transactions_timestamp", "timestamp"),
+        Index("ix_transactions_symbol_day", "symbol", "day"),
+        Index("ix_transactions_daytrade", "daytrade", "timestamp"),
+    )
+
+
+class Performance(Base):
+    """
+    This class defines what is in each row in the performance table, one per equity point.
+    """
+
+    __tablename__ = "performance"
+    timestamp = Column("timestamp", DateTime, primary_key=True)
+    equity = Column("equity", Float)
+
+
+class Calendar(Base):
+    """
+    This class defines what is in each row in the calendar table, one per date.
+    """
+
+    __tablename__ = "calendar"
+    date = Column("date", Date, primary_key=True)
+    is_open = Column("is_open", Boolean)
+    open_at = Column("open_at", DateTime)
+    close_at = Column("close_at", DateTime)
+    fetched_at = Column("fetched_at", DateTime)
+
+
 class DBStorage(BaseStorage):
     """
     An extension of the basic storage that saves data in SQL tables.
     """
 
-    def __init__(self, db: str = "sqlite:///data.db") -> None:
+    def __init__(
+        self,
+        db: str = "sqlite:///data.db",
+        compact: bool = False,
+        batch_size: int = 1000,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pragmas: Dict[str, Union[str, int]] = None,
+        cache_size: int = 256,
+        async_writes: bool = False,
+        max_pending: int = 1000,
+        backpressure: str = "block",
+        performance_storage_size: int = 200,
+        performance_storage_limit: bool = True,
+    ) -> None:
         """
         Adds a directory to save data to. Loads any data that is currently in the
         directory.
+        :compact: whether to return prices as float32 and volume as uint64, see BaseStorage.
+        :batch_size: the number of rows written by each statement when storing bars.
+        :pool_size: the number of connections kept open in the pool.
+        :max_overflow: the number of connections that can be opened beyond pool_size.
+        :pragmas: SQLite pragmas that override the ones in SQLITE_PRAGMAS.
+        :cache_size: the number of load() results that are cached, 0 disables the cache.
+        :async_writes: if True, writes are made by a background thread, see the module docstring.
+        :max_pending: the maximum number of series and commits queued when async_writes is True.
+        :backpressure: 'block' or 'inline', what to do when the queue is full, see WriteBehind.
+        :performance_storage_size: the maximum number of points load_performance() returns.
+        :performance_storage_limit: if False, load_performance() returns every point of the range.
+        """
+        super().__init__(
+            performance_storage_size=performance_storage_size,
+            performance_storage_limit=performance_storage_limit,
+            compact=compact,
+        )
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+
+        url = make_url(db)
+        options = {"pool_pre_ping": True}
+        # In-memory SQLite databases live in a single connection, so they are not pooled.
+        if url.get_backend_name() != "sqlite" or url.database not in (None, "", ":memory:"):
+            options.update(pool_size=pool_size, max_overflow=max_overflow)
+        self.pragmas = {**SQLITE_PRAGMAS, **(pragmas or {})} if url.get_backend_name() == "sqlite" else {}
+        self.engine = self._create_engine(url, options)
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(self.engine)
+
+        # The writer thread has its own engine, so its connections are never waited on by reads.
+        self.writer = None
+        self.write_engine = self.engine
+        # Bars queued for the writer, as a list of batches of rows per (symbol, interval). The rows
+        # are built by store(), so the writer never reads a DataFrame the caller still uses.
+        self.unflushed: Dict[Tuple[str, str], List[List[dict]]] = {}
+        self.unflushed_lock = threading.Lock()
+        if async_writes:
+            self.write_engine = self._create_engine(url, options)
+            self.writer = WriteBehind(max_pending, backpressure, fsync=False)
+
+        # Maps (symbol, interval, query) to the result of a load, in least recently used order.
+        self.cache = OrderedDict()
+        # Counts the writes to each (symbol, interval), so loads that raced a write are not cached.
+        self.versions = {}
+        self.cache_lock = threading.Lock()
+
+        # Rows of the current tick that commit() has not written yet. pending_lock is only held
+        # to queue rows or take the queue, which is kept in the writing_* attributes until it is
+        # written, so queries can merge the rows that are not in the tables yet without waiting
+        # for the write. write_lock is held for the whole write, so one batch is written at a time.
+        self.pending_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.pending_transactions: List[dict] = []
+        self.pending_performance: Dict[dt.datetime, float] = {}
+        self.pending_calendar: Dict[dt.date, dict] = {}
+        self.writing_transactions: List[dict] = []
+        self.writing_performance: Dict[dt.datetime, float] = {}
+        # Maps (symbol, day) to the side of the last transaction stored by this storage
+        self.last_sides: Dict[Tuple[str, dt.date], str] = {}
+
+        # The calendar is small and read on every tick, so it is also kept in memory.
+        with self.engine.connect() as conn:
+            for row in conn.execute(select(Calendar.__table__)).mappings():
+                day = {name: self._from_db_time(row[name]) for name in ("open_at", "close_at")}
+                day["is_open"] = row["is_open"]
+                self.storage_calendar.add(row["date"], day, self._from_db_time(row["fetched_at"]))
+
+    def _create_engine(self, url, options: Dict[str, Any]):
+        engine = create_engine(url, **options)
+        if self.pragmas:
+            event.listen(engine, "connect", self._set_pragmas)
+        return engine
+
+    def close(self) -> None:
+        """
+        Writes the pending rows and closes the pooled connections to the database.
+        """
+        super().close()
+        if self.writer is not None:
+            self.writer.close()
+            self.write_engine.dispose()
+        self.engine.dispose()
+
+    def flush(self) -> None:
+        """
+        Writes the bars, transactions, equity points and market hours that are still pending.
         """
-        engine = create_engine(db)
-        Base.metadata.create_all(engine)
-        self.Session = sessionmaker(engine)
+        self.commit()
+        if self.writer is not None:
+            self.writer.flush()
+
+    def _set_pragmas(self, dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in self.pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
 
     def store(
         self,
@@ -65,36 +292,191 @@ class DBStorage(BaseStorage):
             index
         """
 
-        if not data.empty:
-            data.index = normalize_pandas_dt_index(data)
-            data.columns = [column[1] for column in data.columns]
-            data.rename(columns={"open": "open_"}, inplace=True)
-            data["timestamp"] = data.index
-            data["symbol"] = symbol
-            data["interval"] = interval
-            data = data.to_dict("records")
+        if data.empty:
+            return
+        if self.writer is None:
+            self._upsert(self._to_rows(symbol, interval, data))
+            self._invalidate(symbol, interval)
+            return
 
-            with self.Session.begin() as session:
-                [session.merge(Asset(**d)) for d in data]
-                session.commit()
+        rows = self._to_rows(symbol, interval, data)
+        with self.unflushed_lock:
+            self.unflushed.setdefault((symbol, interval), []).append(rows)
+        self._invalidate(symbol, interval)
+        self.writer.submit(("price", symbol, interval), partial(self._write_unflushed, symbol, interval))
+
+    def _write_unflushed(self, symbol: str, interval: str) -> None:
+        """
+        Writes the queued bars of a series. Runs in the writer thread.
+        """
+        with self.unflushed_lock:
+            batches = list(self.unflushed.get((symbol, interval), []))
+        if not batches:
+            return
+        # A multi-row upsert cannot touch a row twice, so only the newest version of a bar is written.
+        rows = {}
+        for batch in batches:
+            rows.update((row["timestamp"], row) for row in batch)
+        self._upsert(list(rows.values()), self.write_engine)
+
+        # Batches queued while the bars were written stay in the overlay for the next write.
+        with self.unflushed_lock:
+            queued = self.unflushed[(symbol, interval)]
+            del queued[: len(batches)]
+            if not queued:
+                del self.unflushed[(symbol, interval)]
+
+    def _to_rows(self, symbol: str, interval: str, data: pd.DataFrame) -> List[dict]:
+        """
+        Converts a frame of bars to rows of the asset table, keyed by column name.
+        """
+        index = normalize_pandas_dt_index(data)
+        if index.tz is not None:
+            index = index.tz_convert("UTC").tz_localize(None)
+        fields = [field for field in PRICE_FIELDS if (symbol, field) in data]
+        columns = [index.to_pydatetime()]
+        columns += [data[(symbol, field)].to_numpy(dtype=np.float64).tolist() for field in fields]
+        names = ["timestamp"] + fields
+        return [dict(zip(names, values), symbol=symbol, interval=interval) for values in zip(*columns)]
+
+    def _insert(self, table=Asset.__table__):
+        """
+        Returns an INSERT statement for the table that supports ON CONFLICT, or None
+        if the database does not have one.
+        """
+        dialect = self.engine.dialect.name
+        if dialect == "sqlite":
+            return sqlite.insert(table)
+        elif dialect == "postgresql":
+            return postgresql.insert(table)
+        return None
+
+    @staticmethod
+    def _on_conflict_update(stmt, fields: List[str]):
+        """
+        Makes an INSERT statement replace the given fields of rows that already exist.
+        """
+        return stmt.on_conflict_do_update(
+            index_elements=list(stmt.table.primary_key.columns),
+            set_={name: stmt.excluded[name] for name in fields},
+        )
+
+    def _upsert(self, rows: List[dict], engine=None) -> None:
+        """
+        Inserts rows into the asset table, replacing the prices of rows that already exist.
+        """
+        engine = engine or self.engine
+        stmt = self._insert()
+        if stmt is None:
+            self._merge(rows, engine)
+            return
+
+        stmt = self._on_conflict_update(stmt, [name for name in PRICE_FIELDS if name in rows[0]])
+        with engine.begin() as conn:
+            for i in range(0, len(rows), self.batch_size):
+                conn.execute(stmt, rows[i : i + self.batch_size])
+
+    def _merge(self, rows: List[dict], engine=None) -> None:
+        """
+        Writes rows one at a time through the ORM, for databases without an upsert statement.
+        """
+        with Session(engine or self.engine) as session, session.begin():
+            for row in rows:
+                session.merge(Asset(**{"open_" if name == "open" else name: value for name, value in row.items()}))
 
     def aggregate(self, symbol: str, base: str, target: str, remove_duplicate: bool = True) -> None:
         """
         Aggregates the stock data from the interval specified in 'from' to 'to'.
+
+        Only the bars from the newest stored bucket of the target interval onwards are
+        aggregated, since that bucket may have been partial, and the buckets are written
+        with a single INSERT ... SELECT ... GROUP BY statement. With async_writes, or on
+        databases without an upsert, the buckets are built with aggregate_df() and stored.
         """
+        target_interval = interval_string_to_enum(target) if isinstance(target, str) else target
+        table = Asset.__table__
+        stmt = self._insert()
+
+        if self.writer is not None or stmt is None:
+            # Queued bars are not in the database yet, so the buckets are built from load(), which has them.
+            last = self.load(symbol, target, fields="close", limit=1)
+            since = None if last is None or last.empty else last.index[-1]
+            data = self.load(symbol, base, start=since)
+            if data is not None and not data.empty:
+                self.store(symbol, target, aggregate_df(data, target_interval))
+            return
 
-        data = self.load(symbol, base)
-        agg_data = self._append(self.load(symbol, target), aggregate_df(data, target), remove_duplicate)
-        self.store(symbol, target, agg_data)
+        with self.engine.connect() as conn:
+            since = conn.execute(
+                select(func.max(table.c.timestamp)).where(self._series_filter(symbol, target))
+            ).scalar()
+
+        conditions = [self._series_filter(symbol, base)]
+        if since is not None:
+            conditions.append(table.c.timestamp >= since)
+        with self.engine.begin() as conn:
+            bucket = self._bucket(target_interval)
+            window = {"partition_by": bucket, "order_by": table.c.timestamp, "rows": (None, None)}
+            bars = (
+                select(
+                    bucket.label("bucket"),
+                    func.first_value(table.c.open).over(**window).label("open"),
+                    table.c.high,
+                    table.c.low,
+                    func.last_value(table.c.close).over(**window).label("close"),
+                    table.c.volume,
+                )
+                .where(and_(*conditions))
+                .subquery()
+            )
+            # Every bar of a bucket has the same first open and last close.
+            buckets = (
+                select(
+                    literal(symbol, String),
+                    literal(target, String),
+                    bars.c.bucket,
+                    func.max(bars.c.open),
+                    func.max(bars.c.high),
+                    func.min(bars.c.low),
+                    func.max(bars.c.close),
+                    func.sum(bars.c.volume),
+                )
+                # SQLite needs a WHERE clause to parse an INSERT ... SELECT with ON CONFLICT
+                .where(true())
+                .group_by(bars.c.bucket)
+            )
+            stmt = stmt.from_select(["symbol", "interval", "timestamp"] + PRICE_FIELDS, buckets)
+            conn.execute(self._on_conflict_update(stmt, PRICE_FIELDS))
+        self._invalidate(symbol, target)
+
+    def _bucket(self, interval: Interval):
+        """
+        Returns an SQL expression of the start of the bucket of the given interval that each bar
+        falls in. Buckets are aligned to the epoch, like the bars of aggregate_df().
+        """
+        seconds = int(interval_to_timedelta(interval).total_seconds())
+        timestamp = Asset.__table__.c.timestamp
+        if self.engine.dialect.name == "postgresql":
+            epoch = func.floor(func.extract("epoch", timestamp) / seconds) * seconds
+            return func.timezone("UTC", func.to_timestamp(epoch))
+        epoch = cast(func.strftime("%s", timestamp), Integer) // seconds * seconds
+        # SQLite stores DateTime columns as text, in the format of the bars written by store()
+        return func.strftime("%Y-%m-%d %H:%M:%S", epoch, "unixepoch").concat(".000000")
 
     def reset(self, symbol: str, interval: str) -> None:
         """
         Resets to an empty dataframe
         """
+        if self.writer is not None:
+            with self.unflushed_lock:
+                self.unflushed.pop((symbol, interval), None)
+            # Wait for a write of the series that may be in progress
+            self.writer.flush()
 
         with self.Session.begin() as session:
-            session.execute(Asset.__table__.delete().where(Asset.symbol == symbol and Asset.interval == interval))
+            session.execute(Asset.__table__.delete().where(self._series_filter(symbol, interval)))
             session.commit()
+        self._invalidate(symbol, interval)
 
     def load(
         self,
@@ -102,49 +484,197 @@ class DBStorage(BaseStorage):
         interval: str = "",
         start: dt.datetime = None,
         end: dt.datetime = None,
-    ) -> pd.DataFrame:
+        fields: Union[str, List[str]] = None,
+        as_numpy: bool = False,
+        upcast: bool = False,
+        limit: int = None,
+    ) -> Union[pd.DataFrame, np.ndarray]:
         """
-        Loads the stock data given the symbol and interval. May return only
-        a subset of the data if start and end are given and there is a gap
-        between the last data point and the given end datetime.
+        Loads the stock data given the symbol and interval. The range and limit are applied
+        in the query, so only the requested rows are read from the database.
 
-        If the specified interval does not exist, it will attempt to generate it by
-        aggregating data.
         :symbol: a stock or crypto
         :interval: the interval between each data point, must be at least
              1 minute
-        :start: a datetime object
+        :start: a datetime object, naive datetimes are assumed to be in UTC
+        :end: a datetime object, naive datetimes are assumed to be in UTC
+        :fields: a price column, or a list of them, to return instead of all columns
+        :as_numpy: if True, returns a numpy array instead of a DataFrame. The array is 1D if
+            fields is a single column, and has one column per field otherwise.
+        :upcast: if True, the data is returned as float64 even if compact is True.
+        :limit: if given, only the newest limit rows in the range are returned.
+        """
+        if not interval:
+            # If the interval is not given, return the data with the
+            # smallest interval that has data in the range.
+            for interval in sorted(self._intervals(symbol), key=interval_string_to_enum):
+                data = self.load(symbol, interval, start, end, fields, as_numpy, upcast, limit)
+                if data is not None:
+                    return data
+            return None
+
+        if self.cache_size <= 0:
+            return self._query(symbol, interval, start, end, fields, as_numpy, upcast, limit)
+
+        fields_key = tuple(fields) if isinstance(fields, list) else fields
+        key = (symbol, interval, start, end, fields_key, as_numpy, upcast, limit)
+        with self.cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self._copy(self.cache[key])
+            version = self.versions.get((symbol, interval), 0)
+
+        data = self._query(symbol, interval, start, end, fields, as_numpy, upcast, limit)
+        with self.cache_lock:
+            if self.versions.get((symbol, interval), 0) == version:
+                self.cache[key] = data
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return self._copy(data)
+
+    def _intervals(self, symbol: str) -> List[str]:
+        """
+        Returns the intervals the symbol has bars of, in the database or queued.
+        """
+        with self.unflushed_lock:
+            intervals = {key[1] for key in self.unflushed if key[0] == symbol}
+        with self.engine.connect() as conn:
+            intervals.update(conn.execute(select(Asset.interval).where(Asset.symbol == symbol).distinct()).scalars())
+        return list(intervals)
+
+    @staticmethod
+    def _copy(data: Union[pd.DataFrame, np.ndarray, None]) -> Union[pd.DataFrame, np.ndarray, None]:
+        # Callers may modify what they load, so the cached results are never returned directly.
+        return None if data is None else data.copy()
+
+    def _invalidate(self, symbol: str, interval: str) -> None:
+        """
+        Drops the cached loads of a series after it was written to.
         """
+        with self.cache_lock:
+            self.versions[(symbol, interval)] = self.versions.get((symbol, interval), 0) + 1
+            for key in [key for key in self.cache if key[:2] == (symbol, interval)]:
+                del self.cache[key]
+
+    def _query(
+        self,
+        symbol: str,
+        interval: str,
+        start: dt.datetime,
+        end: dt.datetime,
+        fields: Union[str, List[str]],
+        as_numpy: bool,
+        upcast: bool,
+        limit: int,
+    ) -> Union[pd.DataFrame, np.ndarray]:
+        """
+        Reads bars from the database and the overlay of queued bars, see load().
+        """
+        # The overlay is read first: bars that are written in the meantime are then read
+        # from the database, or from both, but never from neither.
+        with self.unflushed_lock:
+            batches = list(self.unflushed.get((symbol, interval), []))
+
+        names = ["open", "close", "high", "low", "volume"] if fields is None else fields
+        if isinstance(names, str):
+            names = [names]
+        # Only select the requested columns
+        columns = [Asset.__table__.c[name] for name in names]
+
+        # The conditions match the primary key of (symbol, interval, timestamp), so the
+        # query is a seek on its index rather than a scan of the table.
+        conditions = [self._series_filter(symbol, interval)]
+        if start is not None:
+            conditions.append(Asset.timestamp >= self._to_db_time(start))
+        if end is not None:
+            conditions.append(Asset.timestamp <= self._to_db_time(end))
+        query = select(Asset.timestamp, *columns).where(and_(*conditions))
+        if limit is None:
+            query = query.order_by(Asset.timestamp)
+        else:
+            query = query.order_by(Asset.timestamp.desc()).limit(limit)
 
         with self.Session.begin() as session:
-            data = session.execute(
-                select(
-                    Asset.timestamp,
-                    Asset.open_,
-                    Asset.close,
-                    Asset.high,
-                    Asset.low,
-                    Asset.volume,
-                ).where(Asset.symbol == symbol and Asset.interval == interval)
-            )
-            data = pd.DataFrame(data, columns=["timestamp", "open_", "close", "high", "low", "volume"])
+            data = pd.DataFrame(session.execute(query), columns=["timestamp"] + names)
+            if data.empty and not batches:
+                exists = session.execute(select(Asset.timestamp).where(conditions[0]).limit(1)).first()
+                if exists is None:
+                    return None
 
-            if data.empty:
-                return None
+        if limit is not None:
+            data = data.iloc[::-1]
+        data.set_index("timestamp", inplace=True)
+        data.index = pd.DatetimeIndex(data.index).tz_localize(tz="UTC")
+        if batches:
+            data = self._merge_unflushed(data, batches, names, start, end, limit)
+        if self.compact and not upcast:
+            data = compact_df(data, symbol)
 
-            data.set_index("timestamp", inplace=True)
-            data.index = data.index.tz_localize(tz="UTC")
-            data.rename(columns={"open_": "open"}, inplace=True)
-            data.columns = pd.MultiIndex.from_product([[symbol], data.columns])
+        if as_numpy:
+            values = data.to_numpy()
+            return values[:, 0] if isinstance(fields, str) else values
 
-        # If the start and end are not defined, then set them to the
-        # beginning and end of the data.
-        if start is None:
-            start = data.index[0]
-        if end is None:
-            end = data.index[-1]
+        data.columns = pd.MultiIndex.from_product([[symbol], data.columns])
+        return data
+
+    def _merge_unflushed(
+        self,
+        data: pd.DataFrame,
+        batches: List[List[dict]],
+        names: List[str],
+        start: dt.datetime,
+        end: dt.datetime,
+        limit: int,
+    ) -> pd.DataFrame:
+        """
+        Adds the queued bars in the range to bars read from the database. Queued bars replace
+        the bars with the same timestamp.
+        """
+        queued = pd.DataFrame([row for batch in batches for row in batch]).set_index("timestamp")
+        queued = queued.reindex(columns=names)
+        queued.index = pd.DatetimeIndex(queued.index).tz_localize("UTC")
+        data = pd.concat([data, queued]) if len(data) else queued
+        data = data[~data.index.duplicated(keep="last")].sort_index()
+        if start is not None:
+            data = data[data.index >= pd.Timestamp(self._to_ns(start), tz="UTC")]
+        if end is not None:
+            data = data[data.index <= pd.Timestamp(self._to_ns(end), tz="UTC")]
+        if limit is not None:
+            data = data.iloc[-limit:]
+        data.index.name = "timestamp"
+        return data
+
+    @staticmethod
+    def _series_filter(symbol: str, interval: str):
+        return and_(Asset.symbol == symbol, Asset.interval == interval)
+
+    @staticmethod
+    def _to_db_time(time: dt.datetime) -> dt.datetime:
+        """
+        Converts a time to the naive UTC datetime stored in the timestamp column.
+        """
+        return pd.Timestamp(BaseStorage._to_ns(time)).to_pydatetime()
 
-        return data.loc[(data.index >= start) & (data.index <= end)]
+    def load_panel(
+        self,
+        symbols: List[str],
+        interval: str,
+        field: str = "close",
+        start: dt.datetime = None,
+        end: dt.datetime = None,
+        as_numpy: bool = False,
+    ) -> Union[pd.DataFrame, np.ndarray]:
+        """
+        Loads one price field of several symbols, aligned on a shared timestamp index.
+        The database does not keep data in memory, so each symbol is loaded and aligned here.
+        """
+        series = {}
+        for symbol in symbols:
+            data = self.load(symbol, interval, start, end, fields=[field])
+            if data is not None:
+                series[symbol] = data[(symbol, field)]
+        panel = pd.DataFrame(series, columns=symbols).sort_index()
+        return panel.to_numpy() if as_numpy else panel
 
     def data_range(self, symbol: str, interval: str) -> Tuple[dt.datetime]:
         return super().data_range(symbol, interval)
@@ -156,3 +686,266 @@ class DBStorage(BaseStorage):
         remove_duplicate: bool = True,
     ) -> pd.DataFrame:
         return super()._append(current_data, new_data, remove_duplicate)
+
+    @staticmethod
+    def _from_db_time(time: dt.datetime) -> pd.Timestamp:
+        """
+        Converts a naive UTC datetime read from the database to a UTC timestamp.
+        """
+        return None if time is None else pd.Timestamp(time).tz_localize("UTC")
+
+    # ------------------ Transactions ------------------ #
+
+    def store_transaction(
+        self,
+        timestamp: dt.datetime,
+        algorithm_name: str,
+        symbol: str,
+        side: str,
+        quantity: int,
+        price: float,
+    ) -> None:
+        """
+        Queues a filled order, to be written by the next commit().
+        """
+        day = timestamp.date()
+        # Crypto is not subject to day trade rules, and since shorting is not supported,
+        # a sell after a buy of the same symbol on the same day is a day trade.
+        check = side == "sell" and symbol_type(symbol) != "CRYPTO"
+        stored_side = self._stored_side(symbol, day) if check and (symbol, day) not in self.last_sides else None
+        with self.pending_lock:
+            daytrade = check and self.last_sides.get((symbol, day), stored_side) == "buy"
+            self.last_sides[(symbol, day)] = side
+            self.pending_transactions.append(
+                {
+                    "timestamp": self._to_db_time(timestamp),
+                    "day": day,
+                    "algorithm_name": algorithm_name,
+                    "symbol": symbol,
+                    "side": side,
+                    "quantity": quantity,
+                    "price": price,
+                    "daytrade": daytrade,
+                    "uid": uuid.uuid4().hex,
+                }
+            )
+
+        debugger.debug(f"Stored transaction: {timestamp}, {algorithm_name}, {symbol}, {side}, {quantity}, {price}")
+        if daytrade:
+            debugger.debug(f"Stored daytrade: {timestamp}, {symbol}")
+
+    def _stored_side(self, symbol: str, day: dt.date) -> str:
+        """
+        Returns the side of the last transaction of the symbol on the given day in the table,
+        or None. Only used for symbols this storage has no transaction of on that day, whose
+        transactions were all written by a previous run.
+        """
+        table = Transaction.__table__
+        query = (
+            select(table.c.side)
+            .where(and_(table.c.symbol == symbol, table.c.day == day))
+            .order_by(table.c.timestamp.desc(), table.c.id.desc())
+            .limit(1)
+        )
+        with self.engine.connect() as conn:
+            return conn.execute(query).scalar()
+
+    def count_daytrades(self, since: dt.datetime) -> int:
+        """
+        Returns the number of day trades made at or after the given time.
+        """
+        since = self._to_db_time(since)
+        table = Transaction.__table__
+        queued = [row for row in self._queued_transactions() if row["daytrade"] and row["timestamp"] >= since]
+        # Queued rows the writer has written since are counted once, from the queue.
+        conditions = [table.c.daytrade == true(), table.c.timestamp >= since]
+        if queued:
+            conditions.append(table.c.uid.not_in([row["uid"] for row in queued]))
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.count()).where(*conditions)).scalar() + len(queued)
+
+    def load_transaction(self) -> pd.DataFrame:
+        columns = ["timestamp", "algorithm_name", "symbol", "side", "quantity", "price"]
+        return self._read_transactions(columns)
+
+    def load_daytrade(self) -> pd.DataFrame:
+        return self._read_transactions(["timestamp", "symbol"], daytrade_only=True)
+
+    def _queued_transactions(self) -> List[dict]:
+        """
+        Returns the transactions that are queued or being written, in the order they were stored.
+        """
+        with self.pending_lock:
+            return self.writing_transactions + self.pending_transactions
+
+    def _read_transactions(self, columns: List[str], daytrade_only: bool = False) -> pd.DataFrame:
+        table = Transaction.__table__
+        queued = [row for row in self._queued_transactions() if row["daytrade"] or not daytrade_only]
+        conditions = [table.c.daytrade == true()] if daytrade_only else []
+        if queued:
+            conditions.append(table.c.uid.not_in([row["uid"] for row in queued]))
+        query = select(*[table.c[name] for name in columns]).where(*conditions).order_by(table.c.timestamp, table.c.id)
+        with self.engine.connect() as conn:
+            data = pd.DataFrame(conn.execute(query).all(), columns=columns)
+        if queued:
+            queued = pd.DataFrame(queued, columns=columns)
+            data = pd.concat([data, queued], ignore_index=True) if len(data) else queued
+            data = data.sort_values("timestamp", kind="stable", ignore_index=True)
+        data["timestamp"] = pd.DatetimeIndex(data["timestamp"]).tz_localize("UTC")
+        data.index = pd.DatetimeIndex(data["timestamp"])
+        return data
+
+    # ------------------ Performance ------------------ #
+
+    def init_performance_data(self, equity: float, timestamp: dt.datetime) -> None:
+        """
+        Adds the first equity point of a run. The history of previous runs is kept in the database.
+        """
+        self.add_performance_data(equity, timestamp)
+
+    def add_performance_data(self, equity: float, timestamp: dt.datetime) -> None:
+        """
+        Queues an equity point, to be written by the next commit().
+        """
+        with self.pending_lock:
+            self.pending_performance[self._to_db_time(timestamp)] = equity
+        debugger.debug("Performance data added")
+
+    def load_performance(self, interval: str) -> pd.DataFrame:
+        """
+        Returns the equity history of the given range, one of '1DAY', '1WEEK', '1MONTH', '3MONTH', '1YEAR' or 'ALL'.
+        Ranges from '3MONTH' on have one point per day, the last point of the day.
+        """
+        names = [name for name, _ in self.performance_history_intervals]
+        days = dict(self.performance_history_intervals)[interval]
+        daily = names.index(interval) >= 3
+        table = Performance.__table__
+        # Equity points that are not in the table yet, they replace the stored ones at the same time.
+        with self.pending_lock:
+            queued = {**self.writing_performance, **self.pending_performance}
+
+        with self.engine.connect() as conn:
+            conditions = []
+            if days is not None:
+                stored = conn.execute(select(func.max(table.c.timestamp))).scalar()
+                newest = max([*queued, *([stored] if stored else [])], default=None)
+                if newest is not None:
+                    since = newest - dt.timedelta(days=days)
+                    conditions.append(table.c.timestamp >= since)
+                    queued = {time: equity for time, equity in queued.items() if time >= since}
+            if daily:
+                last_of_day = select(func.max(table.c.timestamp)).where(*conditions)
+                conditions = [table.c.timestamp.in_(last_of_day.group_by(func.date(table.c.timestamp)))]
+            query = select(table.c.timestamp, table.c.equity).where(*conditions).order_by(table.c.timestamp)
+            rows = dict(conn.execute(query).all())
+
+        if queued:
+            rows = dict(sorted({**rows, **queued}.items()))
+            if daily:
+                last = {time.date(): time for time in rows}
+                rows = {time: rows[time] for time in last.values()}
+
+        equity = np.array(list(rows.values()), dtype=np.float64)
+        keep = np.arange(len(equity))
+        size = max(self.performance_storage_size, BUCKET_SIZE * 2)
+        while self.performance_storage_limit and len(keep) > size:
+            keep = keep[min_max_buckets(equity[keep])]
+        index = pd.DatetimeIndex(list(rows)).tz_localize("UTC")[keep]
+        return pd.DataFrame({"equity": equity[keep]}, index=index)
+
+    # ------------------ Calendar ------------------ #
+
+    def add_calendar_data(self, data: Dict[str, Any], date: dt.date = None) -> None:
+        """
+        Stores the market hours of a date, and queues them to be written by the next commit().
+        """
+        super().add_calendar_data(data, date)
+        now = getattr(self, "stats", None) and self.stats.timestamp
+        date = date or now.date()
+        row = {name: None if data[name] is None else self._to_db_time(data[name]) for name in ("open_at", "close_at")}
+        row.update(date=date, is_open=bool(data["is_open"]), fetched_at=now and self._to_db_time(now))
+        with self.pending_lock:
+            self.pending_calendar[date] = row
+
+    # ------------------ Batched writes ------------------ #
+
+    def commit(self) -> None:
+        """
+        Writes the transactions, equity points and market hours queued since the last
+        commit in a single database transaction. With async_writes, they are written by the
+        writer thread, and remain visible to the queries of this storage until then.
+        """
+        if self.writer is not None:
+            self.writer.submit("commit", partial(self._write_pending, self.write_engine))
+        else:
+            self._write_pending(self.engine)
+
+    def _write_pending(self, engine) -> None:
+        with self.write_lock:
+            # The queue is swapped for an empty one, so rows can be queued during the write.
+            with self.pending_lock:
+                transactions, performance, calendar = (
+                    self.pending_transactions,
+                    self.pending_performance,
+                    self.pending_calendar,
+                )
+                if not (transactions or performance or calendar):
+                    return
+                self.pending_transactions, self.pending_performance, self.pending_calendar = [], {}, {}
+                self.writing_transactions, self.writing_performance = transactions, performance
+
+            try:
+                with Session(engine) as session, session.begin():
+                    if transactions:
+                        session.execute(Transaction.__table__.insert(), transactions)
+                    rows = [{"timestamp": time, "equity": equity} for time, equity in performance.items()]
+                    self._replace(session, Performance, rows, ["equity"])
+                    if rows:
+                        self._prune_performance(session)
+                    self._replace(
+                        session, Calendar, list(calendar.values()), ["is_open", "open_at", "close_at", "fetched_at"]
+                    )
+            except Exception:
+                # The rows are put back in front of the ones queued since, so a failed commit is
+                # retried by the next one. Rows queued since replace the ones with the same key.
+                with self.pending_lock:
+                    self.pending_transactions = transactions + self.pending_transactions
+                    self.pending_performance = {**performance, **self.pending_performance}
+                    self.pending_calendar = {**calendar, **self.pending_calendar}
+                    self.writing_transactions, self.writing_performance = [], {}
+                raise
+            with self.pending_lock:
+                self.writing_transactions, self.writing_performance = [], {}
+
+    def _prune_performance(self, session) -> None:
+        """
+        Deletes the equity points older than the longest range that keeps every point, except the
+        last point of each day, which is all the longer ranges read.
+        """
+        table = Performance.__table__
+        newest = session.execute(select(func.max(table.c.timestamp))).scalar()
+        days = max(days for _, days in self.performance_history_intervals[:3])
+        cutoff = newest - dt.timedelta(days=days)
+        # The points to keep are selected from a derived table, as MySQL cannot select from the
+        # table it deletes from.
+        last_of_day = (
+            select(func.max(table.c.timestamp).label("timestamp"))
+            .where(table.c.timestamp < cutoff)
+            .group_by(func.date(table.c.timestamp))
+            .subquery()
+        )
+        keep = select(last_of_day.c.timestamp)
+        session.execute(delete(table).where(table.c.timestamp < cutoff, table.c.timestamp.not_in(keep)))
+
+    def _replace(self, session, model, rows: List[dict], fields: List[str]) -> None:
+        """
+        Inserts rows into the table of the model, replacing the rows with the same primary key.
+        """
+        if not rows:
+            return
+        stmt = self._insert(model.__table__)
+        if stmt is None:
+            for row in rows:
+                session.merge(model(**row))
+        else:
+            session.execute(self._on_conflict_update(stmt, fields), rows)
@@ -0,0 +1,192 @@
+import json
+import os
+from os.path import isfile
+from typing import Dict
+
+import numpy as np
+
+from harvest.storage.price_buffer import PRICE_COLUMNS, PriceBuffer
+
+"""
+This module implements a PriceBuffer backed by a memory-mapped file.
+
+The file has a fixed-layout header followed by an array of records, one per bar, each
+holding an int64 timestamp in UTC epoch nanoseconds and the OHLCV columns:
+
+    bytes 0-7      magic, b"HRVSTMAP"
+    bytes 8-15     format version
+    bytes 16-23    number of bars written
+    bytes 24-31    number of bars the file has room for
+    bytes 32-39    length of the record layout
+    bytes 40-      record layout, as JSON of [name, dtype] pairs
+
+The records are accessed through numpy.memmap, so the timestamps and columns are
+views of the file, and processes that map the same file share its pages instead of
+each holding a copy. The file grows in preallocated chunks of bars, and bars are only
+appended, except for a correction of the last bars, which is rewritten in place.
+"""
+
+MAGIC = b"HRVSTMAP"
+VERSION = 1
+HEADER_SIZE = 512
+
+
+class MappedBuffer(PriceBuffer):
+    """
+    A PriceBuffer whose bars are stored in a memory-mapped file.
+
+    The file keeps every bar that was written. If bounded is True, only the newest
+    capacity bars are visible, like in a PriceBuffer.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        capacity: int = 200,
+        bounded: bool = True,
+        index_name: str = "timestamp",
+        dtypes: Dict[str, np.dtype] = None,
+        chunk_rows: int = 4096,
+        readonly: bool = False,
+    ) -> None:
+        """
+        :path: The file of the series. It is created if it does not exist, in which case
+            dtypes gives the dtype of each price column, float64 by default.
+        :capacity: The number of bars that are visible when bounded is True.
+        :chunk_rows: The number of bars the file grows by when it is full.
+        :readonly: If True, the file is mapped read-only, and refresh() picks up the bars
+            written by another process.
+        """
+        self.path = path
+        self.capacity = max(int(capacity), 1)
+        self.bounded = bounded
+        self.index_name = index_name
+        self.chunk_rows = max(int(chunk_rows), 1)
+        self.readonly = readonly
+
+        if isfile(path):
+            with open(path, "rb") as f:
+                header = f.read(HEADER_SIZE)
+            if header[:8] != MAGIC:
+                raise ValueError(f"{path} is not a memory-mapped price file")
+            length = int(np.frombuffer(header, dtype=np.int64, count=1, offset=32)[0])
+            layout = json.loads(header[40 : 40 + length].decode())
+            self.dtypes = {name: np.dtype(dtype) for name, dtype in layout[1:]}
+        else:
+            if readonly:
+                raise FileNotFoundError(path)
+            self.dtypes = {name: np.dtype(np.float64) for name in PRICE_COLUMNS}
+            self.dtypes.update({name: np.dtype(dtype) for name, dtype in (dtypes or {}).items()})
+        self._record = np.dtype([("timestamp", np.int64)] + [(name, self.dtypes[name]) for name in PRICE_COLUMNS])
+        if not isfile(path):
+            self._create()
+        self._map()
+
+    def _create(self) -> None:
+        layout = json.dumps([["timestamp", "<i8"]] + [[name, self.dtypes[name].str] for name in PRICE_COLUMNS])
+        header = bytearray(HEADER_SIZE)
+        header[:8] = MAGIC
+        header[8:40] = np.array([VERSION, 0, self.chunk_rows, len(layout)], dtype=np.int64).tobytes()
+        header[40 : 40 + len(layout)] = layout.encode()
+        with open(self.path, "wb") as f:
+            f.write(header)
+            f.truncate(HEADER_SIZE + self.chunk_rows * self._record.itemsize)
+
+    def _map(self) -> None:
+        """
+        Maps the header and records of the file.
+        """
+        mode = "r" if self.readonly else "r+"
+        self._header = np.memmap(self.path, dtype=np.int64, mode=mode, shape=(5,))
+        self._reserved = int(self._header[3])
+        self._records = np.memmap(
+            self.path, dtype=self._record, mode=mode, offset=HEADER_SIZE, shape=(self._reserved,)
+        )
+        self._timestamps = self._records["timestamp"]
+        self._columns = {name: self._records[name] for name in PRICE_COLUMNS}
+        self._set_rows(int(self._header[2]), persist=False)
+
+    def _set_rows(self, rows: int, persist: bool = True) -> None:
+        self._rows = rows
+        if persist:
+            self._header[2] = rows
+        self._head = max(rows - self.capacity, 0) if self.bounded else 0
+        self._count = rows - self._head
+
+    def _reserve(self, rows: int) -> None:
+        """
+        Grows the file to hold at least the given number of bars, by whole chunks.
+        """
+        if rows <= self._reserved:
+            return
+        reserved = -(-rows // self.chunk_rows) * self.chunk_rows
+        self.flush()
+        os.truncate(self.path, HEADER_SIZE + reserved * self._record.itemsize)
+        self._header[3] = reserved
+        self._map()
+
+    @property
+    def nbytes(self) -> int:
+        # The bars live in the page cache, which is shared with other processes, not in the heap.
+        return 0
+
+    def refresh(self) -> None:
+        """
+        Picks up the bars written to the file since it was mapped.
+        """
+        if int(self._header[3]) > self._reserved:
+            self._map()
+        else:
+            self._set_rows(int(self._header[2]), persist=False)
+
+    def flush(self) -> None:
+        if not self.readonly:
+            self._header.flush()
+            self._records.flush()
+
+    def clear(self) -> None:
+        self._set_rows(0)
+
+    def extend(self, timestamps: np.ndarray, values: Dict[str, np.ndarray]) -> None:
+        """
+        Adds bars to the file. Bars with a timestamp that already exists replace the stored bar.
+
+        :timestamps: int64 UTC epoch nanoseconds, sorted in ascending order.
+        :values: A dictionary mapping each name in PRICE_COLUMNS to an array the same length as timestamps.
+        """
+        if len(timestamps) == 0:
+            return
+        if self.readonly:
+            raise RuntimeError(f"{self.path} is mapped read-only")
+        if self._rows > 0 and timestamps[0] <= self._timestamps[self._rows - 1]:
+            self._merge(timestamps, values)
+        else:
+            self._write_rows(self._rows, timestamps, values)
+
+    def _write_rows(self, offset: int, timestamps: np.ndarray, values: Dict[str, np.ndarray]) -> None:
+        """
+        Writes bars from position offset, and makes them the last bars of the file.
+        """
+        end = offset + len(timestamps)
+        self._reserve(end)
+        records = self._records[offset:end]
+        records["timestamp"] = timestamps
+        for name in PRICE_COLUMNS:
+            records[name] = values[name]
+        # The count is updated last, so readers never see bars that are not written yet.
+        self._set_rows(end)
+
+    def _merge(self, timestamps: np.ndarray, values: Dict[str, np.ndarray]) -> None:
+        """
+        Slow path for bars that are not newer than the newest stored bar. Only the stored
+        bars from the first new timestamp onwards are rewritten.
+        """
+        offset = int(self._timestamps[: self._rows].searchsorted(timestamps[0]))
+        tail = self._records[offset : self._rows]
+        all_ts = np.concatenate([tail["timestamp"], timestamps])
+        all_values = {name: np.concatenate([tail[name], values[name]]) for name in PRICE_COLUMNS}
+        # Sort by timestamp, keeping the last occurrence of duplicate timestamps.
+        order = np.lexsort((np.arange(len(all_ts)), all_ts))
+        all_ts = all_ts[order]
+        keep = np.append(all_ts[1:] != all_ts[:-1], True)
+        self._write_rows(offset, all_ts[keep], {name: v[order][keep] for name, v in all_values.items()})
@@ -0,0 +1,86 @@
+import bisect
+import datetime as dt
+from typing import Any, Dict, List, Tuple
+
+import pandas as pd
+
+"""
+This module implements a cache of market hours, keyed by date.
+
+Brokers fetch market hours over the network, so the calendar remembers each date it
+has seen and keeps a sorted index of open days. Looking up the hours of a date or the
+last N trading days does not scan the calendar.
+"""
+
+
+class MarketCalendar:
+    """
+    Market hours of each date that has been fetched, and a sorted index of the open days.
+    """
+
+    # How often to re-check a date that was reported as closed. Most brokers report the
+    # current state of the market, so a day fetched before the open may look closed.
+    refresh_interval = dt.timedelta(minutes=15)
+
+    def __init__(self) -> None:
+        self._days: Dict[dt.date, Dict[str, Any]] = {}
+        self._fetched_at: Dict[dt.date, dt.datetime] = {}
+        self._open_days: List[dt.date] = []
+
+    def __len__(self) -> int:
+        return len(self._days)
+
+    def __contains__(self, date: dt.date) -> bool:
+        return date in self._days
+
+    def add(self, date: dt.date, data: Dict[str, Any], fetched_at: dt.datetime = None) -> None:
+        """
+        Adds or replaces the market hours of a date.
+
+        :data: A dictionary with the keys 'is_open', 'open_at' and 'close_at', as returned by
+            Broker.fetch_market_hours().
+        """
+        day = {"is_open": bool(data["is_open"]), "open_at": data["open_at"], "close_at": data["close_at"]}
+        was_open = date in self._days and self._days[date]["is_open"]
+        self._days[date] = day
+        self._fetched_at[date] = fetched_at
+
+        if day["is_open"] and not was_open:
+            bisect.insort(self._open_days, date)
+        elif was_open and not day["is_open"]:
+            self._open_days.remove(date)
+
+    def get(self, date: dt.date) -> Dict[str, Any]:
+        """
+        Returns the market hours of a date, or None if they have not been fetched.
+        """
+        return self._days.get(date)
+
+    def needs_update(self, date: dt.date, now: dt.datetime) -> bool:
+        """
+        Returns True if the market hours of the date should be fetched from the broker.
+
+        Open days are final. A closed day is re-checked every refresh_interval while it is
+        still the current day, in case it was fetched before the market opened.
+        """
+        day = self._days.get(date)
+        if day is None:
+            return True
+        if day["is_open"] or date != now.date():
+            return False
+        fetched_at = self._fetched_at.get(date)
+        return fetched_at is None or now - fetched_at >= self.refresh_interval
+
+    def last_open_days(self, n: int) -> List[Tuple[dt.date, Dict[str, Any]]]:
+        """
+        Returns the last n open days as (date, market hours) pairs, oldest first.
+        """
+        return [(date, self._days[date]) for date in self._open_days[-n:]] if n > 0 else []
+
+    def to_frame(self) -> pd.DataFrame:
+        dates = sorted(self._days)
+        return pd.DataFrame(
+            [[self._days[d]["is_open"], self._days[d]["open_at"], self._days[d]["close_at"]] for d in dates],
+            columns=["is_open", "open_at", "close_at"],
+            index=dates,
+        )
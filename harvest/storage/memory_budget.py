@@ -0,0 +1,127 @@
+import os
+import pickle
+import shutil
+from collections import OrderedDict
+from os.path import join
+from threading import Lock
+from typing import Any, Hashable, List, Union
+
+import pandas as pd
+
+from harvest.storage.price_buffer import PriceBuffer
+from harvest.storage.series_stub import SeriesStub
+
+"""
+This module keeps the price history held in memory under a fixed number of bytes.
+
+Every (symbol, interval) series is tracked in least-recently-used order along with its
+size. When the total exceeds the budget, the coldest series are written to a spill
+directory and replaced in storage by a SpilledSeries placeholder, which is loaded back
+the next time the series is read or written. The file of a series is deleted once it
+is loaded back.
+"""
+
+
+class SpilledSeries(SeriesStub):
+    """
+    Placeholder for a price series that was moved from memory to disk.
+    """
+
+    def __init__(self, path: str, length: int) -> None:
+        super().__init__(length)
+        self.path = path
+        self._data = None
+        self._lock = Lock()
+
+    def restore(self) -> Union[pd.DataFrame, PriceBuffer]:
+        # Readers of the series can restore it at the same time, so the first one reads and
+        # deletes the file, and the others get the same data.
+        with self._lock:
+            if self._data is None:
+                with open(self.path, "rb") as f:
+                    self._data = pickle.load(f)
+                os.remove(self.path)
+            return self._data
+
+
+def series_nbytes(data: Union[pd.DataFrame, PriceBuffer]) -> int:
+    """
+    Returns the number of bytes used by a stored price series.
+    """
+    if isinstance(data, PriceBuffer):
+        return data.nbytes
+    return int(data.memory_usage(index=True).sum())
+
+
+class MemoryBudget:
+    """
+    Tracks the size and recency of the resident price series.
+    """
+
+    def __init__(self, limit: int, spill_dir: str, temporary: bool = False) -> None:
+        """
+        :limit: The maximum number of bytes of price history to keep in memory.
+        :spill_dir: The directory that evicted series are written to.
+        :temporary: If True, the directory was created for this budget and is removed by close().
+        """
+        self.limit = limit
+        self.spill_dir = spill_dir
+        self.temporary = temporary
+        self._paths = set()
+        self.used = 0
+        self._sizes = OrderedDict()
+        self._lock = Lock()
+        os.makedirs(spill_dir, exist_ok=True)
+
+    def touch(self, key: Hashable, nbytes: int = None) -> None:
+        """
+        Marks a series as the most recently used, and updates its size if given.
+        """
+        with self._lock:
+            if nbytes is None:
+                if key in self._sizes:
+                    self._sizes.move_to_end(key)
+                return
+            self.used += nbytes - self._sizes.pop(key, 0)
+            self._sizes[key] = nbytes
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self.used -= self._sizes.pop(key, 0)
+
+    def over_budget(self) -> bool:
+        return self.used > self.limit
+
+    def coldest(self) -> List[Hashable]:
+        """
+        Returns the tracked series, least recently used first.
+        """
+        with self._lock:
+            return list(self._sizes)
+
+    def spill(self, key: Hashable, name: str, data: Any) -> SpilledSeries:
+        """
+        Writes a series to disk and stops tracking it.
+        """
+        path = join(self.spill_dir, f"{name}.pickle")
+        # Write to a temporary file first, as a reader may still be restoring the previous spill.
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        self.discard(key)
+        with self._lock:
+            self._paths.add(path)
+        return SpilledSeries(path, len(data))
+
+    def close(self) -> None:
+        """
+        Deletes the files of the series that are still spilled, and the directory if it is temporary.
+        """
+        with self._lock:
+            paths, self._paths = self._paths, set()
+        if self.temporary:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            return
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,152 @@
+import datetime as dt
+import re
+from os import listdir, makedirs
+from os.path import join
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+
+from harvest.enum import Interval
+from harvest.storage import BaseStorage
+from harvest.storage.mapped_buffer import MappedBuffer
+from harvest.util.helper import interval_enum_to_string, interval_string_to_enum
+
+"""
+This module serves as a storage system for price data in memory-mapped files.
+
+Each (symbol, interval) series is a MappedBuffer file named {symbol}@{interval}.mmap.
+The data is never copied into the heap: load() reads views of the mapped files, so
+several processes can use the same price history while the OS keeps a single copy of
+it in the page cache. One process, typically the trader, writes the files, and any
+number of processes open the same directory with readonly=True, for example backtest
+workers or a second trader, and see the bars as they are written.
+
+Transactions, performance history, and the market calendar are kept in memory.
+"""
+
+
+class MmapStorage(BaseStorage):
+    """
+    An extension of the basic storage that keeps price history in memory-mapped files.
+    """
+
+    def __init__(
+        self,
+        save_dir: str = "data",
+        queue_size: int = 200,
+        limit_size: bool = True,
+        compact: bool = False,
+        chunk_rows: int = 4096,
+        readonly: bool = False,
+    ) -> None:
+        super().__init__(queue_size, limit_size, columnar=True, compact=compact)
+        """
+        Adds a directory to save data to, and maps the files that are currently in it.
+        :compact: whether to store prices as float32, see BaseStorage.
+        :chunk_rows: the number of bars a file grows by when it is full.
+        :readonly: if True, the files are mapped read-only, and load() picks up the bars
+            and series written by another process. store() raises a RuntimeError.
+        """
+        self.save_dir = save_dir
+        self.chunk_rows = chunk_rows
+        self.readonly = readonly
+
+        # if the data dir does not exists, create it
+        makedirs(self.save_dir, exist_ok=True)
+        self.refresh()
+
+    def refresh(self) -> None:
+        """
+        Maps the files of series that were created since the storage was opened.
+        """
+        for file in listdir(self.save_dir):
+            file_search = re.search(r"^(@?[\w.]+)@(\w+)\.mmap$", file)
+            if file_search is None:
+                continue
+            symbol, interval = file_search.group(1), interval_string_to_enum(file_search.group(2))
+            with self.storage_lock:
+                intervals = self.storage_price.setdefault(symbol, {})
+                if interval not in intervals:
+                    intervals[interval] = MappedBuffer(
+                        join(self.save_dir, file),
+                        self.price_storage_size,
+                        self.price_storage_limit,
+                        chunk_rows=self.chunk_rows,
+                        readonly=self.readonly,
+                    )
+
+    def _new_buffer(self, symbol: str, interval: Interval, data: pd.DataFrame) -> MappedBuffer:
+        return MappedBuffer(
+            join(self.save_dir, f"{symbol}@{interval_enum_to_string(interval)}.mmap"),
+            self.price_storage_size,
+            self.price_storage_limit,
+            data.index.name or "timestamp",
+            data[symbol].dtypes.to_dict() if self.compact else None,
+            chunk_rows=self.chunk_rows,
+        )
+
+    def store(self, symbol: str, interval: Interval, data: pd.DataFrame, remove_duplicate=True) -> None:
+        """
+        Stores the stock data, appending it to the file of the series.
+        """
+        if self.readonly:
+            raise RuntimeError("Cannot store data in a read-only MmapStorage")
+        super().store(symbol, interval, data, remove_duplicate)
+
+    def load(
+        self,
+        symbol: str,
+        interval: Interval = None,
+        start: dt.datetime = None,
+        end: dt.datetime = None,
+        slice_data=False,
+        fields: Union[str, List[str]] = None,
+        as_numpy: bool = False,
+        upcast: bool = False,
+        limit: int = None,
+    ) -> Union[pd.DataFrame, np.ndarray]:
+        """
+        Loads the stock data, see BaseStorage.load(). When a single field is loaded as a
+        numpy array, the array is a read-only view of the file rather than a copy.
+        """
+        if self.readonly and (interval is None or interval not in self.storage_price.get(symbol, {})):
+            self.refresh()
+        return super().load(symbol, interval, start, end, slice_data, fields, as_numpy, upcast, limit)
+
+    def _load_buffer(
+        self,
+        symbol: str,
+        interval: Interval,
+        start: dt.datetime,
+        end: dt.datetime,
+        fields: Union[str, List[str]],
+        as_numpy: bool,
+        limit: int = None,
+    ) -> Union[pd.DataFrame, np.ndarray]:
+        """
+        Reads a range of a MappedBuffer. Caller must hold the lock of the series.
+        """
+        data = self._get_series(symbol, interval)
+        if self.readonly:
+            data.refresh()
+        if not (as_numpy and isinstance(fields, str)):
+            return super()._load_buffer(symbol, interval, start, end, fields, as_numpy, limit)
+        # Files are only appended to, apart from corrections of the newest bars, so the view
+        # stays valid after the lock is released.
+        i, j = self._range(data.timestamps(), start, end, limit)
+        view = data.column(fields)[i:j].view(np.ndarray)
+        view.flags.writeable = False
+        return view
+
+    def flush(self) -> None:
+        """
+        Writes the mapped pages of every series to disk.
+        """
+        if self.readonly:
+            return
+        with self.storage_lock:
+            buffers = [data for intervals in self.storage_price.values() for data in intervals.values()]
+        for buffer in buffers:
+            if isinstance(buffer, MappedBuffer):
+                buffer.flush()
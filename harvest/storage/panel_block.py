@@ -0,0 +1,162 @@
+from threading import Event, Lock
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+"""
+This module implements a consolidated, cross-sectional block of one price field.
+
+A PanelBlock holds a single field, such as 'close', of every symbol stored at one
+interval in a 2D array of time x symbol, with a shared sorted array of timestamps.
+New bars are written into the block in place as they are stored, so loading a panel
+of many symbols is a single slice instead of one load and one alignment per symbol.
+"""
+
+
+class PanelBlock:
+    """
+    A time x symbol array of one price field, aligned on a shared timestamp index.
+    Timestamps where a symbol has no bar hold NaN.
+    """
+
+    def __init__(self, max_rows: int = None, dtype: np.dtype = np.float64) -> None:
+        """
+        :max_rows: If given, only the newest max_rows timestamps are kept.
+        :dtype: The dtype of the values.
+        """
+        self.max_rows = max_rows
+        self.dtype = np.dtype(dtype)
+        self.lock = Lock()
+        # Set once the block holds all the data that was stored before it was created
+        self.ready = Event()
+        self._columns: Dict[str, int] = {}
+        # Leave room to append max_rows bars before the live rows have to be moved back.
+        rows = max(64, 2 * max_rows) if max_rows else 64
+        self._timestamps = np.empty(rows, dtype=np.int64)
+        self._values = np.full((rows, 8), np.nan, dtype=self.dtype)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(self._columns)
+
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[self._start : self._end]
+
+    def update(self, symbol: str, timestamps: np.ndarray, values: np.ndarray) -> None:
+        """
+        Writes the values of a symbol at the given timestamps, adding rows for new timestamps.
+
+        :timestamps: UTC epoch nanoseconds
+        """
+        if len(timestamps) == 0:
+            return
+        with self.lock:
+            column = self._column(symbol)
+            rows = self._rows(timestamps)
+            self._values[rows, column] = values
+            self._trim()
+
+    def clear_symbol(self, symbol: str) -> None:
+        with self.lock:
+            if symbol in self._columns:
+                self._values[self._start : self._end, self._columns[symbol]] = np.nan
+
+    def read(self, symbols: List[str], start: int = None, end: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns copies of the timestamps and of the values of the given symbols between
+        start and end, both inclusive. Symbols that are not in the block are all NaN.
+
+        :start: UTC epoch nanoseconds
+        :end: UTC epoch nanoseconds
+        """
+        with self.lock:
+            timestamps = self.timestamps()
+            i = 0 if start is None else int(timestamps.searchsorted(start, side="left"))
+            j = len(timestamps) if end is None else int(timestamps.searchsorted(end, side="right"))
+            j = max(i, j)
+            values = np.full((j - i, len(symbols)), np.nan, dtype=self.dtype)
+            found = [(k, self._columns[s]) for k, s in enumerate(symbols) if s in self._columns]
+            if found:
+                targets, columns = zip(*found)
+                values[:, list(targets)] = self._values[self._start + i : self._start + j, list(columns)]
+            return timestamps[i:j].copy(), values
+
+    def _column(self, symbol: str) -> int:
+        column = self._columns.get(symbol)
+        if column is not None:
+            return column
+        column = len(self._columns)
+        if column == self._values.shape[1]:
+            grown = np.full((self._values.shape[0], column * 2), np.nan, dtype=self.dtype)
+            grown[:, :column] = self._values
+            self._values = grown
+        self._columns[symbol] = column
+        return column
+
+    def _rows(self, timestamps: np.ndarray) -> np.ndarray:
+        """
+        Returns the row of each timestamp, adding the ones that are not in the block.
+        """
+        live = self.timestamps()
+        positions = live.searchsorted(timestamps)
+        found = positions < len(live)
+        found[found] = live[positions[found]] == timestamps[found]
+        missing = np.unique(timestamps[~found])
+        if len(missing) > 0:
+            if len(live) == 0 or missing[0] > live[-1]:
+                # New bars are almost always newer than every stored bar.
+                self._append_rows(missing)
+            else:
+                self._insert_rows(missing)
+            live = self.timestamps()
+            positions = live.searchsorted(timestamps)
+        return self._start + positions
+
+    def _append_rows(self, timestamps: np.ndarray) -> None:
+        n = len(timestamps)
+        if self._end + n > len(self._timestamps):
+            count = len(self)
+            capacity = len(self._timestamps)
+            while count + n > capacity:
+                capacity *= 2
+            self._resize(capacity)
+        self._timestamps[self._end : self._end + n] = timestamps
+        self._values[self._end : self._end + n] = np.nan
+        self._end += n
+
+    def _insert_rows(self, timestamps: np.ndarray) -> None:
+        """
+        Slow path for timestamps that are older than the newest row.
+        """
+        live = self.timestamps()
+        merged = np.union1d(live, timestamps)
+        values = np.full((max(len(merged), 64), self._values.shape[1]), np.nan, dtype=self.dtype)
+        values[merged.searchsorted(live)] = self._values[self._start : self._end]
+        self._timestamps = np.empty(len(values), dtype=np.int64)
+        self._timestamps[: len(merged)] = merged
+        self._values = values
+        self._start = 0
+        self._end = len(merged)
+
+    def _resize(self, capacity: int) -> None:
+        """
+        Moves the live rows to the front of arrays of the given capacity.
+        """
+        count = len(self)
+        timestamps = np.empty(capacity, dtype=np.int64)
+        values = np.full((capacity, self._values.shape[1]), np.nan, dtype=self.dtype)
+        timestamps[:count] = self.timestamps()
+        values[:count] = self._values[self._start : self._end]
+        self._timestamps = timestamps
+        self._values = values
+        self._start = 0
+        self._end = count
+
+    def _trim(self) -> None:
+        if self.max_rows is not None and len(self) > self.max_rows:
+            self._start = self._end - self.max_rows
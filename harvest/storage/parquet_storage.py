@@ -0,0 +1,434 @@
+import datetime as dt
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os import listdir, makedirs
+from os.path import isdir, isfile, join
+from typing import Any, Dict, List, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from harvest.enum import Interval
+from harvest.storage import BaseStorage
+from harvest.storage.series_stub import LazySeries
+from harvest.util.helper import interval_enum_to_string, interval_string_to_enum
+
+"""
+This module serves as a storage system for pandas dataframes in with Parquet files.
+
+Prices are saved as a Hive-partitioned Parquet dataset, with a directory per interval,
+symbol, and UTC date:
+
+    {save_dir}/prices/interval=1MIN/symbol=SPY/date=2024-01-02/data.parquet
+    {save_dir}/prices/interval=1MIN/symbol=SPY/date=2024-01-02/part-000001.parquet
+
+The dataset can be read directly with pyarrow or pandas, so the same directory can be
+shared by the trader and by research code. read() loads many symbols in a single scan,
+and only opens the files of the dates in the requested range, reads only the requested
+columns, and filters rows by timestamp inside the reader. Transactions and performance
+history are partitioned by date in the same way.
+
+A store() writes the rows it changed to a new part file of each date, so the cost of a
+tick does not grow with the rows written that day. Rows of a later part replace the rows
+with the same timestamp in earlier files. The parts of a date are compacted into its
+data.parquet once there are max_parts of them, when a newer date of the series is
+written, and by flush(). The compacted file records the last part it includes, so parts
+left behind by an interrupted compaction are ignored.
+"""
+
+PARTITION_FILE = "data.parquet"
+PART_FILE = re.compile(r"^part-(\d+)\.parquet$")
+# The schema metadata key of data.parquet that holds the number of the last part it includes
+PARTS_KEY = b"harvest.parts"
+COMPRESSION = "zstd"
+
+
+class ParquetStorage(BaseStorage):
+    """
+    An extension of the basic storage that saves data in a partitioned Parquet dataset.
+    """
+
+    def __init__(
+        self,
+        save_dir: str = "data",
+        queue_size: int = 200,
+        limit_size: bool = True,
+        compact: bool = False,
+        lazy: bool = False,
+        workers: int = 1,
+        max_parts: int = 64,
+    ) -> None:
+        super().__init__(queue_size, limit_size, compact=compact)
+        """
+        Adds a directory to save data to. Loads any data that is currently in the
+        directory. When limit_size is True, only the newest dates needed to fill the
+        history kept in memory are read.
+        :compact: whether to store prices as float32, see BaseStorage.
+        :lazy: if True, files are not read at startup, and a series is read the first time it is used.
+        :workers: the number of threads that read files at startup when lazy is False.
+        :max_parts: the number of part files a date can have before they are compacted.
+        """
+        self.save_dir = save_dir
+        self.max_parts = max(max_parts, 1)
+        self._file_locks = {}
+        # Maps the directory of each date written by this storage to the number of its next
+        # part, the number of parts since it was compacted, and whether timestamps are unique.
+        self._parts: Dict[str, List] = {}
+        self._restored_performance = False
+
+        # if the data dir does not exists, create it
+        makedirs(join(self.save_dir, "prices"), exist_ok=True)
+
+        series = []
+        for interval_dir in listdir(join(self.save_dir, "prices")):
+            interval = interval_string_to_enum(interval_dir.split("=", 1)[1])
+            for symbol_dir in listdir(join(self.save_dir, "prices", interval_dir)):
+                series.append((symbol_dir.split("=", 1)[1], interval))
+
+        if lazy:
+            with self.storage_lock:
+                for symbol, interval in series:
+                    self.storage_price.setdefault(symbol, {})[interval] = LazySeries(
+                        lambda symbol=symbol, interval=interval: self._read_latest(symbol, interval)
+                    )
+        else:
+            with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+                frames = pool.map(lambda args: self._read_latest(*args), series)
+                for (symbol, interval), data in zip(series, frames):
+                    if not data.empty:
+                        super().store(symbol, interval, data)
+
+        calendar_file = join(self.save_dir, "calendar.parquet")
+        if isfile(calendar_file):
+            calendar = pq.read_table(calendar_file).to_pandas()
+            for date, row in calendar.iterrows():
+                super().add_calendar_data(row.where(row.notna(), None).to_dict(), pd.Timestamp(date).date())
+
+        transactions = self._read_partitions("transactions", unique=False)
+        for row in transactions.itertuples(index=False):
+            super().store_transaction(row.timestamp, row.algorithm_name, row.symbol, row.side, row.quantity, row.price)
+
+        performance = self._read_partitions("performance", unique=True)
+        for row in performance.itertuples(index=False):
+            super().add_performance_data(row.equity, row.timestamp)
+        self._restored_performance = len(performance) > 0
+
+    # ------------------ Files ------------------ #
+
+    def _file_lock(self, path: str) -> threading.Lock:
+        """
+        Returns the lock that serializes writes to the dates of a series, or of transactions
+        or performance history.
+        """
+        lock = self._file_locks.get(path)
+        if lock is None:
+            with self.storage_lock:
+                lock = self._file_locks.setdefault(path, threading.Lock())
+        return lock
+
+    def _series_dir(self, symbol: str, interval: Interval) -> str:
+        return join(self.save_dir, "prices", f"interval={interval_enum_to_string(interval)}", f"symbol={symbol}")
+
+    def _write_file(self, data: pd.DataFrame, path: str, parts: int = None) -> None:
+        """
+        Writes a file of a partition in one step, so that it is never left partially written.
+        The temporary file starts with an underscore, so that pyarrow ignores it when reading the dataset.
+        :parts: for data.parquet, the number of the last part it includes.
+        """
+        makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = join(os.path.dirname(path), f"_{os.path.basename(path)}.tmp")
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        if parts is not None:
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), PARTS_KEY: str(parts).encode()})
+        pq.write_table(table, tmp, compression=COMPRESSION)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _partition_files(part_dir: str) -> Tuple[List[str], int]:
+        """
+        Lists the files of a date, data.parquet first and then the parts in the order they
+        were written, leaving out parts that data.parquet already includes.
+        :returns: the files, and the number of the last part of the date.
+        """
+        if not isdir(part_dir):
+            return [], 0
+        files = []
+        compacted = 0
+        path = join(part_dir, PARTITION_FILE)
+        if isfile(path):
+            files.append(path)
+            compacted = int((pq.read_schema(path).metadata or {}).get(PARTS_KEY, b"0"))
+        parts = sorted((int(m.group(1)), m.group(0)) for m in map(PART_FILE.match, listdir(part_dir)) if m)
+        files.extend(join(part_dir, name) for number, name in parts if number > compacted)
+        return files, max([compacted] + [number for number, _ in parts])
+
+    @staticmethod
+    def _read_files(files: List[str], unique: bool) -> pd.DataFrame:
+        """
+        Reads files of a dataset, in the order of _partition_files() within each date.
+        :unique: if True, rows replace the rows with the same timestamp in earlier files.
+        """
+        dataset = ds.dataset(files, format="parquet")
+        table = dataset.to_table(columns=dataset.schema.names + ["__filename"])
+        data = table.to_pandas()
+        rank = {f: i for i, f in enumerate(files)}
+        data = data.iloc[data.pop("__filename").map(rank).argsort(kind="stable")]
+        if unique:
+            data = data.drop_duplicates("timestamp", keep="last")
+        return data.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+    def _append_partition(self, data: pd.DataFrame, part_dir: str, unique: bool) -> None:
+        """
+        Adds rows to a date as a new part file. Caller must hold the lock of the series.
+        :unique: if True, rows replace the existing rows with the same timestamp.
+        """
+        state = self._parts.get(part_dir)
+        if state is None:
+            files, last = self._partition_files(part_dir)
+            state = self._parts[part_dir] = [last + 1, len(files) - isfile(join(part_dir, PARTITION_FILE)), unique]
+        self._write_file(data, join(part_dir, f"part-{state[0]:06d}.parquet"))
+        state[0] += 1
+        state[1] += 1
+
+        # The dates before this one are done, or are only corrected rarely.
+        base = os.path.dirname(part_dir)
+        for other in [d for d in self._parts if d < part_dir and os.path.dirname(d) == base]:
+            self._compact_partition(other)
+        if state[1] >= self.max_parts:
+            self._compact_partition(part_dir)
+
+    def _compact_partition(self, part_dir: str) -> None:
+        """
+        Merges the parts of a date into its data.parquet. Caller must hold the lock of the series.
+        """
+        state = self._parts.pop(part_dir)
+        files, last = self._partition_files(part_dir)
+        if state[1] > 0:
+            self._write_file(self._read_files(files, state[2]), join(part_dir, PARTITION_FILE), last)
+        for name in listdir(part_dir):
+            if PART_FILE.match(name):
+                os.remove(join(part_dir, name))
+
+    def _read_partitions(self, name: str, unique: bool) -> pd.DataFrame:
+        """
+        Reads all the date partitions of transactions or performance history, oldest first.
+        """
+        base = join(self.save_dir, name)
+        if not isdir(base):
+            return pd.DataFrame()
+        files = [f for part in sorted(listdir(base)) for f in self._partition_files(join(base, part))[0]]
+        if not files:
+            return pd.DataFrame()
+        return self._read_files(files, unique)
+
+    def _read_latest(self, symbol: str, interval: Interval) -> pd.DataFrame:
+        """
+        Reads the newest dates of a series, enough to fill the history kept in memory,
+        in the format passed to BaseStorage.store().
+        """
+        base = self._series_dir(symbol, interval)
+        files = []
+        rows = 0
+        for part in sorted(listdir(base), reverse=True):
+            part_files = self._partition_files(join(base, part))[0]
+            if not part_files:
+                continue
+            files = part_files + files
+            # Rows replaced by a later part are counted twice, so this may read an extra date.
+            rows += sum(pq.read_metadata(path).num_rows for path in part_files)
+            if self.price_storage_limit and rows >= self.price_storage_size:
+                break
+        if not files:
+            return pd.DataFrame()
+        data = self._read_files(files, unique=True).set_index("timestamp")
+        data.columns = pd.MultiIndex.from_product([[symbol], data.columns])
+        return data
+
+    # ------------------ Prices ------------------ #
+
+    def store(
+        self,
+        symbol: str,
+        interval: Interval,
+        data: pd.DataFrame,
+        remove_duplicate: bool = True,
+    ) -> None:
+        """
+        Stores the stock data in the storage dictionary, and writes the rows that changed to new parts of their dates.
+        :symbol: a stock or crypto
+        :interval: the interval between each data point, must be atleast
+             1 minute
+        :data: a pandas dataframe that has stock data and has a datetime
+            index
+        """
+        super().store(symbol, interval, data, remove_duplicate)
+
+        if data.empty:
+            return
+
+        base = self._series_dir(symbol, interval)
+        since = pd.Timestamp(self._to_ns(data.index.min()), tz="UTC")
+        with self._series_lock(symbol, interval).read(), self._file_lock(base):
+            # Write the stored rows rather than the given data, as they may have been merged with existing bars.
+            rows = self._get_frame(symbol, interval, since)
+            if rows.empty:
+                return
+            rows = rows[symbol].rename_axis("timestamp").reset_index()
+            for date, day in rows.groupby(rows["timestamp"].dt.date):
+                self._append_partition(day, join(base, f"date={date.isoformat()}"), unique=True)
+
+    def read(
+        self,
+        symbols: List[str],
+        interval: Interval,
+        start: dt.datetime = None,
+        end: dt.datetime = None,
+        fields: List[str] = None,
+    ) -> pd.DataFrame:
+        """
+        Reads the bars of several symbols from disk in a single scan. Only the files of the dates
+        between start and end are opened, and only the given fields are read.
+
+        :start: the first timestamp to return, inclusive. If None, reads from the oldest bar.
+        :end: the last timestamp to return, inclusive. If None, reads up to the newest bar.
+        :fields: the columns to read, such as ['close', 'volume']. If None, reads every column.
+        :returns: a DataFrame indexed by timestamp, with (symbol, field) columns.
+        """
+        start = None if start is None else pd.Timestamp(self._to_ns(start), tz="UTC")
+        end = None if end is None else pd.Timestamp(self._to_ns(end), tz="UTC")
+        first = None if start is None else f"date={start.date().isoformat()}"
+        last = None if end is None else f"date={end.date().isoformat()}"
+
+        files = []
+        for symbol in symbols:
+            base = self._series_dir(symbol, interval)
+            if not isdir(base):
+                continue
+            for part in listdir(base):
+                if (first is None or part >= first) and (last is None or part <= last):
+                    files.extend(self._partition_files(join(base, part))[0])
+        if not files:
+            return pd.DataFrame()
+
+        dataset = ds.dataset(
+            files,
+            format="parquet",
+            partitioning=ds.partitioning(pa.schema([("symbol", pa.string()), ("date", pa.string())]), flavor="hive"),
+            partition_base_dir=os.path.dirname(self._series_dir(symbols[0], interval)),
+        )
+        if fields is None:
+            fields = [name for name in dataset.schema.names if name not in ("timestamp", "symbol", "date")]
+
+        timestamp = ds.field("timestamp")
+        condition = None
+        if start is not None:
+            condition = timestamp >= pa.scalar(start, type=pa.timestamp("ns", tz="UTC"))
+        if end is not None:
+            upper = timestamp <= pa.scalar(end, type=pa.timestamp("ns", tz="UTC"))
+            condition = upper if condition is None else condition & upper
+        table = dataset.to_table(columns=["timestamp", "symbol", "__filename"] + list(fields), filter=condition)
+
+        # Rows of later parts replace the rows with the same timestamp in earlier files.
+        data = table.to_pandas()
+        rank = {f: i for i, f in enumerate(files)}
+        data = data.iloc[data.pop("__filename").map(rank).argsort(kind="stable")]
+        data = data.drop_duplicates(["symbol", "timestamp"], keep="last")
+        data = data.pivot(index="timestamp", columns="symbol", values=list(fields))
+        data = data.swaplevel(axis=1)
+        data = data.reindex(columns=pd.MultiIndex.from_product([[s for s in symbols if s in data], fields]))
+        return data
+
+    def open(
+        self,
+        symbol: str,
+        interval: Interval,
+        start: dt.datetime = None,
+        end: dt.datetime = None,
+        fields: List[str] = None,
+    ) -> pd.DataFrame:
+        """
+        Reads a series from disk. See read().
+        """
+        if not isinstance(interval, Interval):
+            interval = interval_string_to_enum(interval)
+        return self.read([symbol], interval, start, end, fields)
+
+    # ------------------ Transactions and performance ------------------ #
+
+    def store_transaction(
+        self,
+        timestamp: dt.datetime,
+        algorithm_name: str,
+        symbol: str,
+        side: str,
+        quantity: int,
+        price: float,
+    ) -> None:
+        """
+        Stores a filled order and adds it to the partition of its date.
+        """
+        super().store_transaction(timestamp, algorithm_name, symbol, side, quantity, price)
+
+        row = pd.DataFrame(
+            {
+                "timestamp": [pd.Timestamp(self._to_ns(timestamp), tz="UTC")],
+                "algorithm_name": [algorithm_name],
+                "symbol": [symbol],
+                "side": [side],
+                "quantity": [float(quantity)],
+                "price": [float(price)],
+            }
+        )
+        base = join(self.save_dir, "transactions")
+        with self._file_lock(base):
+            self._append_partition(row, join(base, f"date={row['timestamp'][0].date().isoformat()}"), unique=False)
+
+    def init_performance_data(self, equity: float, timestamp: dt.datetime) -> None:
+        """
+        Starts the equity history, unless a history was loaded from disk,
+        in which case the point is added to it.
+        """
+        if self._restored_performance:
+            self.add_performance_data(equity, timestamp)
+            return
+        super().init_performance_data(equity, timestamp)
+        self._append_performance(equity, timestamp)
+
+    def add_performance_data(self, equity: float, timestamp: dt.datetime) -> None:
+        """
+        Adds the performance data to the storage, and to the partition of its date.
+        """
+        super().add_performance_data(equity, timestamp)
+        self._append_performance(equity, timestamp)
+
+    def _append_performance(self, equity: float, timestamp: dt.datetime) -> None:
+        row = pd.DataFrame({"timestamp": [pd.Timestamp(self._to_ns(timestamp), tz="UTC")], "equity": [float(equity)]})
+        base = join(self.save_dir, "performance")
+        with self._file_lock(base):
+            self._append_partition(row, join(base, f"date={row['timestamp'][0].date().isoformat()}"), unique=True)
+
+    def add_calendar_data(self, data: Dict[str, Any], date: dt.date = None) -> None:
+        """
+        Stores the market hours of a date and saves the calendar to calendar.parquet.
+        """
+        super().add_calendar_data(data, date)
+        path = join(self.save_dir, "calendar.parquet")
+        with self._file_lock(path):
+            calendar = self.load_calendar()
+            calendar.index = calendar.index.astype(str)
+            tmp = join(self.save_dir, "_calendar.parquet.tmp")
+            pq.write_table(pa.Table.from_pandas(calendar), tmp, compression=COMPRESSION)
+            os.replace(tmp, path)
+
+    def flush(self) -> None:
+        """
+        Compacts the parts written to each date into its data.parquet.
+        """
+        for part_dir in list(self._parts):
+            with self._file_lock(os.path.dirname(part_dir)):
+                if part_dir in self._parts:
+                    self._compact_partition(part_dir)
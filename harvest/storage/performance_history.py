@@ -0,0 +1,132 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+"""
+This module implements fixed-capacity buffers for the account equity history.
+
+Appending a point only writes into preallocated arrays. When a buffer is full, it is
+downsampled in place with min/max bucketing: every bucket of four points is reduced to
+its lowest and highest point, so resolution drops as the covered duration grows while
+peaks and drawdowns are preserved.
+"""
+
+# Number of points that min/max bucketing reduces to two
+BUCKET_SIZE = 4
+
+
+def min_max_buckets(equity: np.ndarray) -> np.ndarray:
+    """
+    Returns the positions of the points that min/max bucketing keeps, which is about half of them.
+    The newest points, that do not fill a bucket, are kept as they are.
+    """
+    n = len(equity)
+    m = (n - 1) // BUCKET_SIZE * BUCKET_SIZE
+    buckets = equity[:m].reshape(-1, BUCKET_SIZE)
+    low = buckets.argmin(axis=1)
+    high = buckets.argmax(axis=1)
+    # A flat bucket has the same min and max, so keep its first and last point.
+    high = np.where(low == high, BUCKET_SIZE - 1, high)
+    offsets = np.arange(0, m, BUCKET_SIZE)
+    keep = np.sort(np.stack([low, high], axis=1), axis=1) + offsets[:, None]
+    return np.concatenate([keep.ravel(), np.arange(m, n)])
+
+
+class EquityBuffer:
+    """
+    A time-ordered series of (timestamp, equity) points with a fixed memory footprint.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 200,
+        max_age: dt.timedelta = None,
+        daily: bool = False,
+        bounded: bool = True,
+    ) -> None:
+        """
+        :capacity: The maximum number of points to keep, or the initial capacity if bounded is False.
+        :max_age: If given, points older than this relative to the newest point are dropped.
+        :daily: If True, only the latest point of each day is kept.
+        :bounded: If False, the buffer doubles in size when full instead of downsampling.
+        """
+        self.capacity = max(int(capacity), BUCKET_SIZE * 2)
+        self.max_age = max_age
+        self.daily = daily
+        self.bounded = bounded
+        self.tz = None
+        self._timestamps = np.empty(self.capacity, dtype=np.int64)
+        self._equity = np.empty(self.capacity, dtype=np.float64)
+        self._start = 0
+        self._end = 0
+        self._last_date = None
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def clear(self) -> None:
+        self._start = 0
+        self._end = 0
+        self._last_date = None
+
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[self._start : self._end]
+
+    def equity(self) -> np.ndarray:
+        return self._equity[self._start : self._end]
+
+    def append(self, equity: float, timestamp: dt.datetime) -> None:
+        if self.tz is None:
+            self.tz = timestamp.tzinfo
+        ns = pd.Timestamp(timestamp).value
+
+        if self.daily and self._end > self._start and self._last_date == timestamp.date():
+            # Replace the latest point of the day
+            self._timestamps[self._end - 1] = ns
+            self._equity[self._end - 1] = equity
+            return
+
+        if self.max_age is not None and self._end > self._start:
+            cutoff = ns - self.max_age // dt.timedelta(microseconds=1) * 1000
+            self._start += int(self.timestamps().searchsorted(cutoff))
+
+        if self._end == self.capacity:
+            self._make_room()
+
+        self._timestamps[self._end] = ns
+        self._equity[self._end] = equity
+        self._end += 1
+        self._last_date = timestamp.date()
+
+    def _make_room(self) -> None:
+        n = len(self)
+        if self._start > 0:
+            # Move the live points back to the front of the arrays.
+            self._timestamps[:n] = self._timestamps[self._start : self._end]
+            self._equity[:n] = self._equity[self._start : self._end]
+        elif not self.bounded:
+            self._timestamps = np.concatenate([self._timestamps, np.empty(self.capacity, dtype=np.int64)])
+            self._equity = np.concatenate([self._equity, np.empty(self.capacity, dtype=np.float64)])
+            self.capacity *= 2
+        else:
+            n = self._downsample()
+        self._start = 0
+        self._end = n
+
+    def _downsample(self) -> int:
+        """
+        Halves the number of points with min/max bucketing, keeping the newest points as they are.
+
+        :returns: The new number of points.
+        """
+        keep = min_max_buckets(self._equity[: len(self)])
+        self._timestamps[: len(keep)] = self._timestamps[keep]
+        self._equity[: len(keep)] = self._equity[keep]
+        return len(keep)
+
+    def to_frame(self) -> pd.DataFrame:
+        index = pd.DatetimeIndex(self.timestamps().view("datetime64[ns]"))
+        if self.tz is not None:
+            index = index.tz_localize("UTC").tz_convert(self.tz)
+        return pd.DataFrame({"equity": self.equity()}, index=index)
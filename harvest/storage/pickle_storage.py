@@ -1,14 +1,33 @@
+import datetime as dt
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from os import listdir, makedirs
-from os.path import isfile, join
+from os.path import isdir, isfile, join
+from typing import Any, Callable, Dict, List, Tuple
 
 import pandas as pd
 
 from harvest.enum import Interval
 from harvest.storage import BaseStorage
+from harvest.storage.segmented_series import MANIFEST, SegmentedSeries
+from harvest.storage.series_stub import LazySeries
+from harvest.storage.write_behind import WriteBehind
 from harvest.util.helper import interval_enum_to_string, interval_string_to_enum
 
 """
 This module serves as a storage system for pandas dataframes in with pickle files.
+
+Each series is saved in the segmented format of SegmentedSeries: a directory named
+{symbol}@{interval} holding one chunk file per store() and a manifest. Each store()
+only writes the rows that changed, and the chunks are merged as they accumulate.
+Series saved as a single {symbol}@{interval}.pickle file by older versions are still
+read, and are converted to the segmented format the next time they are stored.
+
+With write_behind=True, store() only updates memory and the chunks are written by a
+background thread. A series stored several times before the writer gets to it is
+written once, from the oldest row that changed.
 """
 
 
@@ -17,29 +36,98 @@ class PickleStorage(BaseStorage):
     An extension of the basic storage that saves data in pickle files.
     """
 
-    def __init__(self, save_dir: str = "data", queue_size: int = 200, limit_size: bool = True) -> None:
-        super().__init__(queue_size, limit_size)
+    def __init__(
+        self,
+        save_dir: str = "data",
+        queue_size: int = 200,
+        limit_size: bool = True,
+        compact: bool = False,
+        lazy: bool = False,
+        workers: int = 1,
+        write_behind: bool = False,
+        max_pending: int = 1000,
+        backpressure: str = "block",
+        max_chunks: int = 16,
+    ) -> None:
+        super().__init__(queue_size, limit_size, compact=compact)
         """
         Adds a directory to save data to. Loads any data that is currently in the
         directory.
+        :compact: whether to store prices as float32, see BaseStorage.
+        :lazy: if True, only the manifests are read at startup, and a series is read the first time it is used.
+        :workers: the number of threads that read files at startup when lazy is False.
+        :write_behind: if True, files are written by a background thread instead of in store().
+            Call flush() to wait for the data to be on disk.
+        :max_pending: the maximum number of writes queued when write_behind is True.
+        :backpressure: what store() does when the queue is full, 'block' or 'inline'. See WriteBehind.
+        :max_chunks: the number of chunk files a series can have before its newest chunks are merged.
         """
         self.save_dir = save_dir
+        self.max_chunks = max_chunks
+        self.writer = WriteBehind(max_pending, backpressure) if write_behind else None
+
+        self.segments: Dict[str, SegmentedSeries] = {}
+        # Oldest changed timestamp (UTC epoch nanoseconds) of each series that has not been written yet
+        self._unpersisted: Dict[Tuple[str, Interval], int] = {}
+        self._pending_lock = threading.Lock()
 
         # if the data dir does not exists, create it
         makedirs(self.save_dir, exist_ok=True)
 
-        files = [f for f in listdir(self.save_dir) if isfile(join(self.save_dir, f))]
+        files = listdir(self.save_dir)
         print(f"Found {files} in {self.save_dir}")
 
+        series = {}
         for file in files:
-            symbol, interval = file.split("@")
-            interval = interval.split(".")[0]
+            path = join(self.save_dir, file)
+            if file == "calendar.pickle":
+                for date, row in pd.read_pickle(path).iterrows():
+                    super().add_calendar_data(row.to_dict(), date)
+                continue
+            if "@" not in file:
+                continue
+            segmented = isfile(join(path, MANIFEST))
+            if not segmented and not (isfile(path) and file.endswith(".pickle")):
+                continue
+            name = file if segmented else file[: -len(".pickle")]
+            symbol, interval = name.split("@")
             if interval[0] == "-":
                 interval = int(interval[1:])
             else:
                 interval = interval_string_to_enum(interval)
+            # A legacy file is only left next to a segmented series if it was being converted
+            if segmented:
+                series[name] = (symbol, interval, self._segment(name).read)
+            else:
+                series.setdefault(name, (symbol, interval, partial(pd.read_pickle, path)))
+
+        if lazy:
+            with self.storage_lock:
+                for name, (symbol, interval, reader) in series.items():
+                    segment = self.segments.get(name)
+                    if segment is None:
+                        # Legacy files have no manifest to read the time range from.
+                        stub = LazySeries(reader)
+                    else:
+                        stub = LazySeries(reader, len(segment), segment.start, segment.end)
+                    self.storage_price.setdefault(symbol, {})[interval] = stub
+        else:
+            with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+                frames = pool.map(lambda reader: reader(), [reader for _, _, reader in series.values()])
+                for (symbol, interval, _), data in zip(series.values(), frames):
+                    super().store(symbol, interval, data)
 
-            super().store(symbol, interval, pd.read_pickle(join(self.save_dir, file)))
+    def _segment(self, name: str) -> SegmentedSeries:
+        """
+        Returns the segmented files of the series with the given {symbol}@{interval} name.
+        """
+        segment = self.segments.get(name)
+        if segment is None:
+            with self.storage_lock:
+                segment = self.segments.get(name)
+                if segment is None:
+                    segment = self.segments[name] = SegmentedSeries(join(self.save_dir, name))
+        return segment
 
     def store(
         self,
@@ -50,7 +138,7 @@ class PickleStorage(BaseStorage):
         save_pickle: bool = True,
     ) -> None:
         """
-        Stores the stock data in the storage dictionary as a pickle file.
+        Stores the stock data in the storage dictionary, and appends the new rows to the pickle files of the series.
         :symbol: a stock or crypto
         :interval: the interval between each data point, must be atleast
              1 minute
@@ -60,17 +148,94 @@ class PickleStorage(BaseStorage):
         super().store(symbol, interval, data, remove_duplicate)
 
         if not data.empty and save_pickle:
-            self.storage_lock.acquire()
-            self.storage_price[symbol][interval].to_pickle(
-                self.save_dir + f"/{symbol}@{interval_enum_to_string(interval)}.pickle"
-            )
-            self.storage_lock.release()
+            key = (symbol, interval)
+            since = self._to_ns(data.index.min())
+            with self._pending_lock:
+                self._unpersisted[key] = min(since, self._unpersisted.get(key, since))
+            self._persist(("price", symbol, interval), partial(self._write_series, symbol, interval))
+
+    def _persist(self, key: Any, job: Callable[[], List[str]]) -> None:
+        """
+        Runs a write job, or queues it if write-behind is enabled.
+        """
+        if self.writer is None:
+            job()
+        else:
+            self.writer.submit(key, job)
+
+    def _write_pickle(self, data: pd.DataFrame, path: str) -> List[str]:
+        """
+        Replaces a file in one step, so that a reader never sees it partially written.
+        """
+        # The writer and a store() that runs a job inline may write the same file at once.
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        data.to_pickle(tmp)
+        os.replace(tmp, path)
+        return [path]
 
-    def open(self, symbol: str, interval: Interval) -> pd.DataFrame:
+    def _write_series(self, symbol: str, interval: Interval) -> List[str]:
+        """
+        Appends the rows of a series that changed since it was last written as a new chunk.
+        """
+        with self._pending_lock:
+            since = self._unpersisted.pop((symbol, interval), None)
+        if since is None:
+            return []
+
+        name = f"{symbol}@{interval_enum_to_string(interval)}"
+        segment = self._segment(name)
+        legacy = join(self.save_dir, f"{name}.pickle")
+        with self._series_lock(symbol, interval).read():
+            # Write the stored rows rather than the given data, as they may have been merged with
+            # existing bars. The first chunk of a series holds everything in memory.
+            if segment.chunks:
+                data = self._get_frame(symbol, interval, pd.Timestamp(since, tz="UTC"))
+            else:
+                data = self._get_frame(symbol, interval)
+            paths = segment.append(data)
+        if isfile(legacy):
+            os.remove(legacy)
+        return paths + segment.merge(self.max_chunks, self.price_storage_size if self.price_storage_limit else None)
+
+    def add_calendar_data(self, data: Dict[str, Any], date: dt.date = None) -> None:
+        """
+        Stores the market hours of a date and saves the calendar to calendar.pickle.
+        """
+        super().add_calendar_data(data, date)
+        self._persist("calendar", lambda: self._write_pickle(self.load_calendar(), join(self.save_dir, "calendar.pickle")))
+
+    def flush(self) -> None:
+        """
+        Blocks until every write queued by the background writer is on disk.
+        """
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close(self) -> None:
+        """
+        Writes the queued data and stops the background writer.
+        """
+        if self.writer is not None:
+            self.writer.close()
+        super().close()
+
+    def open(
+        self, symbol: str, interval: Interval, start: dt.datetime = None, end: dt.datetime = None
+    ) -> pd.DataFrame:
+        """
+        Reads a series from disk. Only the chunks that overlap the range from start to end are read.
+        """
         if isinstance(interval, Interval):
             interval = interval_enum_to_string(interval)
-        name = self.save_dir + f"/{symbol}@{interval}.pickle"
-        if isfile(name):
-            return pd.read_pickle(name)
+        name = f"{symbol}@{interval}"
+        if isdir(join(self.save_dir, name)):
+            return self._segment(name).read(
+                None if start is None else self._to_ns(start), None if end is None else self._to_ns(end)
+            )
+        path = join(self.save_dir, f"{name}.pickle")
+        if isfile(path):
+            data = pd.read_pickle(path)
+            i, j = self._range(data.index.asi8, start, end)
+            return data.iloc[i:j]
         else:
             return pd.DataFrame()
@@ -0,0 +1,205 @@
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+"""
+This module implements a columnar circular buffer for OHLCV price data.
+
+Each (symbol, interval) series is kept in preallocated NumPy arrays: an int64
+column of UTC epoch nanoseconds plus one column per price field. Every value is
+written twice, at position p and p + capacity, so the live window is always a
+contiguous slice that is read, or copied, without reassembling the two halves.
+"""
+
+PRICE_COLUMNS = ("open", "high", "low", "close", "volume")
+
+
+class PriceBuffer:
+    """
+    A fixed-capacity circular buffer of price bars, ordered by timestamp.
+
+    Appending a bar newer than the last one, or overwriting the last bar, is O(1).
+    Inserting a bar older than the last one falls back to a merge of the whole buffer.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 200,
+        bounded: bool = True,
+        index_name: str = "timestamp",
+        dtypes: Dict[str, np.dtype] = None,
+    ) -> None:
+        """
+        :capacity: The number of bars to keep. When bounded is False, this is the initial capacity
+            and the buffer doubles in size whenever it is full.
+        :bounded: Whether to drop the oldest bars once capacity is reached.
+        :index_name: Name of the index of DataFrames returned by to_frame().
+        :dtypes: The dtype of each price column. Columns that are not given are float64.
+        """
+        self.capacity = max(int(capacity), 1)
+        self.bounded = bounded
+        self.index_name = index_name
+        self.dtypes = {name: np.dtype(np.float64) for name in PRICE_COLUMNS}
+        self.dtypes.update({name: np.dtype(dtype) for name, dtype in (dtypes or {}).items()})
+        self._allocate(self.capacity)
+
+    def _allocate(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._timestamps = np.empty(capacity * 2, dtype=np.int64)
+        self._columns = {name: np.empty(capacity * 2, dtype=self.dtypes[name]) for name in PRICE_COLUMNS}
+        self._head = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def empty(self) -> bool:
+        return self._count == 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._timestamps.nbytes + sum(c.nbytes for c in self._columns.values())
+
+    def clear(self) -> None:
+        self._head = 0
+        self._count = 0
+
+    # ------------------ Views ------------------ #
+
+    def timestamps(self) -> np.ndarray:
+        """
+        Returns a view of the timestamps in UTC epoch nanoseconds, oldest first.
+        """
+        return self._timestamps[self._head : self._head + self._count]
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Returns a view of the given price column, oldest first.
+        """
+        return self._columns[name][self._head : self._head + self._count]
+
+    def last_timestamp(self) -> int:
+        return int(self._timestamps[self._head + self._count - 1])
+
+    def to_frame(
+        self, symbol: str, columns: Iterable[str] = PRICE_COLUMNS, start: int = 0, stop: int = None
+    ) -> pd.DataFrame:
+        """
+        Wraps a range of the buffer in the MultiIndex DataFrame format used by the rest of Harvest.
+        The range is copied, so the frame does not change when bars are written to the buffer.
+
+        :start: position of the first bar to include, 0 being the oldest bar.
+        :stop: position after the last bar to include. Defaults to the end of the buffer.
+        """
+        timestamps = self.timestamps()[start:stop]
+        index = pd.DatetimeIndex(timestamps.view("datetime64[ns]"), name=self.index_name).tz_localize("UTC")
+        return pd.DataFrame(
+            {(symbol, name): self.column(name)[start:stop].copy() for name in columns}, index=index, copy=False
+        )
+
+    # ------------------ Writes ------------------ #
+
+    def extend(self, timestamps: np.ndarray, values: Dict[str, np.ndarray]) -> None:
+        """
+        Adds bars to the buffer. Bars with a timestamp that already exists replace the stored bar.
+
+        :timestamps: int64 UTC epoch nanoseconds, sorted in ascending order.
+        :values: A dictionary mapping each name in PRICE_COLUMNS to an array the same length as timestamps.
+        """
+        n = len(timestamps)
+        if n == 0:
+            return
+
+        if self._count > 0:
+            last = self.last_timestamp()
+            if timestamps[0] < last:
+                self._merge(timestamps, values)
+                return
+            if timestamps[0] == last:
+                self._write(self._count - 1, timestamps[:1], {k: v[:1] for k, v in values.items()})
+                timestamps = timestamps[1:]
+                values = {k: v[1:] for k, v in values.items()}
+                n -= 1
+                if n == 0:
+                    return
+
+        if not self.bounded and self._count + n > self.capacity:
+            self._grow(self._count + n)
+
+        if n >= self.capacity:
+            # Only the newest bars fit, so start over with them.
+            self._head = 0
+            self._count = 0
+            timestamps = timestamps[-self.capacity :]
+            values = {k: v[-self.capacity :] for k, v in values.items()}
+            n = self.capacity
+
+        overflow = self._count + n - self.capacity
+        if overflow > 0:
+            self._head = (self._head + overflow) % self.capacity
+            self._count -= overflow
+        self._write(self._count, timestamps, values)
+        self._count += n
+
+    def extend_frame(self, data: pd.DataFrame) -> None:
+        """
+        Adds bars from a DataFrame with a datetime index and (a subset of) the columns in PRICE_COLUMNS.
+        The frame is assumed to be sorted by its index.
+        """
+        index = data.index
+        if not isinstance(index, pd.DatetimeIndex):
+            index = pd.DatetimeIndex(index)
+        if index.tz is not None:
+            index = index.tz_convert("UTC")
+        values = {name: self._column_values(data, name) for name in PRICE_COLUMNS}
+        self.extend(index.asi8, values)
+
+    def _column_values(self, data: pd.DataFrame, name: str) -> np.ndarray:
+        dtype = self.dtypes[name]
+        if name not in data:
+            # Integer columns cannot hold NaN
+            return np.zeros(len(data), dtype=dtype) if dtype.kind in "iu" else np.full(len(data), np.nan, dtype=dtype)
+        return data[name].to_numpy(dtype=dtype)
+
+    def _write(self, offset: int, timestamps: np.ndarray, values: Dict[str, np.ndarray]) -> None:
+        """
+        Writes len(timestamps) bars starting at logical position offset, mirroring each write.
+        """
+        n = len(timestamps)
+        start = (self._head + offset) % self.capacity
+        first = min(n, self.capacity - start)
+        for src, dst in [(slice(0, first), start), (slice(first, n), 0)]:
+            length = src.stop - src.start
+            if length <= 0:
+                continue
+            for target, source in [(self._timestamps, timestamps)] + [
+                (self._columns[name], values[name]) for name in PRICE_COLUMNS
+            ]:
+                target[dst : dst + length] = source[src]
+                target[dst + self.capacity : dst + self.capacity + length] = source[src]
+
+    def _grow(self, needed: int) -> None:
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        timestamps = self.timestamps().copy()
+        values = {name: self.column(name).copy() for name in PRICE_COLUMNS}
+        self._allocate(capacity)
+        self._write(0, timestamps, values)
+        self._count = len(timestamps)
+
+    def _merge(self, timestamps: np.ndarray, values: Dict[str, np.ndarray]) -> None:
+        """
+        Slow path for bars that are older than the newest stored bar.
+        New bars take precedence over stored bars with the same timestamp.
+        """
+        all_ts = np.concatenate([self.timestamps(), timestamps])
+        all_values = {name: np.concatenate([self.column(name), values[name]]) for name in PRICE_COLUMNS}
+        # Sort by timestamp, keeping the last occurrence of duplicate timestamps.
+        order = np.lexsort((np.arange(len(all_ts)), all_ts))
+        all_ts = all_ts[order]
+        keep = np.append(all_ts[1:] != all_ts[:-1], True)
+        self.clear()
+        self.extend(all_ts[keep], {name: v[order][keep] for name, v in all_values.items()})
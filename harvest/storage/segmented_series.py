@@ -0,0 +1,162 @@
+import json
+import os
+from os import makedirs
+from os.path import isfile, join
+from threading import Lock
+from typing import Dict, List
+
+import pandas as pd
+
+"""
+This module implements the segmented, append-only file format of PickleStorage.
+
+A series is a directory of immutable chunk files, each holding the rows written by one
+store(), and a small JSON manifest listing the chunks in the order they were written,
+along with the time range and number of rows of each. Writing appends a chunk and
+rewrites the manifest, so its cost depends on the new rows rather than on the length
+of the series. Reading loads only the chunks whose range overlaps the requested one.
+A row found in several chunks, such as a partial bar that was later completed, is
+resolved in favor of the newest chunk.
+
+As a series accumulates chunks, the newest ones are merged into larger chunks, so that
+the number of chunks stays logarithmic in the number of writes.
+"""
+
+MANIFEST = "manifest.json"
+
+
+class SegmentedSeries:
+    """
+    The chunk files and manifest of one (symbol, interval) series.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :path: The directory of the series. The manifest is read if it exists.
+        """
+        self.path = path
+        self.lock = Lock()
+        # Each chunk is a dict of the file name, the timestamps (UTC epoch nanoseconds)
+        # of its first and last rows, and its number of rows.
+        self.chunks: List[Dict] = []
+        self._next = 0
+        manifest = join(path, MANIFEST)
+        if isfile(manifest):
+            with open(manifest) as f:
+                data = json.load(f)
+            self.chunks = data["chunks"]
+            self._next = data["next"]
+
+    def __len__(self) -> int:
+        """
+        Returns the number of rows in the chunks. Rows written more than once are counted once per chunk.
+        """
+        return sum(chunk["rows"] for chunk in self.chunks)
+
+    @property
+    def start(self) -> pd.Timestamp:
+        if not self.chunks:
+            return None
+        return pd.Timestamp(min(chunk["start"] for chunk in self.chunks), tz="UTC")
+
+    @property
+    def end(self) -> pd.Timestamp:
+        if not self.chunks:
+            return None
+        return pd.Timestamp(max(chunk["end"] for chunk in self.chunks), tz="UTC")
+
+    def append(self, data: pd.DataFrame) -> List[str]:
+        """
+        Writes rows as a new chunk, and returns the paths of the files written.
+        """
+        if data.empty:
+            return []
+        with self.lock:
+            makedirs(self.path, exist_ok=True)
+            path = self._write_chunk(data)
+            self.chunks.append(self._describe(path, data))
+            return [path, self._write_manifest()]
+
+    def read(self, start: int = None, end: int = None) -> pd.DataFrame:
+        """
+        Returns the rows between start and end, both inclusive, reading only the chunks that overlap them.
+
+        :start: UTC epoch nanoseconds
+        :end: UTC epoch nanoseconds
+        """
+        with self.lock:
+            chunks = [
+                chunk
+                for chunk in self.chunks
+                if (start is None or chunk["end"] >= start) and (end is None or chunk["start"] <= end)
+            ]
+            data = self._read_chunks(chunks)
+        if data.empty:
+            return data
+        timestamps = data.index.asi8
+        i = 0 if start is None else int(timestamps.searchsorted(start, side="left"))
+        j = len(timestamps) if end is None else int(timestamps.searchsorted(end, side="right"))
+        return data.iloc[i:j]
+
+    def merge(self, max_chunks: int, keep: int = None) -> List[str]:
+        """
+        If the series has more than max_chunks chunks, merges the newest chunks into one.
+        Chunks are merged from the newest back, as long as the next older chunk is not larger
+        than the rows merged so far. Returns the paths of the files written.
+
+        :keep: If given, chunks that only hold rows older than the newest keep rows are deleted.
+        """
+        with self.lock:
+            if len(self.chunks) <= max_chunks:
+                return []
+            i = len(self.chunks) - 2
+            rows = self.chunks[-1]["rows"] + self.chunks[-2]["rows"]
+            while i > 0 and self.chunks[i - 1]["rows"] <= rows:
+                i -= 1
+                rows += self.chunks[i]["rows"]
+
+            data = self._read_chunks(self.chunks[i:])
+            if keep is not None and len(data) >= keep:
+                data = data.iloc[-keep:]
+                i = 0
+            path = self._write_chunk(data)
+            removed = self.chunks[i:]
+            self.chunks = self.chunks[:i] + [self._describe(path, data)]
+            manifest = self._write_manifest()
+            # Chunks are only deleted once the manifest no longer lists them.
+            for chunk in removed:
+                os.remove(join(self.path, chunk["file"]))
+            return [path, manifest]
+
+    def _read_chunks(self, chunks: List[Dict]) -> pd.DataFrame:
+        if not chunks:
+            return pd.DataFrame()
+        data = pd.concat([pd.read_pickle(join(self.path, chunk["file"])) for chunk in chunks])
+        if len(chunks) > 1:
+            data = data[~data.index.duplicated(keep="last")].sort_index()
+        return data
+
+    def _write_chunk(self, data: pd.DataFrame) -> str:
+        path = join(self.path, f"{self._next:08d}.pickle")
+        self._next += 1
+        data.to_pickle(path)
+        return path
+
+    def _describe(self, path: str, data: pd.DataFrame) -> Dict:
+        timestamps = data.index.asi8
+        return {
+            "file": os.path.basename(path),
+            "start": int(timestamps.min()),
+            "end": int(timestamps.max()),
+            "rows": len(data),
+        }
+
+    def _write_manifest(self) -> str:
+        """
+        Replaces the manifest in one step, so that it always lists a complete set of chunks.
+        """
+        path = join(self.path, MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"chunks": self.chunks, "next": self._next}, f)
+        os.replace(path + ".tmp", path)
+        return path
@@ -0,0 +1,64 @@
+from typing import Callable, Union
+
+import pandas as pd
+
+from harvest.storage.price_buffer import PriceBuffer
+
+"""
+This module defines placeholders for price series that are stored but not in memory.
+
+BaseStorage keeps a placeholder in place of the price history of a (symbol, interval)
+pair, and replaces it with the real data the first time the series is read or written.
+"""
+
+
+class SeriesStub:
+    """
+    Placeholder for a price series that is not in memory.
+    """
+
+    def __init__(self, length: int = None, start: pd.Timestamp = None, end: pd.Timestamp = None) -> None:
+        """
+        :length: The number of rows, if known.
+        :start: The timestamp of the oldest row, if known.
+        :end: The timestamp of the newest row, if known.
+        """
+        self.length = length
+        self.start = start
+        self.end = end
+
+    def __len__(self) -> int:
+        return self.length or 0
+
+    @property
+    def empty(self) -> bool:
+        return self.length == 0
+
+    def restore(self) -> Union[pd.DataFrame, PriceBuffer]:
+        """
+        Returns the series in the format it was stored in.
+        """
+        raise NotImplementedError
+
+
+class LazySeries(SeriesStub):
+    """
+    A series that has been found in a data directory, but not read yet.
+    The data is read the first time the series is used.
+    """
+
+    def __init__(
+        self,
+        reader: Callable[[], pd.DataFrame],
+        length: int = None,
+        start: pd.Timestamp = None,
+        end: pd.Timestamp = None,
+    ) -> None:
+        """
+        :reader: A function that reads the series as a DataFrame in the format passed to BaseStorage.store().
+        """
+        super().__init__(length, start, end)
+        self.reader = reader
+
+    def restore(self) -> pd.DataFrame:
+        return self.reader()
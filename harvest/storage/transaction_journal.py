@@ -0,0 +1,183 @@
+import datetime as dt
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from harvest.util.helper import symbol_type
+
+"""
+This module implements an append-only journal of filled orders.
+
+Transactions are kept in typed NumPy arrays that grow by doubling, with symbols and
+algorithm names interned into integer ids. Two indexes are maintained as fills arrive:
+- the rows of each (symbol, trading day) pair, used to detect day trades, and
+- a sorted array of day trade timestamps, used to count day trades in a rolling window.
+Both make a fill and a pattern-day-trade check independent of the length of the history.
+"""
+
+SIDES = {"buy": 1, "sell": -1}
+SIDE_NAMES = {1: "buy", -1: "sell"}
+
+
+class TransactionJournal:
+    """
+    An append-only, typed store of filled orders and the day trades they caused.
+    """
+
+    def __init__(self, capacity: int = 256) -> None:
+        self._count = 0
+        self._timestamps = np.empty(capacity, dtype=np.int64)
+        self._symbols = np.empty(capacity, dtype=np.int32)
+        self._algorithms = np.empty(capacity, dtype=np.int32)
+        self._sides = np.empty(capacity, dtype=np.int8)
+        self._quantities = np.empty(capacity, dtype=np.float64)
+        self._prices = np.empty(capacity, dtype=np.float64)
+
+        self._daytrade_count = 0
+        self._daytrade_timestamps = np.empty(capacity, dtype=np.int64)
+        self._daytrade_symbols = np.empty(capacity, dtype=np.int32)
+
+        # Interned strings
+        self._names: List[str] = []
+        self._name_ids: Dict[str, int] = {}
+
+        # (symbol, date) -> row numbers of the transactions of that symbol on that day
+        self._day_index: Dict[Tuple[str, dt.date], List[int]] = {}
+
+        # Timezone of the stored timestamps, taken from the first transaction
+        self.tz = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _intern(self, name: str) -> int:
+        if name not in self._name_ids:
+            self._name_ids[name] = len(self._names)
+            self._names.append(name)
+        return self._name_ids[name]
+
+    @staticmethod
+    def _to_ns(timestamp: dt.datetime) -> int:
+        return pd.Timestamp(timestamp).value
+
+    @staticmethod
+    def _grow(array: np.ndarray, needed: int) -> np.ndarray:
+        if needed <= len(array):
+            return array
+        grown = np.empty(max(needed, len(array) * 2), dtype=array.dtype)
+        grown[: len(array)] = array
+        return grown
+
+    def append(
+        self,
+        timestamp: dt.datetime,
+        algorithm_name: str,
+        symbol: str,
+        side: str,
+        quantity: float,
+        price: float,
+    ) -> bool:
+        """
+        Records a filled order.
+
+        :returns: True if the fill completed a day trade.
+        """
+        if self._count == 0:
+            self.tz = timestamp.tzinfo
+
+        n = self._count
+        needed = n + 1
+        self._timestamps = self._grow(self._timestamps, needed)
+        self._symbols = self._grow(self._symbols, needed)
+        self._algorithms = self._grow(self._algorithms, needed)
+        self._sides = self._grow(self._sides, needed)
+        self._quantities = self._grow(self._quantities, needed)
+        self._prices = self._grow(self._prices, needed)
+
+        self._timestamps[n] = self._to_ns(timestamp)
+        self._symbols[n] = self._intern(symbol)
+        self._algorithms[n] = self._intern(algorithm_name)
+        self._sides[n] = SIDES[side]
+        self._quantities[n] = quantity
+        self._prices[n] = price
+        self._count = needed
+
+        rows = self._day_index.setdefault((symbol, timestamp.date()), [])
+        previous = rows[-1] if rows else None
+        rows.append(n)
+
+        # Crypto is not subject to day trade rules.
+        if symbol_type(symbol) == "CRYPTO" or previous is None:
+            return False
+        # Note that we don't support shorting, so a sell always closes a position.
+        if side == "sell" and self._sides[previous] == SIDES["buy"]:
+            self._add_daytrade(self._timestamps[n], self._symbols[n])
+            return True
+        return False
+
+    def _add_daytrade(self, timestamp: int, symbol_id: int) -> None:
+        n = self._daytrade_count
+        self._daytrade_timestamps = self._grow(self._daytrade_timestamps, n + 1)
+        self._daytrade_symbols = self._grow(self._daytrade_symbols, n + 1)
+        # Fills almost always arrive in order, so this is normally an append.
+        i = n
+        if n > 0 and timestamp < self._daytrade_timestamps[n - 1]:
+            i = int(self._daytrade_timestamps[:n].searchsorted(timestamp, side="right"))
+            self._daytrade_timestamps[i + 1 : n + 1] = self._daytrade_timestamps[i:n]
+            self._daytrade_symbols[i + 1 : n + 1] = self._daytrade_symbols[i:n]
+        self._daytrade_timestamps[i] = timestamp
+        self._daytrade_symbols[i] = symbol_id
+        self._daytrade_count = n + 1
+
+    def count_daytrades(self, since: dt.datetime) -> int:
+        """
+        Returns the number of day trades made at or after the given time.
+        """
+        timestamps = self._daytrade_timestamps[: self._daytrade_count]
+        return self._daytrade_count - int(timestamps.searchsorted(self._to_ns(since)))
+
+    def transactions_on(self, symbol: str, date: dt.date) -> List[int]:
+        """
+        Returns the row numbers of the transactions of the symbol on the given day.
+        """
+        return self._day_index.get((symbol, date), [])
+
+    # ------------------ DataFrame views ------------------ #
+
+    def _to_index(self, timestamps: np.ndarray) -> pd.DatetimeIndex:
+        index = pd.DatetimeIndex(timestamps.view("datetime64[ns]"))
+        if self.tz is not None:
+            index = index.tz_localize("UTC").tz_convert(self.tz)
+        return index
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Returns the transactions as a DataFrame indexed by timestamp.
+        """
+        n = self._count
+        index = self._to_index(self._timestamps[:n])
+        names = np.array(self._names, dtype=object)
+        return pd.DataFrame(
+            {
+                "timestamp": index,
+                "algorithm_name": names[self._algorithms[:n]],
+                "symbol": names[self._symbols[:n]],
+                "side": [SIDE_NAMES[s] for s in self._sides[:n]],
+                "quantity": self._quantities[:n],
+                "price": self._prices[:n],
+            },
+            index=index,
+        )
+
+    def daytrades_to_frame(self) -> pd.DataFrame:
+        """
+        Returns the day trades as a DataFrame indexed by timestamp.
+        """
+        n = self._daytrade_count
+        index = self._to_index(self._daytrade_timestamps[:n])
+        names = np.array(self._names, dtype=object)
+        return pd.DataFrame(
+            {"timestamp": index, "symbol": names[self._daytrade_symbols[:n]]},
+            index=index,
+        )
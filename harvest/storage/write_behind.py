@@ -0,0 +1,127 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Iterable
+
+from harvest.util.helper import debugger
+
+"""
+This module implements a background writer for storages that persist data to disk.
+
+Storages update memory synchronously and submit a job that writes the change to disk.
+Jobs are keyed, typically by (symbol, interval): submitting a job while one with the
+same key is still pending replaces it, so a series that is updated several times
+before the writer gets to it is written once. Each job reads the state to write when
+it runs, not when it is submitted. Files written by a batch of jobs are fsynced
+together at the end of the batch.
+"""
+
+BACKPRESSURE_POLICIES = ("block", "inline")
+
+
+class WriteBehind:
+    """
+    A bounded queue of coalescing write jobs, run by a background thread.
+    """
+
+    def __init__(self, max_pending: int = 1000, backpressure: str = "block", fsync: bool = True) -> None:
+        """
+        :max_pending: The maximum number of pending jobs.
+        :backpressure: What to do when a job is submitted while the queue is full:
+            'block' waits for the writer to make room, and 'inline' runs the job in the
+            calling thread.
+        :fsync: Whether to fsync the files written by each batch of jobs.
+        """
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Invalid backpressure policy {backpressure}, must be one of {BACKPRESSURE_POLICIES}")
+        self.max_pending = max_pending
+        self.backpressure = backpressure
+        self.fsync = fsync
+
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, key: Hashable, job: Callable[[], Iterable[str]]) -> None:
+        """
+        Queues a job. If a job with the same key is pending, it is replaced.
+
+        :job: A function that writes to disk and returns the paths of the files it wrote.
+        """
+        inline = False
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Cannot submit a job to a closed writer")
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                if self.backpressure == "inline":
+                    inline = True
+                else:
+                    while key not in self._pending and len(self._pending) >= self.max_pending:
+                        self._cond.wait()
+            if not inline:
+                self._pending[key] = job
+                self._cond.notify_all()
+                return
+        self._sync(self._call(job))
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch = list(self._pending.values())
+                self._pending.clear()
+                self._busy = True
+                # Wake up threads waiting for room in the queue
+                self._cond.notify_all()
+
+            paths = set()
+            for job in batch:
+                paths.update(self._call(job))
+            self._sync(paths)
+
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def _call(self, job: Callable[[], Iterable[str]]) -> Iterable[str]:
+        try:
+            return job() or ()
+        except Exception as e:
+            debugger.error(f"Failed to write to disk: {e}")
+            return ()
+
+    def _sync(self, paths: Iterable[str]) -> None:
+        if not self.fsync:
+            return
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                debugger.warning(f"Failed to fsync {path}: {e}")
+
+    def flush(self) -> None:
+        """
+        Blocks until every job submitted so far has been written.
+        """
+        with self._cond:
+            while self._pending or self._busy:
+                self._cond.wait()
+
+    def close(self) -> None:
+        """
+        Writes the pending jobs and stops the writer.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
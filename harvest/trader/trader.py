@@ -1,14 +1,17 @@
 import datetime as dt
 import sys
+import time
 import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from signal import SIGINT, signal
 from sys import exit
-from typing import Dict, List, Union
+from typing import Dict, List, Tuple, Union
 
 import pandas as pd
 import tzlocal
 from rich import box
 from rich.console import Console
+from rich.status import Status
 from rich.table import Table
 
 from harvest.definitions import (
@@ -19,16 +22,20 @@ from harvest.definitions import (
     Stats,
 )
 from harvest.enum import BrokerType, DataBrokerType, Interval, StorageType, TradeBrokerType
+from harvest.storage import BaseStorage
 from harvest.util.factory import load_broker, load_storage
 from harvest.util.helper import (
+    aggregate_df,
     check_interval,
     debugger,
     interval_string_to_enum,
+    interval_to_timedelta,
     mark_down,
     mark_up,
     symbol_type,
     utc_current_time,
 )
+from harvest.util.lock import RateLimiter
 
 
 class BrokerHub:
@@ -48,11 +55,16 @@ class BrokerHub:
         Interval.DAY_1,
     ]
 
+    # Number of times a series that failed to be fetched at startup is retried, and the
+    # delay before the first retry in seconds, which doubles with every retry.
+    backfill_retries = 2
+    backfill_backoff = 1.0
+
     def __init__(
         self,
         data_broker: BrokerType = None,
         trade_broker: BrokerType = None,
-        storage: StorageType = None,
+        storage: Union[StorageType, BaseStorage] = None,
         debug: bool = False,
     ) -> None:
         """
@@ -61,6 +73,7 @@ class BrokerHub:
         :param str? data_broker: The broker to use to obtain data. If not specified, defaults to 'dummy'.
         :param str? trade_broker: The broker to use to place orders. If not specified, defaults to 'paper'.
         :param str? storage: The storage to use. If not specified, defaults to 'base', which is saves data to RAM.
+            A storage instance can also be given, to use a storage created with non-default arguments.
         :param bool? debug: If true, the debugger will be set to debug mode. defaults to False.
         """
 
@@ -104,7 +117,7 @@ class BrokerHub:
         if self.trade_broker.value not in TradeBrokerType.list():
             raise Exception(f"{self.trade_broker} cannot be used to place trades.")
 
-    def _set_storage(self, storage: StorageType) -> None:
+    def _set_storage(self, storage: Union[StorageType, BaseStorage]) -> None:
         """
         Sets the storage to use.
         """
@@ -136,6 +149,7 @@ class BrokerHub:
             self.load,
             self.store,
             self.load_daytrade,
+            self.load_panel,
         )
 
         self.account = Account()
@@ -167,7 +181,8 @@ class BrokerHub:
         else:
             self.data_broker_ref = self.trade_broker_ref
 
-        self.storage = load_storage(self.storage)()
+        if not isinstance(self.storage, BaseStorage):
+            self.storage = load_storage(self.storage)()
         self.storage.setup(self.stats)
 
     def start(
@@ -192,7 +207,7 @@ class BrokerHub:
         if aggregations == None:
             aggregations = []
 
-        with self.console.status("[bold green] Setting up Trader...[/bold green]") as _:
+        with self.console.status("[bold green] Setting up Trader...[/bold green]") as status:
             if not self.skip_init:
                 self._init_param_streamer_broker(interval, aggregations)
             # If sync is on, call the broker to load pending orders and all positions currently held.
@@ -210,7 +225,8 @@ class BrokerHub:
             self.storage.init_performance_data(self.account.equity, self.stats.timestamp)
 
             # Initialize the storage
-            self._storage_init(all_history)
+            self._storage_init(all_history, status)
+            status.update("[bold green] Setting up Trader...[/bold green]")
             self.console.print(f"- [cyan]{self.storage.__class__.__name__}[/cyan] setup complete")
 
             for a in self.algo:
@@ -414,17 +430,85 @@ class BrokerHub:
             raise Exception("Failed to load account info from broker.")
         self.account.init(ret)
 
-    def _storage_init(self, all_history: bool) -> None:
+    def _storage_init(self, all_history: bool, status: Status = None) -> None:
         """
-        Initializes the storage.
+        Initializes the storage with the price history of the watchlist.
+
+        The series are fetched by a pool of threads, within the max_concurrency and rate_limit
+        of the data broker. The history of an aggregation is built from the history of the
+        base interval when it covers the bars the storage keeps, and fetched otherwise.
+        A series that fails to be fetched is retried backfill_retries times, then skipped.
         :all_history: bool :
+        :status: a status display to show the progress in.
+        """
+        start = None if all_history else utc_current_time() - dt.timedelta(days=3)
+        broker = self.data_broker_ref
+        limiter = RateLimiter(broker.rate_limit)
+        cfg = self.stats.watchlist_cfg
+        total = sum(1 + len(cfg[sym]["aggregations"]) for sym in cfg)
+        done, failed = 0, []
+
+        with ThreadPoolExecutor(max_workers=max(broker.max_concurrency, 1)) as pool:
+            pending = {}
+            for sym in cfg:
+                pending[pool.submit(self._fetch_history, limiter, sym, cfg[sym]["interval"], start)] = sym
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    sym = pending.pop(future)
+                    inter, df = future.result()
+                    done += 1
+                    if df is None:
+                        failed.append(f"{sym} {inter.name}")
+                    else:
+                        self.storage.store(sym, inter, df)
+                    if inter != cfg[sym]["interval"]:
+                        continue
+
+                    for agg in cfg[sym]["aggregations"]:
+                        if df is not None and self._covers(df, agg, start):
+                            self.storage.store(sym, agg, aggregate_df(df, agg))
+                            done += 1
+                        else:
+                            pending[pool.submit(self._fetch_history, limiter, sym, agg, start)] = sym
+                if status is not None:
+                    status.update(f"[bold green] Fetching price history {done}/{total}...[/bold green]")
+
+        if failed:
+            debugger.error(f"Failed to fetch the price history of {', '.join(failed)}")
+
+    def _fetch_history(
+        self, limiter: RateLimiter, symbol: str, interval: Interval, start: dt.datetime
+    ) -> Tuple[Interval, pd.DataFrame]:
+        """
+        Fetches the price history of a series, retrying on failure.
+        :returns: the interval and the history, which is None if every attempt failed.
         """
+        for attempt in range(self.backfill_retries + 1):
+            if attempt > 0:
+                time.sleep(self.backfill_backoff * 2 ** (attempt - 1))
+            limiter.acquire()
+            try:
+                return interval, self.data_broker_ref.fetch_price_history(symbol, interval, start)
+            except Exception as e:
+                debugger.warning(f"Failed to fetch the {interval.name} history of {symbol}: {e}")
+        return interval, None
 
-        for sym in self.stats.watchlist_cfg.keys():
-            for inter in [self.stats.watchlist_cfg[sym]["interval"]] + self.stats.watchlist_cfg[sym]["aggregations"]:
-                start = None if all_history else utc_current_time() - dt.timedelta(days=3)
-                df = self.data_broker_ref.fetch_price_history(sym, inter, start)
-                self.storage.store(sym, inter, df)
+    def _covers(self, data: pd.DataFrame, interval: Interval, start: dt.datetime) -> bool:
+        """
+        Returns True if the history of a base interval reaches back far enough to build
+        the history of the given interval from it.
+        """
+        if data.empty:
+            return False
+        period = interval_to_timedelta(interval)
+        needed = start
+        if self.storage.price_storage_limit:
+            # Only the last price_storage_size bars are kept
+            oldest = data.index[-1] - period * self.storage.price_storage_size
+            needed = oldest if needed is None else max(needed, oldest)
+        # Without a limit or a start, all of the history is needed, which only the broker has.
+        return needed is not None and data.index[0] <= needed + period
 
     # ================== Functions for main routine =====================
 
@@ -439,7 +523,9 @@ class BrokerHub:
         debugger.debug(f"{df_dict}")
 
         self.storage.add_performance_data(self.account.equity, self.stats.timestamp)
-        self.storage.add_calendar_data(self.data_broker_ref.fetch_market_hours(self.stats.timestamp.date()))
+        today = self.stats.timestamp.date()
+        if self.storage.needs_calendar_data(today, self.stats.timestamp):
+            self.storage.add_calendar_data(self.data_broker_ref.fetch_market_hours(today), today)
 
         # Save the data locally
         for sym in df_dict:
@@ -460,9 +546,12 @@ class BrokerHub:
 
         # self._print_positions()
 
+        hours = self.storage.load_market_hours(self.stats.timestamp.date())
+        close_at = hours["close_at"] if hours and hours["is_open"] else None
+
         new_algo = []
         for a in self.algo:
-            if not check_interval(self.stats.timestamp, a.interval):
+            if not check_interval(self.stats.timestamp, a.interval, close_at):
                 new_algo.append(a)
                 continue
             try:
@@ -481,6 +570,9 @@ class BrokerHub:
 
         self.algo = new_algo
 
+        # Write the transactions and equity of this tick
+        self.storage.commit()
+
         self.trade_broker_ref.exit()
         self.data_broker_ref.exit()
 
@@ -489,14 +581,13 @@ class BrokerHub:
         and update the order queue accordingly.
         """
         debugger.debug(f"Updating order queue: {self.orders}")
-        for order in self.orders.orders:
-            typ = order.type
-            if typ == "STOCK":
-                stat = self.trade_broker_ref.fetch_stock_order_status(order.order_id)
-            elif typ == "OPTION":
-                stat = self.trade_broker_ref.fetch_option_order_status(order.order_id)
-            elif typ == "CRYPTO":
-                stat = self.trade_broker_ref.fetch_crypto_order_status(order.order_id)
+        orders = self.orders.orders
+        statuses = self.trade_broker_ref.fetch_order_statuses({order.order_id: order.type for order in orders})
+        for order in orders:
+            stat = statuses.get(order.order_id)
+            if stat is None:
+                debugger.warning(f"Status of order {order.order_id} is unavailable, keeping its last known status")
+                continue
             debugger.debug(f"Updating status of order {order.order_id}")
             order.update(stat)
 
@@ -529,26 +620,38 @@ class BrokerHub:
 
         debugger.debug(f"Got data: {df_dict}")
 
+        # Assets that are not in the watchlist, and options, are quoted in bulk
+        unwatched = [
+            p.symbol for p in self.positions.stock_crypto if p.symbol not in df_dict and p.symbol not in self.watchlist
+        ]
+        prices = self.data_broker_ref.fetch_latest_prices(unwatched) if unwatched else {}
         for p in self.positions.stock_crypto:
             symbol = p.symbol
             if symbol in df_dict:
                 sym_df = df_dict[symbol]
                 price_df = sym_df.iloc[-1]
                 price = price_df[symbol]["close"]
-            elif symbol not in self.watchlist:  # handle cases when user has an asset not in watchlist
-                price = self.data_broker_ref.fetch_latest_price(symbol)
+            elif symbol in prices:
+                price = prices[symbol]
             else:
                 continue
             p.update(price)
-        for p in self.positions.option:
-            symbol = p.symbol
-            price = self.data_broker_ref.fetch_option_market_data(symbol)["price"]
-            p.update(price)
+        self._update_option_prices()
 
         self.account.update()
 
         debugger.debug(f"Updated positions: {self.positions}")
 
+    def _update_option_prices(self) -> None:
+        """Updates the price of every option position, with a single quote request if the broker supports it"""
+        symbols = [p.symbol for p in self.positions.option]
+        if not symbols:
+            return
+        quotes = self.data_broker_ref.fetch_option_quotes(symbols)
+        for p in self.positions.option:
+            if p.symbol in quotes:
+                p.update(quotes[p.symbol]["price"])
+
     def _fetch_account_data(self) -> None:
         debugger.debug("Fetching account data")
         stock_pos = [
@@ -571,12 +674,12 @@ class BrokerHub:
         ]
         self.positions.update(stock_pos, option_pos, crypto_pos)
         # Get the latest price for all positions
+        symbols = [p.symbol for p in self.positions.stock_crypto]
+        prices = self.data_broker_ref.fetch_latest_prices(symbols) if symbols else {}
         for p in self.positions.stock_crypto:
-            price = self.data_broker_ref.fetch_latest_price(p.symbol)
-            p.update(price)
-        for p in self.positions.option:
-            price = self.data_broker_ref.fetch_option_market_data(p.symbol)["price"]
-            p.update(price)
+            if p.symbol in prices:
+                p.update(prices[p.symbol])
+        self._update_option_prices()
 
         ret = self.trade_broker_ref.fetch_account()
 
@@ -602,13 +705,17 @@ class BrokerHub:
     def load_daytrade(self, *args, **kwargs):
         return self.storage.load_daytrade(*args, **kwargs)
 
+    def load_panel(self, *args, **kwargs):
+        return self.storage.load_panel(*args, **kwargs)
+
     def buy(self, symbol: str, quantity: int, in_force: str, extended: bool):
         # Check if user has enough buying power
         buy_power = self.account.buying_power
         if symbol_type(symbol) == "OPTION":
             price = self.data_broker_ref.fetch_option_market_data(symbol)["price"]
         else:
-            price = self.storage.load(symbol, self.stats.watchlist_cfg[symbol]["interval"])[symbol]["close"][-1]
+            interval = self.stats.watchlist_cfg[symbol]["interval"]
+            price = self.storage.load(symbol, interval, fields="close", as_numpy=True)[-1]
 
         limit_price = mark_up(price)
         total_price = limit_price * quantity
@@ -649,7 +756,8 @@ class BrokerHub:
         if symbol_type(symbol) == "OPTION":
             price = self.data_broker_ref.fetch_option_market_data(symbol)["price"]
         else:
-            price = self.storage.load(symbol, self.stats.watchlist_cfg[symbol]["interval"])[symbol]["close"][-1]
+            interval = self.stats.watchlist_cfg[symbol]["interval"]
+            price = self.storage.load(symbol, interval, fields="close", as_numpy=True)[-1]
 
         limit_price = mark_down(price)
 
@@ -713,26 +821,23 @@ class BrokerHub:
 
     def day_trade_count(self) -> None:
         # Get the 5-day trading window
-        calendar = self.storage.load_calendar()
-        debugger.debug(f"Calendar: {calendar}")
-        open_days = calendar.loc[calendar["is_open"] == True]
+        open_days = self.storage.load_open_days(5)
+        debugger.debug(f"Open days: {open_days}")
         if len(open_days) == 0:
             return 0
-        elif len(open_days) < 5:
-            window_start = open_days.iloc[0]["open_at"]
-        else:
-            window_start = open_days.iloc[-5]["open_at"]
+        window_start = open_days[0][1]["open_at"]
 
         # Check how many daytrades occurred in the last 5 trading days
-        day_trades = self.storage.load_daytrade()
-        debugger.debug(f"Day trades: {day_trades}")
-        day_trades = day_trades.loc[day_trades["timestamp"] >= window_start]
-
-        return len(day_trades)
+        return self.storage.count_daytrades(window_start)
 
     def exit(self, signum, frame):
-        # TODO: Gracefully exit
         debugger.debug("\nStopping Harvest...")
+        # Write out any data the storage has not persisted yet
+        try:
+            self.storage.flush()
+            self.storage.close()
+        except Exception as e:
+            debugger.error(f"Failed to close storage: {e}")
         exit(0)
 
 
@@ -741,7 +846,9 @@ class PaperTrader(BrokerHub):
     A class for trading in the paper trading environment.
     """
 
-    def __init__(self, streamer: BrokerType = None, storage: StorageType = None, debug: bool = False) -> None:
+    def __init__(
+        self, streamer: BrokerType = None, storage: Union[StorageType, BaseStorage] = None, debug: bool = False
+    ) -> None:
         """Initializes the Trader."""
 
         self._init_checks()
@@ -23,6 +23,14 @@ def load_storage(storage_type: StorageType) -> BaseStorage:
         from harvest.storage.database_storage import DBStorage
 
         return DBStorage
+    elif storage_type.value == StorageType.PARQUET.value:
+        from harvest.storage.parquet_storage import ParquetStorage
+
+        return ParquetStorage
+    elif storage_type.value == StorageType.MMAP.value:
+        from harvest.storage.mmap_storage import MmapStorage
+
+        return MmapStorage
     else:
         raise ValueError(f"Invalid storage option: {storage_type}")
 
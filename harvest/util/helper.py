@@ -6,6 +6,7 @@ import sys
 from datetime import timezone as tz
 from typing import Tuple, Union
 
+import numpy as np
 import pandas as pd
 
 from harvest.enum import BrokerType, DataBrokerType, Interval, StorageType, TimeRange, TradeBrokerType
@@ -55,7 +56,7 @@ def interval_enum_to_string(enum: Interval) -> str:
         return str(enum)
 
 
-def check_interval(time: dt.datetime, interval: Interval):
+def check_interval(time: dt.datetime, interval: Interval, close_at: dt.datetime = None):
     """
     Determine if algorithm should be invoked for the
     current time, given the interval. For example, if interval is 30MIN,
@@ -63,6 +64,7 @@ def check_interval(time: dt.datetime, interval: Interval):
 
     :time: The current time
     :interval: The interval to check the time against
+    :close_at: The time the market closes today, if known
     """
 
     time = time.astimezone(tz.utc)  # Adjust to UTC timezone
@@ -73,8 +75,11 @@ def check_interval(time: dt.datetime, interval: Interval):
     minutes = time.minute
     hours = time.hour
     if interval == Interval.DAY_1:
-        # For now, assume market closes at 19:50 UTC
-        # TODO: Use API to get real-time market hours
+        if close_at is not None:
+            # Run 10 minutes before the market closes
+            trigger = pd.Timestamp(close_at).astimezone(tz.utc) - dt.timedelta(minutes=10)
+            return minutes == trigger.minute and hours == trigger.hour
+        # Without market hours, assume market closes at 20:00 UTC
         return minutes == 50 and hours == 19
     elif interval == Interval.HR_1:
         return minutes == 0
@@ -246,6 +251,10 @@ def str_to_storage_type(name: str) -> StorageType:
         return StorageType.PICKLE
     elif name == "db":
         return StorageType.DB
+    elif name == "parquet":
+        return StorageType.PARQUET
+    elif name == "mmap":
+        return StorageType.MMAP
     else:
         raise ValueError(f"Invalid StorageType {name}")
 
@@ -257,6 +266,24 @@ def normalize_pandas_dt_index(df: pd.DataFrame) -> pd.Index:
     return df.index.floor("min")
 
 
+def compact_df(df: pd.DataFrame, symbol: str) -> pd.DataFrame:
+    """
+    Converts price data to compact dtypes: float32 prices, and uint64 volume.
+    Crypto can be traded in fractions, so its volume is stored as float32 instead.
+
+    :df: A dataframe with price columns, which may be under a symbol level
+    :symbol: The symbol of the data
+    """
+    volume_dtype = np.float32 if symbol_type(symbol) == "CRYPTO" else np.uint64
+    dtypes = {}
+    for column in df.columns:
+        name = column[-1] if isinstance(column, tuple) else column
+        dtypes[column] = volume_dtype if name == "volume" else np.float32
+    if volume_dtype == np.uint64:
+        df = df.fillna({c: 0 for c, dtype in dtypes.items() if dtype == np.uint64})
+    return df.astype(dtypes)
+
+
 def aggregate_df(df, interval: Interval) -> pd.DataFrame:
     """
     Aggregate the dataframe data points to the given interval.
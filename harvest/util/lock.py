@@ -0,0 +1,95 @@
+import threading
+import time
+from contextlib import contextmanager
+
+"""
+This module provides synchronization primitives shared across Harvest.
+"""
+
+
+class ReadWriteLock:
+    """
+    A lock that allows any number of concurrent readers, or a single writer.
+
+    Writers are given priority: once a writer is waiting, new readers block until
+    it has finished, so a steady stream of readers cannot starve the writer.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self) -> None:
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self, blocking: bool = True) -> bool:
+        with self._cond:
+            if not blocking:
+                if self._writer or self._readers:
+                    return False
+                self._writer = True
+                return True
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+            return True
+
+    def release_write(self) -> None:
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class RateLimiter:
+    """
+    Spaces out calls so that at most rate of them start per second, across threads.
+    """
+
+    def __init__(self, rate: float = None) -> None:
+        """
+        :rate: The maximum number of calls per second, or None for no limit.
+        """
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def acquire(self) -> None:
+        """
+        Blocks until the next call is allowed to start.
+        """
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + 1 / self.rate
+        time.sleep(start - now)
@@ -72,6 +72,17 @@ class TestDummyStreamer(unittest.TestCase):
 
         dummy.step()
 
+    def test_fetch_latest_prices(self):
+        dummy = DummyDataBroker()
+        prices = dummy.fetch_latest_prices(["A", "@D", "A"])
+        self.assertListEqual(list(prices), ["A", "@D"])
+        self.assertEqual(prices["A"], dummy.fetch_latest_price("A"))
+
+        occ_symbol = dummy.data_to_occ("A", dt.datetime(2000, 2, 1), "call", 10.0)
+        quotes = dummy.fetch_option_quotes([occ_symbol])
+        self.assertDictEqual(quotes[occ_symbol], dummy.fetch_option_market_data(occ_symbol))
+        self.assertDictEqual(dummy.fetch_latest_prices([]), {})
+
     def test_simple_static(self):
         dummy1 = DummyDataBroker()
         dummy2 = DummyDataBroker()
@@ -90,6 +90,23 @@ class TestPaperBroker(unittest.TestCase):
         self.assertEqual(account_after["cash"], account["cash"] - cost_1)
         self.assertEqual(account_after["buying_power"], account["buying_power"] - cost_1)
 
+    @delete_save_files(".")
+    def test_order_statuses(self):
+        """
+        Test that the statuses of several orders are fetched at once.
+        """
+        _, dummy, paper = create_trader_and_api(DataBrokerType.DUMMY, TradeBrokerType.PAPER, "5MIN", ["A"])
+        A_price = dummy.fetch_latest_price("A")
+        first = paper.order_stock_limit("buy", "A", 5, A_price * 1.05)
+        second = paper.order_stock_limit("buy", "A", 2, A_price * 1.05)
+
+        statuses = paper.fetch_order_statuses({first["order_id"]: "STOCK", second["order_id"]: "STOCK"})
+        self.assertEqual(len(statuses), 2)
+        self.assertEqual(statuses[first["order_id"]]["quantity"], 5)
+        self.assertEqual(statuses[second["order_id"]]["quantity"], 2)
+        self.assertTrue(all(status["status"] == "filled" for status in statuses.values()))
+        self.assertEqual(paper.fetch_order_statuses({}), {})
+
     # def test_buy(self):
 
     #     trader, dummy, paper = create_trader_and_api("dummy", "paper", "1MIN", ["A"])
@@ -1,11 +1,17 @@
+import datetime as dt
+import os
+import tempfile
+import threading
 import unittest
 
+import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
 from harvest.enum import Interval
 from harvest.storage import BaseStorage
-from harvest.util.helper import gen_data
+from harvest.storage.memory_budget import SpilledSeries
+from harvest.util.helper import aggregate_df, gen_data
 
 
 class TestBaseStorage(unittest.TestCase):
@@ -105,6 +111,264 @@ class TestBaseStorage(unittest.TestCase):
         loaded_data_2 = pd.concat([data.iloc[:25], data.iloc[75:]])
         assert_frame_equal(loaded_data_1, loaded_data_2)
 
+    def test_range_load(self):
+        for columnar in (False, True):
+            storage = BaseStorage(columnar=columnar)
+            data = gen_data("A", 50)
+            storage.store("A", Interval.MIN_1, data.copy(True))
+            start, end = data.index[10], data.index[19]
+
+            loaded_data = storage.load("A", Interval.MIN_1, start, end, fields=["close", "open"])
+            assert_frame_equal(loaded_data, data.loc[start:end, [("A", "close"), ("A", "open")]], check_freq=False)
+
+            close = storage.load("A", Interval.MIN_1, start, end, fields="close", as_numpy=True)
+            self.assertEqual(close.shape, (10,))
+            self.assertListEqual(list(close), list(data["A"]["close"].iloc[10:20]))
+
+            values = storage.load("A", Interval.MIN_1, start=end, fields=["high", "low"], as_numpy=True)
+            self.assertEqual(values.shape, (31, 2))
+            self.assertListEqual(list(values[:, 1]), list(data["A"]["low"].iloc[19:]))
+
+            last = storage.load("A", Interval.MIN_1, end=end, fields="close", as_numpy=True, limit=5)
+            self.assertListEqual(list(last), list(data["A"]["close"].iloc[15:20]))
+
+    def test_memory_budget(self):
+        # Room for about two series
+        for columnar, budget in ((False, 10000), (True, 40000)):
+            with tempfile.TemporaryDirectory() as spill_dir:
+                storage = BaseStorage(memory_budget=budget, spill_dir=spill_dir, columnar=columnar)
+                data = {symbol: gen_data(symbol, 100) for symbol in ("A", "B", "C", "D")}
+                for symbol, df in data.items():
+                    storage.store(symbol, Interval.MIN_1, df.copy(True))
+
+                self.assertLessEqual(storage.memory.used, budget)
+                self.assertIsInstance(storage.storage_price["A"][Interval.MIN_1], SpilledSeries)
+                self.assertNotIsInstance(storage.storage_price["D"][Interval.MIN_1], SpilledSeries)
+
+                for symbol, df in data.items():
+                    loaded_data = storage.load(symbol, Interval.MIN_1)
+                    assert_frame_equal(loaded_data, df[loaded_data.columns], check_freq=False)
+                self.assertNotIsInstance(storage.storage_price["D"][Interval.MIN_1], SpilledSeries)
+                self.assertLessEqual(storage.memory.used, budget)
+
+                # Files are deleted once their series is loaded back, and the rest by close()
+                spilled = [k for k, v in storage.storage_price.items() if isinstance(v[Interval.MIN_1], SpilledSeries)]
+                self.assertEqual(len(os.listdir(spill_dir)), len(spilled))
+                storage.close()
+                self.assertEqual(os.listdir(spill_dir), [])
+
+        # A temporary spill directory is removed by close()
+        storage = BaseStorage(memory_budget=10000)
+        for symbol in ("A", "B", "C", "D"):
+            storage.store(symbol, Interval.MIN_1, gen_data(symbol, 100))
+        self.assertTrue(os.path.isdir(storage.memory.spill_dir))
+        storage.close()
+        self.assertFalse(os.path.exists(storage.memory.spill_dir))
+
+    def test_memory_budget_concurrent(self):
+        storage = BaseStorage(memory_budget=10000)
+        data = {symbol: gen_data(symbol, 100) for symbol in ("A", "B", "C", "D")}
+        for symbol, df in data.items():
+            storage.store(symbol, Interval.MIN_1, df.copy(True))
+
+        # Series are spilled and restored by other threads while they are loaded
+        errors = []
+
+        def reader(symbol):
+            try:
+                for _ in range(50):
+                    loaded_data = storage.load(symbol, Interval.MIN_1)
+                    assert_frame_equal(loaded_data, data[symbol][loaded_data.columns], check_freq=False)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=reader, args=(symbol,)) for symbol in data]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        storage.close()
+        self.assertEqual(errors, [])
+
+    def test_compact_load(self):
+        for columnar in (False, True):
+            storage = BaseStorage(columnar=columnar, compact=True)
+            data = gen_data("A", 100)
+            data[("A", "volume")] = (data[("A", "volume")] * 1e6).round()
+            storage.store("A", Interval.MIN_1, data.copy(True))
+            storage.aggregate("A", Interval.MIN_1, Interval.MIN_5)
+
+            loaded_data = storage.load("A", Interval.MIN_1)
+            self.assertEqual(loaded_data[("A", "close")].dtype, np.float32)
+            self.assertEqual(loaded_data[("A", "volume")].dtype, np.uint64)
+            self.assertEqual(storage.load("A", Interval.MIN_5)[("A", "close")].dtype, np.float32)
+
+            upcast = storage.load("A", Interval.MIN_1, upcast=True)
+            self.assertTrue((upcast.dtypes == np.float64).all())
+            assert_frame_equal(upcast, data[upcast.columns], check_freq=False, rtol=1e-6)
+
+            close = storage.load("A", Interval.MIN_1, fields="close", as_numpy=True, upcast=True)
+            self.assertEqual(close.dtype, np.float64)
+
+    def test_load_panel(self):
+        for columnar in (False, True):
+            storage = BaseStorage(columnar=columnar)
+            data_a = gen_data("A", 50)
+            data_b = gen_data("B", 50).iloc[:40]
+            storage.store("A", Interval.MIN_1, data_a.iloc[:30].copy(True))
+            storage.store("B", Interval.MIN_1, data_b.copy(True))
+
+            panel = storage.load_panel(["A", "B", "C"], Interval.MIN_1)
+            self.assertEqual(len(panel), 40)
+            self.assertListEqual(list(panel["A"].iloc[:30]), list(data_a["A"]["close"].iloc[:30]))
+            self.assertTrue(panel["A"].iloc[30:].isna().all())
+            self.assertTrue(panel["C"].isna().all())
+
+            # The panel is updated when new data is stored
+            storage.store("A", Interval.MIN_1, data_a.iloc[30:].copy(True))
+            panel = storage.load_panel(["B", "A"], Interval.MIN_1, start=data_a.index[10])
+            self.assertEqual(len(panel), 40)
+            self.assertListEqual(list(panel["A"]), list(data_a["A"]["close"].iloc[10:]))
+            self.assertTrue(panel["B"].iloc[30:].isna().all())
+
+            values = storage.load_panel(["A", "B"], Interval.MIN_1, "open", end=data_a.index[4], as_numpy=True)
+            self.assertEqual(values.shape, (5, 2))
+            self.assertListEqual(list(values[:, 1]), list(data_b["B"]["open"].iloc[:5]))
+
+    def test_columnar_load(self):
+        storage = BaseStorage(columnar=True)
+        data = gen_data("A", 100)
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[:75])
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[25:])
+        loaded_data = storage.load("A", Interval.MIN_1)
+
+        assert_frame_equal(loaded_data, data[loaded_data.columns], check_freq=False)
+
+    def test_columnar_limit(self):
+        storage = BaseStorage(price_storage_size=30, columnar=True)
+        data = gen_data("A", 100)
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[:50])
+        for i in range(50, 100):
+            storage.store("A", Interval.MIN_1, data.copy(True).iloc[[i]])
+        loaded_data = storage.load("A", Interval.MIN_1)
+
+        self.assertEqual(len(loaded_data), 30)
+        assert_frame_equal(loaded_data, data.iloc[-30:][loaded_data.columns], check_freq=False)
+
+    def test_columnar_snapshot(self):
+        storage = BaseStorage(price_storage_size=30, columnar=True)
+        data = gen_data("A", 60)
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[:30])
+        loaded_data = storage.load("A", Interval.MIN_1)
+        expected = loaded_data.copy(True)
+
+        # Loads are not changed by the bars that are stored after them
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[30:])
+        assert_frame_equal(loaded_data, expected)
+
+    def test_columnar_overwrite(self):
+        storage = BaseStorage(columnar=True)
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True))
+        last = data.copy(True).iloc[[-1]]
+        last.loc[:, ("A", "close")] = 123.0
+        storage.store("A", Interval.MIN_1, last)
+        loaded_data = storage.load("A", Interval.MIN_1)
+
+        self.assertEqual(len(loaded_data), 50)
+        self.assertEqual(loaded_data["A"]["close"].iloc[-1], 123.0)
+
+    def test_incremental_aggregate(self):
+        for columnar in (False, True):
+            storage = BaseStorage(price_storage_limit=False, columnar=columnar)
+            data = gen_data("A", 100)
+            storage.store("A", Interval.MIN_1, data.copy(True).iloc[:40])
+            storage.aggregate("A", Interval.MIN_1, Interval.MIN_5)
+            for i in range(40, 100):
+                storage.store("A", Interval.MIN_1, data.copy(True).iloc[[i]])
+                storage.aggregate("A", Interval.MIN_1, Interval.MIN_5)
+            loaded_data = storage.load("A", Interval.MIN_5)
+            expected = aggregate_df(data, Interval.MIN_5)
+
+            assert_frame_equal(loaded_data, expected[loaded_data.columns], check_freq=False, check_names=False)
+
+    def test_misaligned_aggregate(self):
+        # Target bars from a broker need not start on the buckets of aggregate_df
+        for columnar in (False, True):
+            storage = BaseStorage(price_storage_limit=False, columnar=columnar)
+            data = gen_data("A", 100)
+            target = aggregate_df(data.iloc[:60], Interval.MIN_5)
+            target.index = target.index + dt.timedelta(minutes=2)
+            storage.store("A", Interval.MIN_1, data.copy(True))
+            storage.store("A", Interval.MIN_5, target)
+            storage.aggregate("A", Interval.MIN_1, Interval.MIN_5)
+
+            index = storage.load("A", Interval.MIN_5).index
+            self.assertTrue(index.is_monotonic_increasing)
+            self.assertTrue(index.is_unique)
+            self.assertEqual(index[-1], aggregate_df(data, Interval.MIN_5).index[-1])
+
+    def test_store_transaction(self):
+        storage = BaseStorage()
+        day = dt.datetime(2024, 1, 2, 15, 0, tzinfo=dt.timezone.utc)
+        storage.store_transaction(day, "N/A", "A", "buy", 100, 1.0)
+        storage.store_transaction(day + dt.timedelta(hours=1), "N/A", "A", "sell", 100, 1.1)
+        storage.store_transaction(day + dt.timedelta(days=1), "N/A", "A", "sell", 10, 1.1)
+        storage.store_transaction(day + dt.timedelta(days=1), "N/A", "@BTC", "buy", 1, 1.0)
+        storage.store_transaction(day + dt.timedelta(days=1), "N/A", "@BTC", "sell", 1, 1.0)
+
+        transactions = storage.load_transaction()
+        self.assertEqual(len(transactions), 5)
+        self.assertEqual(list(transactions["side"]), ["buy", "sell", "sell", "buy", "sell"])
+        self.assertEqual(len(storage.load_daytrade()), 1)
+        self.assertEqual(storage.count_daytrades(day), 1)
+        self.assertEqual(storage.count_daytrades(day + dt.timedelta(days=1)), 0)
+
+    def test_performance_data(self):
+        storage = BaseStorage(performance_storage_size=50)
+        start = dt.datetime(2024, 1, 2, 15, 0, tzinfo=dt.timezone.utc)
+        storage.init_performance_data(100.0, start)
+        for i in range(1, 24 * 60):
+            storage.add_performance_data(100.0 + i % 7, start + dt.timedelta(minutes=i))
+        for i in range(1, 400):
+            storage.add_performance_data(100.0 + i, start + dt.timedelta(days=i))
+
+        day = storage.load_performance("1DAY")
+        self.assertEqual(len(day), 2)
+        self.assertLessEqual(len(storage.load_performance("1MONTH")), 50)
+        self.assertLessEqual(len(storage.load_performance("1YEAR")), 50)
+        everything = storage.load_performance("ALL")
+        self.assertLessEqual(len(everything), 50)
+        self.assertTrue(everything.index.is_monotonic_increasing)
+        self.assertEqual(everything["equity"].iloc[-1], 499.0)
+
+    def test_market_calendar(self):
+        storage = BaseStorage()
+        start = dt.datetime(2024, 1, 1, 14, 30, tzinfo=dt.timezone.utc)
+        for i in range(10):
+            day = start + dt.timedelta(days=i)
+            is_open = day.weekday() < 5
+            storage.add_calendar_data(
+                {
+                    "is_open": is_open,
+                    "open_at": day if is_open else None,
+                    "close_at": day + dt.timedelta(hours=6, minutes=30) if is_open else None,
+                },
+                day.date(),
+            )
+
+        open_days = storage.load_open_days(5)
+        self.assertEqual([d for d, _ in open_days], [dt.date(2024, 1, d) for d in (4, 5, 8, 9, 10)])
+        self.assertEqual(open_days[0][1]["open_at"], start + dt.timedelta(days=3))
+        self.assertEqual(len(storage.load_calendar()), 10)
+
+        # Open days are final, closed days are re-checked while they are the current day
+        now = start + dt.timedelta(days=6)
+        self.assertFalse(storage.needs_calendar_data(dt.date(2024, 1, 2), now))
+        self.assertFalse(storage.needs_calendar_data(dt.date(2024, 1, 6), now))
+        self.assertTrue(storage.needs_calendar_data(dt.date(2024, 1, 7), now))
+        self.assertTrue(storage.needs_calendar_data(dt.date(2024, 1, 11), now))
+
     # def test_agg_load(self):
     #     storage = BaseStorage()
     #     data = gen_data("A", 100)
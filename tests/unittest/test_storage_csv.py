@@ -1,3 +1,4 @@
+import datetime as dt
 import pathlib
 import shutil
 import unittest
@@ -7,6 +8,7 @@ from pandas.testing import assert_frame_equal
 
 from harvest.enum import Interval
 from harvest.storage import CSVStorage
+from harvest.storage.series_stub import LazySeries
 from harvest.util.helper import gen_data
 
 
@@ -39,6 +41,81 @@ class TestCSVStorage(unittest.TestCase):
 
         assert_frame_equal(loaded_data, data)
 
+    def test_append_and_compact(self):
+        storage_dir = f"{self.storage_dir}/append"
+        storage1 = CSVStorage(storage_dir, compaction_interval=None)
+        data = gen_data("C", 50)
+        storage1.store("C", Interval.MIN_1, data.copy(True).iloc[:30])
+        storage1.store("C", Interval.MIN_1, data.copy(True).iloc[29:])
+        path = f"{storage_dir}/C@1MIN.csv"
+
+        # The overlapping row is appended again, and resolved when the file is loaded
+        self.assertEqual(len(pd.read_csv(path)), 51)
+        assert_frame_equal(CSVStorage(storage_dir, compaction_interval=None).load("C", Interval.MIN_1), data)
+
+        storage1.compact_files()
+        self.assertEqual(len(pd.read_csv(path)), 50)
+        assert_frame_equal(CSVStorage(storage_dir, compaction_interval=None).load("C", Interval.MIN_1), data)
+
+    def test_saved_history(self):
+        storage_dir = f"{self.storage_dir}/history"
+        storage1 = CSVStorage(storage_dir, compaction_interval=None)
+        day = dt.datetime(2024, 1, 2, 15, 0, tzinfo=dt.timezone.utc)
+        storage1.store_transaction(day, "N/A", "D", "buy", 100, 1.0)
+        storage1.store_transaction(day + dt.timedelta(hours=1), "N/A", "D", "sell", 100, 1.1)
+        storage1.init_performance_data(100.0, day)
+        storage1.add_performance_data(101.0, day + dt.timedelta(minutes=1))
+
+        storage2 = CSVStorage(storage_dir, compaction_interval=None)
+        self.assertEqual(len(storage2.load_transaction()), 2)
+        self.assertEqual(storage2.count_daytrades(day), 1)
+        self.assertEqual(list(storage2.load_performance("1DAY")["equity"]), [100.0, 101.0])
+
+    def test_lazy_load(self):
+        storage_dir = f"{self.storage_dir}/lazy"
+        storage1 = CSVStorage(storage_dir, compaction_interval=None)
+        data = {symbol: gen_data(symbol, 50) for symbol in ("E", "F", "G")}
+        for symbol, df in data.items():
+            storage1.store(symbol, Interval.MIN_1, df.copy(True))
+
+        storage2 = CSVStorage(storage_dir, compaction_interval=None, lazy=True)
+        self.assertIsInstance(storage2.storage_price["E"][Interval.MIN_1], LazySeries)
+        # Only the ends of the files are read, so rows are counted when a series is parsed
+        self.assertEqual(storage2.persisted[("E", Interval.MIN_1)], data["E"].index.asi8[-1])
+        self.assertNotIn(("E", Interval.MIN_1), storage2._file_rows)
+        with open(f"{storage_dir}/E@1MIN.csv", "rb") as f:
+            self.assertEqual(CSVStorage._last_line(f, block=16), CSVStorage._last_line(f))
+        assert_frame_equal(storage2.load("E", Interval.MIN_1), data["E"])
+        self.assertEqual(storage2._file_rows[("E", Interval.MIN_1)], 50)
+        self.assertNotIsInstance(storage2.storage_price["E"][Interval.MIN_1], LazySeries)
+        self.assertIsInstance(storage2.storage_price["F"][Interval.MIN_1], LazySeries)
+
+        storage3 = CSVStorage(storage_dir, compaction_interval=None, workers=4)
+        for symbol, df in data.items():
+            assert_frame_equal(storage3.load(symbol, Interval.MIN_1), df)
+
+    def test_write_behind(self):
+        storage_dir = f"{self.storage_dir}/write_behind"
+        storage1 = CSVStorage(storage_dir, compaction_interval=None, write_behind=True)
+        data = gen_data("H", 50)
+        for i in range(0, 50, 10):
+            storage1.store("H", Interval.MIN_1, data.copy(True).iloc[i : i + 10])
+        day = dt.datetime(2024, 1, 2, 15, 0, tzinfo=dt.timezone.utc)
+        storage1.store_transaction(day, "N/A", "H", "buy", 100, 1.0)
+        storage1.init_performance_data(100.0, day)
+
+        # Memory is updated right away, and the files once the writer has been flushed
+        assert_frame_equal(storage1.load("H", Interval.MIN_1), data)
+        storage1.flush()
+        storage2 = CSVStorage(storage_dir, compaction_interval=None)
+        assert_frame_equal(storage2.load("H", Interval.MIN_1), data)
+        self.assertEqual(len(storage2.load_transaction()), 1)
+        self.assertEqual(list(storage2.load_performance("1DAY")["equity"]), [100.0])
+
+        storage1.close()
+        with self.assertRaises(RuntimeError):
+            storage1.store("H", Interval.MIN_1, data.copy(True))
+
     @classmethod
     def tearDownClass(self):
         path = pathlib.Path(self.storage_dir)
@@ -1,10 +1,15 @@
+import datetime as dt
 import os
+import threading
 import unittest
+from unittest import mock
 
 from pandas.testing import assert_frame_equal
+from sqlalchemy import func, select
 
-from harvest.storage.database_storage import DBStorage
-from harvest.util.helper import gen_data
+from harvest.enum import Interval
+from harvest.storage.database_storage import DBStorage, Performance
+from harvest.util.helper import aggregate_df, gen_data
 
 
 class TestDBStorage(unittest.TestCase):
@@ -26,6 +31,232 @@ class TestDBStorage(unittest.TestCase):
         # sort_index to prevent order issues
         assert_frame_equal(loaded_data.sort_index(axis=1), data.sort_index(axis=1))
 
+    def test_smallest_interval(self):
+        storage = DBStorage("sqlite://")
+        data = gen_data("B", 50)
+        storage.store("B", "5MIN", aggregate_df(data, Interval.MIN_5))
+        storage.store("B", "1MIN", data.copy(True))
+
+        # Without an interval, the bars of the smallest stored interval are loaded
+        assert_frame_equal(storage.load("B").sort_index(axis=1), data.sort_index(axis=1), check_freq=False)
+        self.assertIsNone(storage.load("C"))
+        storage.close()
+
+    def test_upsert(self):
+        storage = DBStorage("sqlite:///foo.db", batch_size=7)
+        data = gen_data("B", 50)
+        storage.store("B", "1MIN", data.copy(True).iloc[:30])
+
+        # Stored bars are replaced, and new bars are added
+        data[("B", "close")] += 1
+        storage.store("B", "1MIN", data.copy(True).iloc[20:])
+        loaded_data = storage.load("B", "1MIN")
+        assert_frame_equal(loaded_data.iloc[20:].sort_index(axis=1), data.iloc[20:].sort_index(axis=1))
+        self.assertEqual(len(loaded_data), 50)
+
+    def test_range_load(self):
+        storage = DBStorage("sqlite:///foo.db")
+        data = gen_data("C", 50)
+        storage.store("C", "1MIN", data.copy(True))
+        storage.store("C", "5MIN", data.copy(True).iloc[:10])
+        start, end = data.index[10], data.index[19]
+
+        loaded_data = storage.load("C", "1MIN", start, end)
+        self.assertEqual(len(loaded_data), 10)
+        self.assertEqual(loaded_data.index[0], start)
+        self.assertEqual(len(storage.load("C", "5MIN")), 10)
+
+        close = storage.load("C", "1MIN", end=end, fields="close", as_numpy=True, limit=5)
+        self.assertListEqual(list(close), list(data["C"]["close"].iloc[15:20]))
+
+        # A range without data is empty, while a series without data is None
+        self.assertTrue(storage.load("C", "1MIN", start=data.index[-1] + dt.timedelta(days=1)).empty)
+        self.assertIsNone(storage.load("C", "1DAY"))
+
+    def test_aggregate(self):
+        storage = DBStorage("sqlite:///foo.db")
+        data = gen_data("D", 50)
+        storage.store("D", "1MIN", data.copy(True).iloc[:32])
+        storage.aggregate("D", "1MIN", "5MIN")
+        expected = aggregate_df(data.iloc[:32], Interval.MIN_5)
+        assert_frame_equal(storage.load("D", "5MIN").sort_index(axis=1), expected.sort_index(axis=1), check_freq=False)
+
+        # The partial last bucket is completed, and new buckets are added
+        storage.store("D", "1MIN", data.copy(True).iloc[32:])
+        storage.aggregate("D", "1MIN", "5MIN")
+        expected = aggregate_df(data, Interval.MIN_5)
+        assert_frame_equal(storage.load("D", "5MIN").sort_index(axis=1), expected.sort_index(axis=1), check_freq=False)
+
+    def test_cache(self):
+        storage = DBStorage("sqlite:///foo.db")
+        with storage.engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql("PRAGMA journal_mode").scalar(), "wal")
+
+        data = gen_data("E", 50)
+        storage.store("E", "1MIN", data.copy(True).iloc[:30])
+        loaded_data = storage.load("E", "1MIN")
+        self.assertEqual(len(storage.cache), 1)
+
+        # Cached loads are copies, and a store drops the cached loads of the series
+        loaded_data.iloc[0] = 0
+        self.assertEqual(len(storage.load("E", "1MIN")), 30)
+        assert_frame_equal(storage.load("E", "1MIN").sort_index(axis=1), data.iloc[:30].sort_index(axis=1))
+        storage.store("E", "1MIN", data.copy(True).iloc[30:])
+        self.assertEqual(len(storage.cache), 0)
+        self.assertEqual(len(storage.load("E", "1MIN")), 50)
+        storage.close()
+
+    def test_transactions(self):
+        storage = DBStorage("sqlite:///foo.db")
+        start = dt.datetime(2022, 1, 3, 15, 0, tzinfo=dt.timezone.utc)
+        storage.store_transaction(start, "algo", "F", "buy", 1, 10.0)
+        storage.store_transaction(start + dt.timedelta(hours=1), "algo", "F", "sell", 1, 11.0)
+        for i in range(10):
+            storage.add_performance_data(1000.0 + i, start + dt.timedelta(hours=12 * i))
+        storage.add_calendar_data({"is_open": True, "open_at": start, "close_at": start}, start.date())
+
+        # Queued rows are counted before they are written
+        self.assertEqual(storage.count_daytrades(start), 1)
+        storage.commit()
+        storage.close()
+
+        # A new storage has the state of the previous one
+        storage = DBStorage("sqlite:///foo.db")
+        storage.store_transaction(start + dt.timedelta(days=1), "algo", "F", "sell", 1, 11.0)
+        self.assertEqual(storage.count_daytrades(start), 1)
+        self.assertEqual(storage.count_daytrades(start + dt.timedelta(hours=2)), 0)
+        self.assertListEqual(list(storage.load_transaction()["side"]), ["buy", "sell", "sell"])
+        self.assertEqual(len(storage.load_daytrade()), 1)
+        self.assertEqual(len(storage.load_performance("1DAY")), 3)
+        # Long ranges keep the last point of each day
+        equity = [1000.0, 1002.0, 1004.0, 1006.0, 1008.0, 1009.0]
+        self.assertListEqual(list(storage.load_performance("ALL")["equity"]), equity)
+        self.assertTrue(storage.load_market_hours(start.date())["is_open"])
+        storage.close()
+
+    def test_failed_commit(self):
+        storage = DBStorage("sqlite://")
+        start = dt.datetime(2022, 2, 1, 15, 0, tzinfo=dt.timezone.utc)
+        storage.add_performance_data(2000.0, start)
+
+        def fail(*args):
+            # Rows can be queued while a commit is being written
+            storage.add_performance_data(2001.0, start + dt.timedelta(minutes=1))
+            raise RuntimeError("write failed")
+
+        with mock.patch.object(storage, "_replace", side_effect=fail):
+            with self.assertRaises(RuntimeError):
+                storage.commit()
+
+        # The rows of the failed commit are written by the next one
+        self.assertEqual(len(storage.pending_performance), 2)
+        storage.commit()
+        self.assertEqual(storage.pending_performance, {})
+        self.assertListEqual(list(storage.load_performance("1DAY")["equity"]), [2000.0, 2001.0])
+        storage.close()
+
+    def test_performance_bounds(self):
+        storage = DBStorage("sqlite://", performance_storage_size=50)
+        start = dt.datetime(2022, 4, 1, 0, 0, tzinfo=dt.timezone.utc)
+        for i in range(60 * 24):
+            storage.add_performance_data(float(i), start + dt.timedelta(hours=i))
+        storage.commit()
+
+        # Points older than a month are pruned to the last point of each day
+        with storage.engine.connect() as conn:
+            self.assertEqual(conn.execute(select(func.count()).select_from(Performance.__table__)).scalar(), 751)
+
+        # Loaded ranges are downsampled, keeping the lowest and newest points
+        for interval in ("1MONTH", "3MONTH", "ALL"):
+            equity = storage.load_performance(interval)["equity"]
+            self.assertLessEqual(len(equity), 50)
+            self.assertEqual(equity.iloc[-1], 1439.0)
+        self.assertEqual(storage.load_performance("ALL")["equity"].iloc[0], 23.0)
+        storage.close()
+
+    def test_queued_reads(self):
+        storage = DBStorage("sqlite:///queued.db", async_writes=True)
+        start = dt.datetime(2022, 3, 1, 15, 0, tzinfo=dt.timezone.utc)
+        storage.store_transaction(start, "algo", "F", "buy", 1, 10.0)
+        storage.store_transaction(start + dt.timedelta(hours=1), "algo", "F", "sell", 1, 11.0)
+        storage.add_performance_data(1000.0, start)
+        storage.flush()
+
+        writing, release = threading.Event(), threading.Event()
+        replace = storage._replace
+
+        def block(*args):
+            writing.set()
+            release.wait(10)
+            return replace(*args)
+
+        with mock.patch.object(storage, "_replace", side_effect=block):
+            try:
+                storage.store_transaction(start + dt.timedelta(hours=2), "algo", "F", "buy", 1, 10.0)
+                storage.add_performance_data(1001.0, start + dt.timedelta(hours=2))
+                storage.commit()
+                self.assertTrue(writing.wait(10))
+                storage.store_transaction(start + dt.timedelta(hours=3), "algo", "F", "sell", 1, 11.0)
+                storage.add_performance_data(1002.0, start + dt.timedelta(hours=3))
+
+                # Rows being written and rows still queued are read without waiting for the write
+                self.assertEqual(storage.count_daytrades(start), 2)
+                self.assertListEqual(list(storage.load_transaction()["side"]), ["buy", "sell", "buy", "sell"])
+                self.assertEqual(len(storage.load_daytrade()), 2)
+                self.assertListEqual(list(storage.load_performance("1DAY")["equity"]), [1000.0, 1001.0, 1002.0])
+            finally:
+                release.set()
+            storage.flush()
+
+        # Once written, every row is read exactly once
+        self.assertEqual(storage.count_daytrades(start), 2)
+        self.assertListEqual(list(storage.load_transaction()["side"]), ["buy", "sell", "buy", "sell"])
+        self.assertListEqual(list(storage.load_performance("ALL")["equity"]), [1002.0])
+        storage.close()
+
+    def test_async_writes(self):
+        storage = DBStorage("sqlite:///foo.db", async_writes=True)
+        data = gen_data("G", 50)
+        storage.store("G", "1MIN", data.copy(True).iloc[:30])
+        storage.store("G", "1MIN", data.copy(True).iloc[25:])
+        storage.aggregate("G", "1MIN", "5MIN")
+
+        # Queued bars are visible before they are written
+        assert_frame_equal(storage.load("G", "1MIN").sort_index(axis=1), data.sort_index(axis=1), check_freq=False)
+        storage.flush()
+        self.assertEqual(storage.unflushed, {})
+        storage.close()
+
+        storage = DBStorage("sqlite:///foo.db")
+        assert_frame_equal(storage.load("G", "1MIN").sort_index(axis=1), data.sort_index(axis=1))
+        expected = aggregate_df(data, Interval.MIN_5)
+        assert_frame_equal(storage.load("G", "5MIN").sort_index(axis=1), expected.sort_index(axis=1), check_freq=False)
+
+    def test_async_concurrent(self):
+        storage = DBStorage("sqlite:///foo.db", async_writes=True)
+        data = gen_data("H", 200)
+
+        # Bars stored by one thread are written while other threads load them
+        done = threading.Event()
+
+        def reader():
+            while not done.is_set():
+                storage.load("H", "1MIN")
+
+        threads = [threading.Thread(target=reader) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for i in range(0, 200, 2):
+            storage.store("H", "1MIN", data.iloc[i : i + 2])
+        done.set()
+        for thread in threads:
+            thread.join()
+        storage.close()
+
+        storage = DBStorage("sqlite:///foo.db")
+        assert_frame_equal(storage.load("H", "1MIN").sort_index(axis=1), data.sort_index(axis=1), check_freq=False)
+        storage.close()
+
     def test_reset(self):
         storage = DBStorage("sqlite:///foo.db")
         data = gen_data("A", 50)
@@ -37,8 +268,9 @@ class TestDBStorage(unittest.TestCase):
 
     @classmethod
     def tearDownClass(self):
-        if os.path.exists(self.db_file):
-            os.remove(self.db_file)
+        for file in [f"{name}{suffix}" for name in (self.db_file, "queued.db") for suffix in ("", "-wal", "-shm")]:
+            if os.path.exists(file):
+                os.remove(file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+import pathlib
+import shutil
+import unittest
+
+import numpy as np
+from pandas.testing import assert_frame_equal
+
+from harvest.enum import Interval
+from harvest.storage.mmap_storage import MmapStorage
+from harvest.util.helper import gen_data
+
+
+class TestMmapStorage(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.storage_dir = "test_mmap_data"
+
+    def test_store_and_load(self):
+        storage = MmapStorage(f"{self.storage_dir}/store", chunk_rows=16)
+        data = gen_data("A", 50)
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[:30])
+        storage.store("A", Interval.MIN_1, data.copy(True).iloc[29:])
+
+        columns = list(data["A"].columns)
+        assert_frame_equal(storage.load("A", Interval.MIN_1, fields=columns), data, check_freq=False)
+
+        # A single field is a read-only view of the file
+        close = storage.load("A", Interval.MIN_1, fields="close", as_numpy=True)
+        np.testing.assert_array_equal(close, data[("A", "close")].to_numpy())
+        self.assertFalse(close.flags.writeable)
+        self.assertFalse(close.flags.owndata)
+
+    def test_shared_reader(self):
+        storage_dir = f"{self.storage_dir}/shared"
+        writer = MmapStorage(storage_dir, chunk_rows=16)
+        data = gen_data("B", 50)
+        writer.store("B", Interval.MIN_1, data.copy(True).iloc[:20])
+
+        reader = MmapStorage(storage_dir, readonly=True)
+        self.assertEqual(len(reader.load("B", Interval.MIN_1)), 20)
+        with self.assertRaises(RuntimeError):
+            reader.store("B", Interval.MIN_1, data.copy(True))
+
+        # The reader sees bars and series written after it was opened
+        writer.store("B", Interval.MIN_1, data.copy(True).iloc[20:])
+        writer.store("C", Interval.MIN_1, gen_data("C", 10))
+        writer.flush()
+        columns = list(data["B"].columns)
+        assert_frame_equal(reader.load("B", Interval.MIN_1, fields=columns), data, check_freq=False)
+        self.assertEqual(len(reader.load("C", Interval.MIN_1)), 10)
+
+    @classmethod
+    def tearDownClass(self):
+        path = pathlib.Path(self.storage_dir)
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
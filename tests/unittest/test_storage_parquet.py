@@ -0,0 +1,110 @@
+import datetime as dt
+import os
+import pathlib
+import shutil
+import unittest
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from harvest.enum import Interval
+from harvest.storage.parquet_storage import ParquetStorage
+from harvest.storage.series_stub import LazySeries
+from harvest.util.helper import gen_data
+
+
+class TestParquetStorage(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.storage_dir = "test_parquet_data"
+
+    def test_create_storage(self):
+        storage = ParquetStorage(f"{self.storage_dir}/create")
+
+        self.assertEqual(storage.storage_price, {})
+
+    def test_saved_load(self):
+        storage_dir = f"{self.storage_dir}/saved"
+        storage1 = ParquetStorage(storage_dir)
+        data = gen_data("A", 50)
+        storage1.store("A", Interval.MIN_1, data.copy(True).iloc[:30])
+        storage1.store("A", Interval.MIN_1, data.copy(True).iloc[29:])
+
+        storage2 = ParquetStorage(storage_dir)
+        assert_frame_equal(storage2.load("A", Interval.MIN_1), data, check_freq=False)
+
+        storage3 = ParquetStorage(storage_dir, lazy=True)
+        self.assertIsInstance(storage3.storage_price["A"][Interval.MIN_1], LazySeries)
+        assert_frame_equal(storage3.load("A", Interval.MIN_1), data, check_freq=False)
+
+    def test_read(self):
+        storage_dir = f"{self.storage_dir}/read"
+        storage = ParquetStorage(storage_dir)
+        data = {symbol: gen_data(symbol, 50) for symbol in ("B", "C")}
+        for symbol, df in data.items():
+            storage.store(symbol, Interval.MIN_1, df.copy(True))
+
+        start, end = data["B"].index[10], data["B"].index[20]
+        panel = storage.read(["B", "C", "D"], Interval.MIN_1, start, end, fields=["close", "volume"])
+        self.assertEqual(list(panel.columns), [("B", "close"), ("B", "volume"), ("C", "close"), ("C", "volume")])
+        self.assertEqual(len(panel), 11)
+        self.assertEqual(list(panel[("C", "close")]), list(data["C"][("C", "close")].loc[start:end]))
+
+        assert_frame_equal(storage.open("B", "1MIN"), data["B"], check_freq=False)
+        self.assertTrue(storage.read(["E"], Interval.MIN_1).empty)
+
+    def test_saved_history(self):
+        storage_dir = f"{self.storage_dir}/history"
+        storage1 = ParquetStorage(storage_dir)
+        day = dt.datetime(2024, 1, 2, 15, 0, tzinfo=dt.timezone.utc)
+        storage1.store_transaction(day, "N/A", "D", "buy", 100, 1.0)
+        storage1.store_transaction(day + dt.timedelta(hours=1), "N/A", "D", "sell", 100, 1.1)
+        storage1.init_performance_data(100.0, day)
+        storage1.add_performance_data(101.0, day + dt.timedelta(minutes=1))
+        storage1.add_calendar_data(
+            {"is_open": True, "open_at": day - dt.timedelta(hours=0.5), "close_at": day + dt.timedelta(hours=6)},
+            day.date(),
+        )
+
+        storage2 = ParquetStorage(storage_dir)
+        self.assertEqual(len(storage2.load_transaction()), 2)
+        self.assertEqual(storage2.count_daytrades(day), 1)
+        self.assertEqual(list(storage2.load_performance("1DAY")["equity"]), [100.0, 101.0])
+        self.assertEqual(storage2.load_market_hours(day.date())["close_at"], day + dt.timedelta(hours=6))
+
+    def test_parts(self):
+        storage_dir = f"{self.storage_dir}/parts"
+        storage = ParquetStorage(storage_dir, max_parts=4)
+        data = gen_data("F", 10)
+        data.index = pd.date_range("2024-01-02 23:52", periods=10, freq="1min", tz="UTC", name="timestamp")
+        day_dir = f"{storage_dir}/prices/interval=1MIN/symbol=F/date=2024-01-02"
+
+        # Each store writes a part, and the parts are compacted once there are max_parts of them
+        for i in range(3):
+            storage.store("F", Interval.MIN_1, data.copy(True).iloc[[i]])
+        self.assertEqual(sorted(os.listdir(day_dir)), [f"part-00000{i}.parquet" for i in (1, 2, 3)])
+        storage.store("F", Interval.MIN_1, data.copy(True).iloc[[3]])
+        self.assertEqual(os.listdir(day_dir), ["data.parquet"])
+
+        # Later parts replace the bars of earlier files
+        data.loc[data.index[3], ("F", "close")] = 2.0
+        storage.store("F", Interval.MIN_1, data.copy(True).iloc[3:6])
+        assert_frame_equal(storage.open("F", Interval.MIN_1), data.iloc[:6], check_freq=False)
+        assert_frame_equal(ParquetStorage(storage_dir).load("F", Interval.MIN_1), data.iloc[:6], check_freq=False)
+
+        # Writing a newer date compacts the older ones
+        storage.store("F", Interval.MIN_1, data.copy(True).iloc[6:9])
+        self.assertEqual(os.listdir(day_dir), ["data.parquet"])
+        storage.store("F", Interval.MIN_1, data.copy(True).iloc[[9]])
+        storage.flush()
+        self.assertEqual(storage._parts, {})
+        assert_frame_equal(storage.open("F", Interval.MIN_1), data, check_freq=False)
+
+    @classmethod
+    def tearDownClass(self):
+        path = pathlib.Path(self.storage_dir)
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,6 +7,7 @@ from pandas.testing import assert_frame_equal
 
 from harvest.enum import Interval
 from harvest.storage import PickleStorage
+from harvest.storage.series_stub import LazySeries
 from harvest.util.helper import gen_data
 
 
@@ -47,6 +48,64 @@ class TestCSVStorage(unittest.TestCase):
         loaded_data = storage.open("A", Interval.MIN_1)
         assert_frame_equal(loaded_data, data)
 
+    def test_lazy_load(self):
+        storage_dir = f"{self.storage_dir}/lazy"
+        storage1 = PickleStorage(storage_dir)
+        data = {symbol: gen_data(symbol, 50) for symbol in ("E", "F", "G")}
+        for symbol, df in data.items():
+            storage1.store(symbol, Interval.MIN_1, df.copy(True))
+
+        storage2 = PickleStorage(storage_dir, lazy=True)
+        self.assertIsInstance(storage2.storage_price["E"][Interval.MIN_1], LazySeries)
+        assert_frame_equal(storage2.load("E", Interval.MIN_1), data["E"])
+        self.assertNotIsInstance(storage2.storage_price["E"][Interval.MIN_1], LazySeries)
+        self.assertIsInstance(storage2.storage_price["F"][Interval.MIN_1], LazySeries)
+
+        storage3 = PickleStorage(storage_dir, workers=4)
+        for symbol, df in data.items():
+            assert_frame_equal(storage3.load(symbol, Interval.MIN_1), df)
+
+    def test_write_behind(self):
+        storage_dir = f"{self.storage_dir}/write_behind"
+        storage1 = PickleStorage(storage_dir, write_behind=True, max_pending=1, backpressure="inline")
+        data = {symbol: gen_data(symbol, 50) for symbol in ("H", "I", "J")}
+        for symbol, df in data.items():
+            storage1.store(symbol, Interval.MIN_1, df.copy(True).iloc[:25])
+            storage1.store(symbol, Interval.MIN_1, df.copy(True).iloc[25:])
+        storage1.close()
+
+        storage2 = PickleStorage(storage_dir)
+        for symbol, df in data.items():
+            assert_frame_equal(storage2.load(symbol, Interval.MIN_1), df)
+
+    def test_segments(self):
+        storage_dir = f"{self.storage_dir}/segments"
+        storage1 = PickleStorage(storage_dir, max_chunks=4)
+        data = gen_data("K", 50)
+        for i in range(0, 50, 5):
+            storage1.store("K", Interval.MIN_1, data.copy(True).iloc[i : i + 5])
+
+        # Each store adds a chunk, and the newest chunks are merged once there are too many
+        segment = storage1.segments["K@1MIN"]
+        self.assertLessEqual(len(segment.chunks), 4)
+        assert_frame_equal(PickleStorage(storage_dir).load("K", Interval.MIN_1), data)
+
+        start, end = data.index[40], data.index[44]
+        assert_frame_equal(storage1.open("K", Interval.MIN_1, start, end), data.loc[start:end])
+        self.assertEqual(len(storage1.open("K", "1MIN")), 50)
+
+    def test_legacy_file(self):
+        storage_dir = f"{self.storage_dir}/legacy"
+        pathlib.Path(storage_dir).mkdir(parents=True)
+        data = gen_data("L", 50)
+        data.iloc[:40].to_pickle(f"{storage_dir}/L@1MIN.pickle")
+
+        storage1 = PickleStorage(storage_dir)
+        assert_frame_equal(storage1.open("L", Interval.MIN_1), data.iloc[:40])
+        storage1.store("L", Interval.MIN_1, data.copy(True).iloc[40:])
+        self.assertFalse(pathlib.Path(f"{storage_dir}/L@1MIN.pickle").exists())
+        assert_frame_equal(PickleStorage(storage_dir, lazy=True).load("L", Interval.MIN_1), data)
+
     @classmethod
     def tearDownClass(self):
         path = pathlib.Path(self.storage_dir)
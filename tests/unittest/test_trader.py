@@ -1,11 +1,11 @@
 import datetime as dt
 import unittest
 
-import pandas as pd
 from _util import create_trader_and_api, delete_save_files
 
 from harvest.broker.dummy import DummyDataBroker
-from harvest.enum import DataBrokerType, TradeBrokerType
+from harvest.enum import DataBrokerType, Interval, TradeBrokerType
+from harvest.storage import BaseStorage
 from harvest.trader import BrokerHub, PaperTrader
 
 
@@ -73,15 +73,48 @@ class TestLiveTrader(unittest.TestCase):
         with self.assertRaises(Exception):
             t.start("30MIN", ["5MIN", "1DAY"])
 
-    def _create_fake_calendar_df(self, open_today, close_today):
-        df = pd.DataFrame(
-            {
-                "is_open": [True] * 24,
-                "open_at": [open_today - dt.timedelta(days=24 - i) for i in range(24)],
-                "close_at": [close_today - dt.timedelta(days=24 - i) for i in range(24)],
-            }
-        )
-        return df
+    def test_storage_instance(self):
+        """A storage instance is used as it is, with the arguments it was created with."""
+        storage = BaseStorage(price_storage_size=10)
+        trader = BrokerHub(DataBrokerType.DUMMY, TradeBrokerType.PAPER, storage=storage)
+        trader.set_symbol("A")
+        trader._init_param_streamer_broker("1MIN", [])
+        self.assertIs(trader.storage, storage)
+        self.assertIs(storage.stats, trader.stats)
+
+    def test_storage_init(self):
+        """
+        Aggregations covered by the history of the base interval are built locally, and failed fetches are retried.
+        """
+        trader, dummy, _ = create_trader_and_api(DataBrokerType.DUMMY, TradeBrokerType.PAPER, "1MIN", ["A", "B"])
+        trader.backfill_backoff = 0
+        for sym in ("A", "B"):
+            trader.stats.watchlist_cfg[sym]["aggregations"] = [Interval.MIN_5, Interval.DAY_1]
+
+        fetch = dummy.fetch_price_history
+        calls = []
+
+        def flaky_fetch(symbol, interval, start=None, end=None):
+            calls.append((symbol, interval))
+            if calls.count((symbol, interval)) == 1 and symbol == "B":
+                raise Exception("Connection lost")
+            return fetch(symbol, interval, start, end)
+
+        dummy.fetch_price_history = flaky_fetch
+        trader._storage_init(True)
+
+        self.assertNotIn(("A", Interval.MIN_5), calls)
+        self.assertEqual(calls.count(("B", Interval.MIN_1)), 2)
+        self.assertEqual(calls.count(("B", Interval.DAY_1)), 2)
+        for sym in ("A", "B"):
+            for interval in (Interval.MIN_1, Interval.MIN_5, Interval.DAY_1):
+                self.assertFalse(trader.storage.load(sym, interval).empty)
+
+    def _add_fake_calendar(self, storage, open_today, close_today):
+        for i in range(24):
+            open_at = open_today - dt.timedelta(days=24 - i)
+            close_at = close_today - dt.timedelta(days=24 - i)
+            storage.add_calendar_data({"is_open": True, "open_at": open_at, "close_at": close_at}, open_at.date())
 
     def test_day_trade_detection_0(self):
         """
@@ -89,11 +122,10 @@ class TestLiveTrader(unittest.TestCase):
         """
         open_today = dt.datetime.now().replace(hour=9, minute=30, second=0, microsecond=0)
         close_today = dt.datetime.now().replace(hour=16, minute=0, second=0, microsecond=0)
-        df = self._create_fake_calendar_df(open_today, close_today)
 
         trader, dummy, paper = create_trader_and_api(DataBrokerType.DUMMY, TradeBrokerType.PAPER, "1MIN", ["A"])
         # Manually add transaction history of buying and selling shares on the same day
-        trader.storage.storage_calendar = df
+        self._add_fake_calendar(trader.storage, open_today, close_today)
         trader.storage.store_transaction(open_today, "N/A", "A", "buy", 100, 1.0)
         trader.storage.store_transaction(open_today, "N/A", "A", "sell", 100, 1.0)
 
@@ -109,11 +141,10 @@ class TestLiveTrader(unittest.TestCase):
         """
         open_today = dt.datetime.now().replace(hour=9, minute=30, second=0, microsecond=0)
         close_today = dt.datetime.now().replace(hour=16, minute=0, second=0, microsecond=0)
-        df = self._create_fake_calendar_df(open_today, close_today)
 
         trader, dummy, paper = create_trader_and_api(DataBrokerType.DUMMY, TradeBrokerType.PAPER, "1MIN", ["A"])
         # Manually add transaction history of buying and selling shares on the same day
-        trader.storage.storage_calendar = df
+        self._add_fake_calendar(trader.storage, open_today, close_today)
         trader.storage.store_transaction(open_today, "N/A", "A", "buy", 100, 1.0)
         trader.storage.store_transaction(open_today, "N/A", "A", "sell", 50, 1.0)
         trader.storage.store_transaction(open_today, "N/A", "A", "sell", 30, 1.0)
@@ -130,10 +161,9 @@ class TestLiveTrader(unittest.TestCase):
         """
         open_today = dt.datetime.now().replace(hour=9, minute=30, second=0, microsecond=0)
         close_today = dt.datetime.now().replace(hour=16, minute=0, second=0, microsecond=0)
-        df = self._create_fake_calendar_df(open_today, close_today)
 
         trader, dummy, paper = create_trader_and_api(DataBrokerType.DUMMY, TradeBrokerType.PAPER, "1MIN", ["A"])
-        trader.storage.storage_calendar = df
+        self._add_fake_calendar(trader.storage, open_today, close_today)
         trader.storage.store_transaction(open_today, "N/A", "A", "buy", 100, 1.0)
         trader.storage.store_transaction(open_today, "N/A", "A", "sell", 50, 1.0)
         trader.storage.store_transaction(open_today, "N/A", "A", "buy", 50, 1.0)
@@ -150,10 +180,9 @@ class TestLiveTrader(unittest.TestCase):
         """
         open_today = dt.datetime.now().replace(hour=9, minute=30, second=0, microsecond=0)
         close_today = dt.datetime.now().replace(hour=16, minute=0, second=0, microsecond=0)
-        df = self._create_fake_calendar_df(open_today, close_today)
 
         trader, dummy, paper = create_trader_and_api(DataBrokerType.DUMMY, TradeBrokerType.PAPER, "1MIN", ["A"])
-        trader.storage.storage_calendar = df
+        self._add_fake_calendar(trader.storage, open_today, close_today)
         trader.storage.store_transaction(open_today, "N/A", "A", "buy", 100, 1.0)
         trader.storage.store_transaction(open_today, "N/A", "A", "sell", 50, 1.0)
         trader.storage.store_transaction(open_today, "N/A", "A", "buy", 50, 1.0)